@@ -193,6 +193,27 @@ def test_logout(clear_data, user_reg):
     logout_status = resp.json()
     assert logout_status['is_success']
 
+def test_logout_cached_token(clear_data, user_reg):
+    '''
+    Test that a token that has been used (and so cached by the server) can no
+    longer be used once it is logged out
+
+    Parameters:
+        token (str) : the user logging out
+
+    Returns:
+        is_success (bool) : whether the user has successfully logged out
+    '''
+    token = user_reg.get('token')
+    resp = requests.get(config.url + 'users/all/v1', params={'token' : token})
+    assert resp.status_code == 200
+
+    resp = requests.post(config.url + 'auth/logout/v1', json={'token' : token})
+    assert resp.json()['is_success']
+
+    resp = requests.get(config.url + 'users/all/v1', params={'token' : token})
+    assert resp.status_code == 403
+
 
 def test_reset_code_invalid(clear_data, user_reg):
     '''
@@ -0,0 +1,66 @@
+import pytest
+import requests
+import json
+from http_tests.fixtures import clear_data, channel_set_up
+from src import config
+
+
+def test_batch(clear_data, channel_set_up):
+    '''
+    Test that a batch runs each operation in order and returns each result or error
+
+    Parameters:
+        operations (list of dict): each dict contains the route and the body of the request
+
+    Returns:
+        results (list of dict): each dict contains the result or the error of the operation
+    '''
+    token = channel_set_up[0].get('token')
+    channel_id = channel_set_up[3].get('channel_id')
+    data = {'operations' : [
+        {'route' : 'message/send/v2', 'body' : {'token' : token, 'channel_id' : channel_id, 'message' : 'hello'}},
+        {'route' : 'message/send/v2', 'body' : {'token' : token, 'channel_id' : channel_id, 'message' : 'a' * 1001}},
+        {'route' : 'message/react/v1', 'body' : {'token' : token, 'message_id' : 1, 'react_id' : 1}},
+        {'route' : 'clear/v1', 'body' : {}},
+    ]}
+    resp = requests.post(config.url + 'batch/v1', json=data)
+    assert resp.status_code == 200
+
+    results = resp.json()['results']
+    assert results[0] == {'result' : {'message_id' : 1}}
+    assert results[1]['error']['code'] == 400
+    assert results[2] == {'result' : {}}
+    assert results[3]['error']['code'] == 400
+
+def test_batch_bad_body(clear_data, channel_set_up):
+    '''
+    Test that an operation with a body that is not an object, or with arguments
+    of the wrong type, is given an error without stopping the operations
+    either side of it
+
+    Parameters:
+        operations (list of dict): each dict contains the route and the body of the request
+
+    Returns:
+        results (list of dict): each dict contains the result or the error of the operation
+    '''
+    token = channel_set_up[0].get('token')
+    channel_id = channel_set_up[3].get('channel_id')
+    data = {'operations' : [
+        {'route' : 'message/send/v2', 'body' : {'token' : token, 'channel_id' : channel_id, 'message' : 'hello'}},
+        {'route' : 'message/send/v2', 'body' : ['not', 'an', 'object']},
+        'not an operation',
+        {'route' : 'message/send/v2', 'body' : {'token' : token, 'channel_id' : str(channel_id), 'message' : 'hi'}},
+        {'route' : 'dm/create/v1', 'body' : {'token' : token, 'u_ids' : [True]}},
+        {'route' : 'message/send/v2', 'body' : {'token' : token, 'channel_id' : channel_id, 'message' : 'world'}},
+    ]}
+    resp = requests.post(config.url + 'batch/v1', json=data)
+    assert resp.status_code == 200
+
+    results = resp.json()['results']
+    assert results[0] == {'result' : {'message_id' : 1}}
+    assert results[1]['error']['code'] == 400
+    assert results[2]['error']['code'] == 400
+    assert results[3]['error']['code'] == 400
+    assert results[4]['error']['code'] == 400
+    assert results[5] == {'result' : {'message_id' : 2}}
@@ -0,0 +1,60 @@
+import pytest
+import requests
+from http_tests.http_helpers import message_send
+from http_tests.fixtures import clear_data, channel_set_up
+from src import config
+
+
+def read_until(lines, text):
+    for line in lines:
+        if text in line:
+            return line
+    return None
+
+def test_channel_events(clear_data, channel_set_up):
+    '''
+    Test that a channel's event stream, reached through the redirect on the
+    main port, sends the messages sent to the channel
+
+    Parameters:
+        token (str): the user that is listening
+        channel_id (int): the channel being listened to
+
+    Returns:
+        server-sent events
+    '''
+    token = channel_set_up[0].get('token')
+    channel_id = channel_set_up[3].get('channel_id')
+    resp = requests.get(config.url + 'channel/events/v1', params={'token' : token, 'channel_id' : channel_id},
+                        stream=True, timeout=10)
+    assert resp.status_code == 200
+    assert resp.headers['Content-Type'] == 'text/event-stream'
+    lines = resp.iter_lines(decode_unicode=True)
+    assert read_until(lines, 'connected') is not None
+
+    message_send(config.url + 'message/send/v2', token, channel_id, 'hello')
+    assert read_until(lines, 'event: new') is not None
+    assert 'hello' in read_until(lines, 'data: ')
+    resp.close()
+
+def test_stream_ends_on_leave(clear_data, channel_set_up):
+    '''
+    Test that a stream ends once its user leaves the channel
+    '''
+    token = channel_set_up[2].get('token')
+    channel_id = channel_set_up[3].get('channel_id')
+    resp = requests.get(config.url + 'channel/events/v1', params={'token' : token, 'channel_id' : channel_id},
+                        stream=True, timeout=10)
+    lines = resp.iter_lines(decode_unicode=True)
+    assert read_until(lines, 'connected') is not None
+
+    requests.post(config.url + 'channel/leave/v1', json={'token' : token, 'channel_id' : channel_id})
+    assert read_until(lines, 'event: ') is None
+
+def test_not_member(clear_data, channel_set_up):
+    '''
+    Test that a user who is not a member of the channel cannot listen to it
+    '''
+    resp = requests.get(config.url + 'channel/events/v1', params={'token' : channel_set_up[2].get('token'),
+                        'channel_id' : channel_set_up[4].get('channel_id')}, timeout=10)
+    assert resp.status_code == 403
@@ -0,0 +1,73 @@
+import pytest
+import requests
+import threading
+import time
+from urllib.parse import urlsplit
+from http_tests.http_helpers import channel_invite
+from http_tests.fixtures import clear_data, channel_set_up
+from src import config
+
+# Long polls are served on config.port + 1 (see src/longpoll.py)
+def longpoll_url():
+    url = urlsplit(config.url)
+    return f"{url.scheme}://{url.hostname}:{int(config.port) + 1}/notifications/get/v1"
+
+def get_marker(token):
+    resp = requests.get(config.url + 'notifications/get/v1', params={'token' : token})
+    return resp.json()['marker']
+
+
+def test_woken_by_notification(clear_data, channel_set_up):
+    '''
+    Test that a parked long poll returns as soon as the user is notified
+
+    Parameters:
+        token (str): the user that is polling
+        marker (int): the marker from the user's last notifications/get
+        timeout (float): the most seconds to wait
+
+    Returns:
+        notifications (list of dict) and marker (int), as notifications/get
+    '''
+    token = channel_set_up[1].get('token')
+    marker = get_marker(token)
+
+    def invite():
+        time.sleep(0.2)
+        channel_invite(config.url + 'channel/invite/v2', channel_set_up[0].get('token'),
+                       channel_set_up[4].get('channel_id'), channel_set_up[1].get('auth_user_id'))
+    inviter = threading.Thread(target=invite)
+    inviter.start()
+
+    start = time.time()
+    resp = requests.get(longpoll_url(), params={'token' : token, 'marker' : marker, 'timeout' : 10})
+    inviter.join()
+    assert resp.status_code == 200
+    assert time.time() - start < 5
+    assert resp.json()['marker'] == marker + 1
+
+def test_timeout(clear_data, channel_set_up):
+    '''
+    Test that a long poll with nothing new returns the same marker after the timeout
+    '''
+    token = channel_set_up[1].get('token')
+    marker = get_marker(token)
+    resp = requests.get(longpoll_url(), params={'token' : token, 'marker' : marker, 'timeout' : 0.2})
+    assert resp.status_code == 200
+    assert resp.json()['marker'] == marker
+
+def test_invalid_timeout(clear_data, channel_set_up):
+    '''
+    Test that a timeout that is not a finite number of seconds is rejected
+    '''
+    token = channel_set_up[1].get('token')
+    for timeout in ('nan', 'inf', '-inf', 'soon'):
+        resp = requests.get(longpoll_url(), params={'token' : token, 'marker' : 0, 'timeout' : timeout})
+        assert resp.status_code == 400
+
+def test_invalid_token(clear_data):
+    '''
+    Test that a long poll with an invalid token is rejected
+    '''
+    resp = requests.get(longpoll_url(), params={'token' : 'invalid', 'marker' : 0, 'timeout' : 0.2})
+    assert resp.status_code == 403
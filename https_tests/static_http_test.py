@@ -0,0 +1,45 @@
+import os
+import pytest
+import requests
+from src import config
+
+# Assumes the server was started from the same directory as the tests, so
+# they share static/
+
+@pytest.fixture
+def avatar():
+    os.makedirs('static/avatars', exist_ok=True)
+    path = 'static/avatars/static_http_test.jpg'
+    with open(path, 'wb') as file:
+        file.write(b'0123456789' * 10)
+    yield 'static/avatars/static_http_test.jpg'
+    os.remove(path)
+
+def test_static_file(avatar):
+    '''
+    Test that a static file is served with a content ETag and long cache headers,
+    and that asking again with the ETag returns 304
+    '''
+    resp = requests.get(config.url + avatar)
+    assert resp.status_code == 200
+    assert resp.content == b'0123456789' * 10
+    assert 'max-age=31536000' in resp.headers['Cache-Control']
+    etag = resp.headers['ETag']
+
+    resp = requests.get(config.url + avatar, headers={'If-None-Match' : etag})
+    assert resp.status_code == 304
+
+def test_static_range(avatar):
+    '''
+    Test that part of a static file can be asked for
+    '''
+    resp = requests.get(config.url + avatar, headers={'Range' : 'bytes=10-19'})
+    assert resp.status_code == 206
+    assert resp.content == b'0123456789'
+
+def test_static_missing():
+    '''
+    Test that files outside static/ or that do not exist are not found
+    '''
+    assert requests.get(config.url + 'static/avatars/missing.jpg').status_code == 404
+    assert requests.get(config.url + 'static/../src/server.py').status_code == 404
@@ -1,6 +1,15 @@
+import threading
 from src.data import getData
 from src.error import AccessError, InputError
-from src.helper import check_valid_info, check_members, add_to_channel_member_list,  join_channel, find_user_id
+from src.sessions import find_user_id, end_user_sessions
+from src.persistence import STATE_LOCK, flush
+from src.registry import get_user, get_channel, get_dm, valid_user, is_dreams_owner, dreams_owner_count, permissions_changed
+from src.registry import update_email, update_handle, members_changed
+from src.search_index import message_changed
+from src.versions import bump_version, bump_message_version
+from src.users import directory_changed
+from src.message_index import get_message
+from src.user_index import sent_message_ids, member_channel_ids, owned_channel_ids, member_dm_ids
 
 def admin_user_remove_v1(token, u_id):
     """
@@ -21,17 +30,14 @@ def admin_user_remove_v1(token, u_id):
     Return Value:
         None
     """
-    data = getData()
-    channels_in = True
-    dms_in = True
     # Find the auth_user_id requesting the permission change
     auth_user_id = find_user_id(token)
 
     auth_owner_valid = False
 
     #check that auth_user_id and channel_id exist
-    uid_valid = check_valid_info(data['users'], u_id)
-    auth_user_id_valid = check_valid_info(data['users'], auth_user_id)
+    uid_valid = valid_user(u_id)
+    auth_user_id_valid = valid_user(auth_user_id)
     if not auth_user_id_valid:
         raise AccessError(description = 'Invalid token')
 
@@ -40,17 +46,10 @@ def admin_user_remove_v1(token, u_id):
         raise InputError("User and/or uid does not exist")
 
     #check that auth_user_id is an owner
-    for users in data['users']:
-        if users.get('auth_user_id') is auth_user_id:
-            if users.get('global_permissions') == 1:
-                auth_owner_valid = True
+    auth_owner_valid = is_dreams_owner(auth_user_id)
 
     #input error is there is only one owner
-    count = 0
-    for users in data['users']:
-        if users.get('global_permissions') == 1:
-            count += 1
-    if count == 1 and u_id == auth_user_id:
+    if dreams_owner_count() == 1 and u_id == auth_user_id:
         raise InputError(description ="Cannot remove owner. There is only one owner")
 
     #access error if u_id is not an owner
@@ -58,43 +57,106 @@ def admin_user_remove_v1(token, u_id):
         raise AccessError(description = "auth_user_id is not an owner")
 
     #remove user
-    for users in data['users']:
-        if users.get('auth_user_id') == u_id:
-            users['name_first'] = 'Removed '
-            users['name_last'] = 'User'
-            users['email'] = ''
-            users['handle_str'] = ''
-            users['profile_img_str'] = ''
+    user = get_user(u_id)
+    update_email(u_id, user.get('email'), '')
+    update_handle(u_id, user.get('handle_str'), '')
+    user['name_first'] = 'Removed '
+    user['name_last'] = 'User'
+    user['email'] = ''
+    user['handle_str'] = ''
+    user['profile_img_str'] = ''
+    # The removed user's tokens can no longer be used
+    end_user_sessions(u_id)
+    bump_version('users')
+    directory_changed(u_id)
+    # Only the channels and dms the user is in need to be changed
+    for channel_id in sorted(member_channel_ids(u_id) | owned_channel_ids(u_id)):
+        channel = get_channel(channel_id)
+        channel['owner_members'] = [owner for owner in channel.get('owner_members', []) if owner.get('u_id') != u_id]
+        channel['all_members'] = [member for member in channel.get('all_members', []) if member.get('u_id') != u_id]
+        members_changed('channel', channel_id)
+        bump_version('channel', channel_id)
+
+    for dm_id in sorted(member_dm_ids(u_id)):
+        dm = get_dm(dm_id)
+        dm['all_members'] = [member for member in dm.get('all_members', []) if member.get('u_id') != u_id]
+        members_changed('dm', dm_id)
+        bump_version('dm', dm_id)
+
     #"replace the messages as 'removed owner'"
-    if data.get('messages'):
-        for message in data['messages']:
-            if message.get('sender') == u_id:
-                message['message'] = "Removed User"
-
-    # Check if the user is in dm and channel
-
-    if data['users'][u_id -1].get('channels_in') == None:
-        channels_in = False
-
-    if data['users'][u_id - 1].get('dms_in') == None:
-        dms_in = False
-    if channels_in:
-        for channel in data['channels']:
-            for owner in channel.get('owner_members'):
-                if owner.get('u_id') == u_id:
-                    channel['owner_members'].remove(owner)
-            for member in channel.get('all_members'):
-                if member.get('u_id') == u_id:
-                    channel['all_members'].remove(member)
-
-    if dms_in:
-        for dm in data['dms']:
-            for member in dm.get('all_members'):
-                if member.get('u_id')== u_id:
-                    dm['all_members'].remove(member)
+    # The first REMOVAL_CHUNK messages are replaced now and the rest in the background
+    if not remove_messages(u_id, REMOVAL_CHUNK):
+        start_removals()
 
     return {} 
 
+# A removed user's messages are replaced REMOVAL_CHUNK at a time, so removing
+# a user that has sent a lot of messages does not hold the state lock for long.
+# How far through each user's messages the replacing has got is kept in
+# data['removals'] keyed by their u_id as a string, so it carries on from
+# there if the server is restarted.
+
+REMOVAL_CHUNK = 500
+
+_removals = {
+    'thread' : None,
+}
+
+def remove_messages(u_id, limit):
+    """
+    Replaces up to limit more of a removed user's messages with 'Removed User'
+
+    Arguments:
+        u_id (int) - the removed user's u_id
+        limit (int) - the most messages to replace
+
+    Return Value:
+        True if all of the user's messages have now been replaced
+    """
+    data = getData()
+    if data.get('removals') == None:
+        data['removals'] = {}
+    removals = data['removals']
+    position = removals.get(str(u_id), 0)
+    message_ids = sent_message_ids(u_id)
+    end = min(position + limit, len(message_ids))
+    for message_id in message_ids[position:end]:
+        message = get_message(message_id)
+        message['message'] = "Removed User"
+        message_changed(message)
+        bump_message_version(message)
+
+    if end >= len(message_ids):
+        removals.pop(str(u_id), None)
+        return True
+    removals[str(u_id)] = end
+    return False
+
+def _run_removals():
+    while True:
+        with STATE_LOCK:
+            removals = getData().get('removals')
+            if not removals:
+                _removals['thread'] = None
+                return
+            remove_messages(int(next(iter(removals))), REMOVAL_CHUNK)
+            flush()
+
+def start_removals():
+    """
+    Starts replacing the rest of the messages of removed users in the
+    background, a chunk at a time. Does nothing if there are none left or
+    it has already been started.
+
+    Return Value:
+        None
+    """
+    with STATE_LOCK:
+        if _removals['thread'] is not None or not getData().get('removals'):
+            return
+        _removals['thread'] = threading.Thread(target=_run_removals, daemon=True)
+        _removals['thread'].start()
+
 def admin_userpermissions_change_v1(token, u_id, permission_id):
     """
     Given a user by their u_id, change their permissions to the one input by permission_id
@@ -112,8 +174,6 @@ def admin_userpermissions_change_v1(token, u_id, permission_id):
     Return Value:
         None
     """
-    data = getData()
-
     auth_valid = False
     user_valid = False
     dream_user = False
@@ -123,8 +183,8 @@ def admin_userpermissions_change_v1(token, u_id, permission_id):
 
     # Confirm that the token and u_id are valid users
     # Raise input error if they are not valid users
-    auth_valid = check_valid_info(data['users'], auth_user_id)
-    user_valid = check_valid_info(data['users'], u_id)
+    auth_valid = valid_user(auth_user_id)
+    user_valid = valid_user(u_id)
 
     if not auth_valid or not user_valid:
         raise InputError(description ='Token or user invalid. Cannot change permissions')
@@ -133,11 +193,8 @@ def admin_userpermissions_change_v1(token, u_id, permission_id):
     # Check that the token has the permissions required to change the permissions
     # Check if the user is a **Dreams** Owner
     # Count how many **Dreams** Owners there are
-    for users in data['users']:
-        if users.get('auth_user_id') is auth_user_id:
-            if users.get('global_permissions') == 1:
-                dream_user = True
-                owner_count += 1
+    dream_user = is_dreams_owner(auth_user_id)
+    owner_count = dreams_owner_count()
 
     # If 1 and 2 - global permissions 
     # Check that there is at least 1 dream owner if the owner wants to change to be just a member
@@ -148,17 +205,15 @@ def admin_userpermissions_change_v1(token, u_id, permission_id):
         # If the permission id is none of the above, raise an InputError 
         raise InputError(description = 'Permission id is not valid, cannot change permission')
     
-    for user in data['users']:
-        # Find the user we want to change permission for and change their global permissions
-        if user.get('auth_user_id') is u_id:
-            if owner_count == 1 and u_id is auth_user_id:
-                raise InputError(description = 'Cannot change permissions, there is only one global owner')
-            #print(user.get('global_permissions'))
-            #print(permission_id)
-            if user.get('global_permissions') is permission_id:
-                raise InputError(description = 'Permission Id already set, unable to change')
-            user['global_permissions'] = permission_id
-        
+    # Find the user we want to change permission for and change their global permissions
+    user = get_user(u_id)
+    if owner_count == 1 and u_id is auth_user_id:
+        raise InputError(description = 'Cannot change permissions, there is only one global owner')
+    if user.get('global_permissions') is permission_id:
+        raise InputError(description = 'Permission Id already set, unable to change')
+    user['global_permissions'] = permission_id
+    permissions_changed(u_id)
+    end_user_sessions(u_id)
+
     return {
     }
-s
\ No newline at end of file
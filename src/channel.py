@@ -1,7 +1,14 @@
 from src.data import getData
 from src.error import AccessError, InputError
-from src.helper import check_valid_info, check_members, add_to_channel_member_list,  join_channel, find_user_id
+from src.helper import add_to_channel_member_list,  join_channel
+from src.sessions import find_user_id
 from src.helper import get_timestamp
+from src.message_index import conversation_message_ids, get_message, message_page
+from src.registry import get_user, get_channel, valid_user, valid_channel, is_dreams_owner
+from src.registry import is_channel_member, is_channel_owner, members_changed
+from src.notifications import notify
+from src.versions import bump_version
+from src.photos import with_thumbnails
 
 def channel_invite_v2(token, channel_id, u_id):
     """
@@ -37,8 +44,8 @@ def channel_invite_v2(token, channel_id, u_id):
     # Only run code if there is information in data
     # Checks both u_id and auth_user_id are existing users
     # Check the channel id exists
-    user_valid = check_valid_info(data['users'], u_id)
-    auth_user_valid = check_valid_info(data['users'], auth_user_id)
+    user_valid = valid_user(u_id)
+    auth_user_valid = valid_user(auth_user_id)
 
     # If user id not found, raise exception
     if user_valid == False:
@@ -47,32 +54,27 @@ def channel_invite_v2(token, channel_id, u_id):
     if auth_user_valid == False:
         raise InputError(description= 'User ID does not exist')
 
-    channel_valid = check_valid_info(data['channels'], channel_id)
+    channel_valid = valid_channel(channel_id)
     # If channel id not found, raise exception
     if channel_valid == False:
         raise InputError(description= "Channel ID does not exist")
         
     # Check that the user wanting to add u_id is a member of the channel
-    auth_is_user = check_members(data['channels'], auth_user_id)
+    auth_is_user = is_channel_member(channel_id, auth_user_id)
     # If yes, then append the user as a channel member
     if auth_is_user:
         add_to_channel_member_list(u_id, channel_id)
+        members_changed('channel', channel_id)
+        bump_version('channel', channel_id)
     # If they are not a member, raise AccessError
     else: 
         raise AccessError(description= "You are not a member of this channel. You do not have permission to add users to this channel")
 
     #THE FOLLOWING CODE IS TO SUPPORT NOTIFICATIONS_GET FUNCTION  
-    if data.get("added_info") == None:
-        data["added_info"] = { }
-    
-    if data["added_info"].get("channels") == None:
-        data["added_info"]["channels"] = []
-    
-    info_dict = {"u_id": u_id,
-                 "channel_id" : channel_id,
-                 "adder" : data["users"][auth_user_id - 1]["handle_str"]
-                }
-    data["added_info"]["channels"].append(info_dict)
+    adder = data["users"][auth_user_id - 1]["handle_str"]
+    channel = get_channel(channel_id)
+    if u_id != channel.get('creator'):
+        notify(u_id, channel_id, -1, f"{adder} added you to {channel['name']}")
        
     return {
     }      
@@ -95,6 +97,8 @@ def channel_details_v2(token, channel_id):
             int: is public, 
             list: owner members 
             list: all members
+        Each member also has the url of a small thumbnail of their photo in
+        profile_img_thumbnail_url.
     """
 
     data = getData()
@@ -120,18 +124,15 @@ def channel_details_v2(token, channel_id):
 
     # Ensure that channel_id is an int if passed through a get request
     channel_id = int(channel_id)
-    channel_valid = check_valid_info(data['channels'], channel_id)
+    channel_valid = valid_channel(channel_id)
 
     if channel_valid == False:
         raise InputError(description = 'Channel ID is not a valid channel')   
 
 
     #check if user is a member of the channel
-    memb_found = False 
-    for memb in data["channels"][channel_id - 1]['all_members']:
-        if memb["u_id"] == auth_user_id:
-            memb_found = True
-            
+    memb_found = is_channel_member(channel_id, auth_user_id)
+
     if memb_found == False:
         raise AccessError(description = 'User is not a member of channel with this channel id')     
      
@@ -146,11 +147,11 @@ def channel_details_v2(token, channel_id):
     return {   
                 'name': name,
                 'is_public': privacy_status,
-                'owner_members': owner_list,
-                'all_members' : member_list
+                'owner_members': with_thumbnails(owner_list),
+                'all_members' : with_thumbnails(member_list)
            }          
 
-def channel_messages_v2(token, channel_id, start):
+def channel_messages_v2(token, channel_id, start, cursor=None):
     """
     Given a Channel with ID channel_id that the authorised user is part of,
     return up to 50 messages between index "start" and "start + 50".
@@ -158,21 +159,27 @@ def channel_messages_v2(token, channel_id, start):
     This function returns a new index "end" which is the value of "start + 50", or,
     if this function has returned the least recent messages in the channel,
     returns -1 in "end" to indicate there are no more messages to load after this return.
+    If a cursor is given instead (use '' for the most recent messages), the
+    page is found from the cursor and "next_cursor" is returned instead of
+    "start" and "end", which is None once there are no more messages to load.
 
     Arguments:
         token (str) - the user's token
         channel_id (int) - the channel's id
         start (int) - the starting index
+        cursor (str) - the next_cursor from the previous page
     
     Exceptions:
         InputError - Channel ID is not a valid channel
         InputError - start is greater than the total number of messages in the channel
+        InputError - cursor is not a cursor for this channel
         AccessError - Authorised user is not a member of channel with channel_id
     
     Return Value:
         messages (dict) - consists of a string: message_id, u_id, message, time_created
         start (int) - the starting index
         end (int) - the last index
+        next_cursor (str) - the cursor of the next page, if a cursor was given
     """
     data = getData()
     # Check if inputs are valid
@@ -188,7 +195,7 @@ def channel_messages_v2(token, channel_id, start):
     # Get auth_user_id from the token
     auth_user_id = find_user_id(token)
     # Check if user is a valid token
-    user_valid = check_valid_info(data['users'], auth_user_id)
+    user_valid = valid_user(auth_user_id)
     # If the auth_user_id is not found, token invalid
     if auth_user_id == False or user_valid == False:
         raise AccessError(description= 'Token invalid')
@@ -198,10 +205,11 @@ def channel_messages_v2(token, channel_id, start):
         raise InputError(description= 'Invalid input')
 
     channel_id = int(channel_id)
-    start = int(start)
+    if cursor == None:
+        start = int(start)
 
-    channel_valid = check_valid_info(data['channels'], channel_id)
-    is_member = check_members(data['channels'], auth_user_id)
+    channel_valid = valid_channel(channel_id)
+    is_member = is_channel_member(channel_id, auth_user_id)
     # Raise InputError if Id does not exist
     if channel_valid == False:
         raise InputError(description= 'User or channel ID does not exist')
@@ -214,51 +222,41 @@ def channel_messages_v2(token, channel_id, start):
     if data.get('messages') == None:
         data['messages'] = []
 
-    # Get the length of the messages in the channel
-    length = 0
-    all_channel_messages = []
-    # Get all the messages under the channel id
-    if len(data['messages']) > 0:
-        for msg in data['messages']:
-            if msg.get('channel_id') == channel_id:
-                all_channel_messages.append(msg)
-            length = len(all_channel_messages)
-
-    if length < start:
-        raise InputError(description= 'Start is greater than the total messages')
-
-    j = 0
-    if length < 50: # if messages is less than 50
-        while j < length: 
-            message_dict = {
-                'message_id' : all_channel_messages[j].get('message_id'), 
-                'u_id' : all_channel_messages[j].get('sender'),
-                'message' : all_channel_messages[j].get('message'),
-                'time_created' :  all_channel_messages[j].get('time_created'),
-                'reacts' : all_channel_messages[j].get('reacts'),
-                'is_pinned' : all_channel_messages[j].get('is_pinned')
-            }
-            
-            message_list.append(message_dict)
-            j += 1
-              
-    else:    
-        i = start
-        while i < (start + 50): # for cases with greater than 50 messages
-            message_dict = {
-                'message_id' : all_channel_messages[i].get('message_id'), 
-                'u_id' : all_channel_messages[i].get('sender'),
-                'message' : all_channel_messages[i].get('message'),
-                'time_created' :  all_channel_messages[i].get('time_created'),
-                'reacts' : all_channel_messages[i].get('reacts'),
-                'is_pinned' : all_channel_messages[i].get('is_pinned')
-            }
-            
-            message_list.append(message_dict)
-            i += 1
+    if cursor != None:
+        # The page comes back most recent first
+        page_ids, next_cursor = message_page('channels', channel_id, cursor)
+        page_ids.reverse()
+    else:
+        # Get the ids of all the messages under the channel id from the channel's
+        # message index instead of going through every message in data
+        all_channel_ids = conversation_message_ids('channels', channel_id)
+        length = len(all_channel_ids)
+
+        if length < start:
+            raise InputError(description= 'Start is greater than the total messages')
+
+        if length < 50: # if messages is less than 50
+            page_ids = all_channel_ids
+        else: # for cases with greater than 50 messages
+            page_ids = all_channel_ids[start:start + 50]
             end = start + 50
+
+    for message_id in page_ids:
+        msg = get_message(message_id)
+        message_dict = {
+            'message_id' : msg.get('message_id'), 
+            'u_id' : msg.get('sender'),
+            'message' : msg.get('message'),
+            'time_created' :  msg.get('time_created'),
+            'reacts' : msg.get('reacts'),
+            'is_pinned' : msg.get('is_pinned')
+        }
+        
+        message_list.append(message_dict)
     
     message_list.reverse()
+    if cursor != None:
+        return {'messages' : message_list, 'next_cursor' : next_cursor}
     return {'messages' : message_list, 'start' : start, 'end' : end}
 
 def channel_leave_v1(token, channel_id):
@@ -290,7 +288,7 @@ def channel_leave_v1(token, channel_id):
     member_valid = False
 
     #check that auth_user_id and channel_id exist
-    channel_valid = check_valid_info(data['channels'], channel_id)
+    channel_valid = valid_channel(channel_id)
 
     #if channel_id is invalid
     if channel_valid == False:
@@ -299,9 +297,7 @@ def channel_leave_v1(token, channel_id):
     members_list = data['channels'][channel_id - 1]['all_members']
     owners_list = data['channels'][channel_id-1]['owner_members']
     #check that auth_user_id is a member of the channel
-    for members in members_list:
-        if members.get('u_id') is auth_user_id:
-            member_valid = True
+    member_valid = is_channel_member(channel_id, auth_user_id)
     
     if not member_valid:
         raise AccessError(description= "User is not a member")
@@ -317,6 +313,8 @@ def channel_leave_v1(token, channel_id):
         if owner.get('u_id') == auth_user_id:
             del owners_list[j]
         j += 0
+    members_changed('channel', channel_id)
+    bump_version('channel', channel_id)
 
     if len(data['channels'][channel_id - 1]['all_members']) == 0: 
         data["channels"][channel_id -1]["channel_id"] = "This channel has been removed"
@@ -354,14 +352,13 @@ def channel_join_v2(token, channel_id):
     auth_user_id = find_user_id(token)
 
     #Check if Dreams owner
-    if data['users'][auth_user_id - 1].get('global_permissions') == 1:
-        dreams_owner = True
+    dreams_owner = is_dreams_owner(auth_user_id)
 
     # Only check data if dictionary had information stored
     # Check that auth_user_id and channel_id exist
     if bool(data['channels']):
-        user_valid = check_valid_info(data['users'], auth_user_id)
-        channel_valid = check_valid_info(data['channels'], channel_id)
+        user_valid = valid_user(auth_user_id)
+        channel_valid = valid_channel(channel_id)
         
     if user_valid == False or channel_valid == False:
         raise InputError(description= "User and/or channel ID does not exist")
@@ -376,19 +373,14 @@ def channel_join_v2(token, channel_id):
     # If the channel is public or is a dreams owner add them to the channel
     if data['channels'][channel_id - 1].get('is_public'):
         join_channel(auth_user_id, channel_id)
+    members_changed('channel', channel_id)
+    bump_version('channel', channel_id)
     
     
-    if data.get("added_info") == None:
-        data["added_info"] = { }
-    
-    if data["added_info"].get("channels") == None:
-        data["added_info"]["channels"] = []
-    
-    info_dict = {"u_id": auth_user_id,
-                 "channel_id" : channel_id,
-                 "joiner" : data["users"][auth_user_id - 1]["handle_str"]
-                }
-    data["added_info"]["channels"].append(info_dict)
+    joiner = data["users"][auth_user_id - 1]["handle_str"]
+    channel = get_channel(channel_id)
+    if auth_user_id != channel.get('creator'):
+        notify(auth_user_id, channel_id, -1, f"{joiner} joined {channel['name']}")
    
           
     return {
@@ -426,54 +418,44 @@ def channel_addowner_v1(token, channel_id, u_id):
     auth_user_id = find_user_id(token)
 
     # Check if the ID's passed through are valid
-    user_valid = check_valid_info(data['users'], u_id)
-    auth_user_valid = check_valid_info(data['users'], auth_user_id)
-    channel_valid = check_valid_info(data['channels'], channel_id)
+    user_valid = valid_user(u_id)
+    auth_user_valid = valid_user(auth_user_id)
+    channel_valid = valid_channel(channel_id)
     
     # ID's are not valid, raise InputError
     if auth_user_valid == False or user_valid == False or channel_valid == False:
         raise InputError(description= 'User or channel ID is not valid')
 
     # Check if the user is a **Dreams** Owner
-    for users in data['users']:
-        if users.get('auth_user_id') == auth_user_id:
-            if users.get('global_permissions') == 1:
-                dream_user = True
+    dream_user = is_dreams_owner(auth_user_id)
 
-    # Loop to see if auth_user is an owner of the channel
-    for key in data['channels']:
-        for owner in key.get('owner_members'):
-            if owner.get('u_id') is auth_user_id:
-                owner_valid = True    
+    # Check if auth_user is an owner of the channel
+    owner_valid = is_channel_owner(channel_id, auth_user_id)
 
     # If the owner was not found and the user is not a Dream's Owner raise AccessError
     if owner_valid == False and dream_user == False:
         raise AccessError(description= 'User is not an owner of this channel. Cannot add user as owner')
 
     # Generate the member info for the owner that is going to be added to the owner list
-    for user in data['users']:
-        if user.get('auth_user_id') == u_id:
-            user_info = {
-                'u_id' : u_id,
-                'email' : user.get('email'),
-                'name_first' : user.get('f_name'),
-                'name_last' : user.get('l_name'),
-                'time_created' : get_timestamp(),
-                'handle_str' : user.get('handle_str'),
-                'profile_img_url' : user.get('profile_img_url')
-            }
-
-    # Loop through the channels in data['channels']        
-    for channel in data['channels']:
-        # Read each key and value in channel
-        for key, val in channel.items():
-            if key == 'owner_members':
-                # Check if the u_id is an existing owner of the channel
-                for owner_check in val:
-                    if owner_check.get('u_id') == u_id:
-                        raise AccessError('Already an owner of this channel')
-                # Append the user to the channel
-                val.append(user_info)
+    user = get_user(u_id)
+    user_info = {
+        'u_id' : u_id,
+        'email' : user.get('email'),
+        'name_first' : user.get('f_name'),
+        'name_last' : user.get('l_name'),
+        'time_created' : get_timestamp(),
+        'handle_str' : user.get('handle_str'),
+        'profile_img_url' : user.get('profile_img_url')
+    }
+
+    # Check if the u_id is an existing owner of the channel
+    if is_channel_owner(channel_id, u_id):
+        raise AccessError('Already an owner of this channel')
+
+    # Append the user to the channel's owners
+    get_channel(channel_id)['owner_members'].append(user_info)
+    members_changed('channel', channel_id)
+    bump_version('channel', channel_id)
 
     return {
     }
@@ -508,31 +490,24 @@ def channel_removeowner_v1(token, channel_id, u_id):
         data['channels'] = []
 
     #check that auth_user_id and channel_id exist
-    uid_valid = check_valid_info(data['users'], u_id)
-    auth_user_id_valid = check_valid_info(data['users'], auth_user_id)
-    channel_valid = check_valid_info(data['channels'], channel_id)
+    uid_valid = valid_user(u_id)
+    auth_user_id_valid = valid_user(auth_user_id)
+    channel_valid = valid_channel(channel_id)
 
     #if user_id or channel_id is invalid
     if uid_valid == False or channel_valid == False or auth_user_id_valid == False:
         raise InputError("User and/or channel ID does not exist")
 
-    #may need to change later
-    dreams_owner = data['users'][auth_user_id - 1]['global_permissions']
     owners_list = data['channels'][channel_id - 1]['owner_members']
 
     # Check if the user is a **Dreams** Owner
-    if dreams_owner == 1:
-        dreams_user = True
+    dreams_user = is_dreams_owner(auth_user_id)
 
     #check that auth_user_id is an owner of the channel
-    for owner in owners_list:
-        if owner.get('u_id') == auth_user_id:
-            auth_owner_valid = True
+    auth_owner_valid = is_channel_owner(channel_id, auth_user_id)
 
     #check that u_id is an owner of the channel
-    for owner in owners_list:
-        if owner.get('u_id') == u_id:
-            uid_owner_valid = True
+    uid_owner_valid = is_channel_owner(channel_id, u_id)
 
     #input error if u_id is not an owner
     if not uid_owner_valid:
@@ -552,6 +527,8 @@ def channel_removeowner_v1(token, channel_id, u_id):
         if owners_list[i].get('u_id') == u_id: 
             del owners_list[i]
         i += 1
+    members_changed('channel', channel_id)
+    bump_version('channel', channel_id)
 
     return {
     }
@@ -1,6 +1,15 @@
 from src.data import getData 
 from src.error import AccessError, InputError   
-from src.helper import check_valid_info, find_user_id, get_user_info, check_members, get_timestamp
+from src.helper import get_user_info, get_timestamp
+from src.sessions import find_user_id
+from src.message_index import conversation_message_ids, dm_message_index, get_message, message_page
+from src.search_index import message_changed
+from src.stats import message_edited
+from src.notifications import notify
+from src.versions import bump_version
+from src.user_index import member_dm_ids
+from src.photos import with_thumbnails
+from src.registry import get_user, get_dm, valid_user, valid_dm, is_dm_member, members_changed
 from datetime import datetime
 
 def dm_details_v1(token, dm_id):
@@ -17,7 +26,8 @@ def dm_details_v1(token, dm_id):
     
     Return Value: 
         name (str) - the dm's name
-        members (list of dict) - each dictionary contains types: user
+        members (list of dict) - each dictionary contains types: user, with the url
+                                 of a small thumbnail of their photo in profile_img_thumbnail_url
     """
 
     data = getData()
@@ -34,19 +44,17 @@ def dm_details_v1(token, dm_id):
         raise InputError('Invalid input')
     dm_id = int(dm_id)
     
-    if not check_valid_info(data['dm'], dm_id): 
+    if not valid_dm(dm_id): 
         raise InputError(description = "This dm_id does not exist")
     dm_name = data['dm'][dm_id - 1]['dm_name']
     members_list = data['dm'][dm_id - 1]['all_members']
-     
-    
-    
-    valid = check_valid_info(members_list, auth_user_id)
+
+    valid = is_dm_member(dm_id, auth_user_id)
 
     if valid is False:
         raise AccessError(description = "This user is not apart of this DM")
 
-    dm_dict = {"name" : dm_name, "members": members_list}
+    dm_dict = {"name" : dm_name, "members": with_thumbnails(members_list)}
     return dm_dict
 
 def dm_list_v1(token):
@@ -78,13 +86,11 @@ def dm_list_v1(token):
 
     dms_user_list = {"dms" : []}
 
-    for dms in data['dm']:
-            for key, val in dms.items(): #this line will access each key in each dict
-                if key == 'all_members': #checks if the variable is valid 
-                    for user_dict in val:
-                        if user_dict.get("u_id") == auth_user_id:
-                            dm_dict = {"dm_id" : dms['dm_id'], "name" : dms["dm_name"]} 
-                            dms_user_list['dms'].append(dm_dict)
+    # Only look at the dms the user is a member of
+    for dm_id in sorted(member_dm_ids(auth_user_id)):
+        dms = get_dm(dm_id)
+        dm_dict = {"dm_id" : dms['dm_id'], "name" : dms["dm_name"]} 
+        dms_user_list['dms'].append(dm_dict)
 
     return dms_user_list
     
@@ -120,26 +126,16 @@ def dm_create_v1(token, u_ids):
     #checking if input is valid ie. checking if u_id refers to a valid user 
     #u_id is going to be a list of users, we must check that these user id's exist in the data["users"] dict
     
-    user_listx = []
-    for user in data["users"]:
-        user_listx.append(user["auth_user_id"])
-    #new code
     for ids in u_ids:
-        if ids not in user_listx:
-            # This isn't getting run
+        if not valid_user(ids):
             raise InputError(description = 'User id(s) does not refer to a valid user')
     
     dm_id = len(data["dm"]) + 1
 
     #finding names of the user ids and putting them into a string in alphabetical order and correct format
-    handles_list = []
-    #old code
-    for user in data["users"]:
-        for ids in u_ids: 
-            if user["auth_user_id"] is ids: 
-                handles_list.append(user["handle_str"])
-        if user["auth_user_id"] is auth_user_id:
-            handles_list.append(user["handle_str"])
+    handles_list = [get_user(auth_user_id)["handle_str"]]
+    for ids in u_ids: 
+        handles_list.append(get_user(ids)["handle_str"])
 
 
     handles_list.sort()
@@ -151,22 +147,16 @@ def dm_create_v1(token, u_ids):
     #what we need to do here is to create a members list and append a dictionary containing some "detailing" info into there 
     members_list = []
     
-    i = 0
-    while i<len(data["users"]): 
-        user_id = data["users"][i].get("auth_user_id")
-        if user_id == auth_user_id:     
-            dictionary = {
-                "u_id": auth_user_id,
-                "email": data["users"][i].get('email'),
-                "name_first": data["users"][i].get('f_name'),
-                "name_last": data["users"][i].get('l_name'), 
-                "handle_str" : data['users'][i].get('handle_str'),
-                "profile_img_url" : data['users'][i].get('profile_img_url')
-                }
-            members_list.append(dictionary)
-            i = len(data["users"])
-        else: 
-            i += 1
+    creator = get_user(auth_user_id)
+    dictionary = {
+        "u_id": auth_user_id,
+        "email": creator.get('email'),
+        "name_first": creator.get('f_name'),
+        "name_last": creator.get('l_name'), 
+        "handle_str" : creator.get('handle_str'),
+        "profile_img_url" : creator.get('profile_img_url')
+        }
+    members_list.append(dictionary)
     
     #what we need to do here is to create a members list and append a dictionary containing some "type user" info there 
     #new code
@@ -199,30 +189,19 @@ def dm_create_v1(token, u_ids):
     }
     # Append the user to the dm dictionary and add this dm to the user's dm membership key in 
     
-    for person in data['users']:
-        for member in members_list:
-            if person.get('auth_user_id') == member.get('u_id'):
-                if person.get('dms_in') == None:
-                    person['dms_in'] = []
-                person.get('dms_in').append(dm_info)
+    for member in members_list:
+        person = get_user(member.get('u_id'))
+        if person.get('dms_in') == None:
+            person['dms_in'] = []
+        person.get('dms_in').append(dm_info)
 
     #if bool(data):
     data["dm"].append(new_dm_reg)
         
     #FOLLOWIJNG IS FOR NOTIFICATIONS GET FUNCTION / ALI
-    if data.get("added_info") == None:
-        data["added_info"] = { }
-    
-    if data["added_info"].get("dms") == None:
-        data["added_info"]["dms"] = []
-    
+    adder = data["users"][auth_user_id - 1]["handle_str"]
     for user_id in u_ids:
-        info_dict = {
-            "u_id": user_id,
-            "dm_id" : dm_id,
-            "adder" : data["users"][auth_user_id - 1]["handle_str"]
-            }
-        data["added_info"]["dms"].append(info_dict)    
+        notify(user_id, -1, dm_id, f"{adder} added you to {finalised_handle}")
 
     print(type(finalised_handle))
     return  { 
@@ -252,34 +231,32 @@ def dm_remove_v1(token, dm_id):
         raise AccessError(description= 'This is not a valid user')
 
     dm_valid = False 
-    dm_valid = check_valid_info(data["dm"], dm_id) 
+    dm_valid = valid_dm(dm_id) 
 
     if dm_valid is False: 
         raise InputError(description ="This dm_id does not refer to a valid DM ")
 
-    creator = False
-    for dm in data["dm"]: 
-        if dm.get("dm_id") == dm_id:
-            if dm.get("creator") == auth_user_id: 
-                creator = True 
+    dm = get_dm(dm_id)
+    creator = dm.get("creator") == auth_user_id
                 
     if creator is False: 
         raise AccessError(description = "You are not the creator of the dm and do not have permission to remove it")
 
-    i = 0
-    for dm in data['dm']:
-        if data["dm"][i]['dm_id'] == dm_id: 
-            data["dm"][i]['dm_name'] = "This dm has been removed"
-            data["dm"][i]['dm_id'] = "This dm has been removed"
-            del data["dm"][i]['all_members'] 
-        i += 1
+    dm['dm_name'] = "This dm has been removed"
+    dm['dm_id'] = "This dm has been removed"
+    del dm['all_members'] 
+    members_changed('dm', dm_id)
+    bump_version('dm', dm_id)
     
     if data.get('messages') == None:
         data['messages'] = []
 
-    for msg in data['messages']:
-        if msg.get('dm_id') == dm_id: 
-            msg['message'] = "This dm has been removed"
+    # Only the messages sent to this dm need to be changed
+    for message_id in conversation_message_ids('dms', dm_id):
+        msg = get_message(message_id)
+        msg['message'] = "This dm has been removed"
+        message_changed(msg)
+        message_edited(msg)
 
     return {
 
@@ -310,10 +287,10 @@ def dm_invite_v1(token, dm_id, u_id):
     token_valid = False
 
     # Check if the dm_id is valid
-    dm_valid = check_valid_info(data['dm'], dm_id)
+    dm_valid = valid_dm(dm_id)
    
     # Check if the u_id to be invited is valid
-    user_valid = check_valid_info(data['users'], u_id)
+    user_valid = valid_user(u_id)
 
     if dm_valid is False or user_valid is False:
         raise InputError(description = 'Cannot invite, DM/User does not exist')
@@ -323,32 +300,19 @@ def dm_invite_v1(token, dm_id, u_id):
 
     # Check if u_id is already a member of the dm
     # Else add the user to the dm member list
-    for key in data['dm']:
-        # Find the member key in dm
-        if key.get('dm_id') is dm_id:
-            for member_dict in key.get('all_members'):
-                if member_dict.get('u_id') is u_id:
-                    is_member = True
-                elif member_dict.get('u_id') is dm_member:
-                    token_valid = True
+    is_member = is_dm_member(dm_id, u_id)
+    token_valid = is_dm_member(dm_id, dm_member)
     
     if token_valid is False:
         raise InputError(description ='Invalid user, cannot invite')
 
     # Concatenate the invited user to the handle name and add this to the dm dictionary
-    members_list = []
-    for key in data['dm']:
-        if key.get('dm_id') is dm_id:
-            for member in key.get('all_members'):
-                members_list.append(member)
-    
-    handles_list = []
-    for user in data["users"]:
-        for ids in members_list: 
-            if user.get("auth_user_id") is ids.get('u_id'): 
-                handles_list.append(user["handle_str"])
-        if user.get("auth_user_id") is u_id: 
-            handles_list.append(user["handle_str"])
+    dm = get_dm(dm_id)
+    members_list = dm.get('all_members')
+    
+    handles_list = [get_user(u_id)["handle_str"]]
+    for ids in members_list: 
+        handles_list.append(get_user(ids.get('u_id'))["handle_str"])
 
     handles_list.sort()
     
@@ -360,10 +324,10 @@ def dm_invite_v1(token, dm_id, u_id):
     # If the user is part of the dm, raise AccessError
     if is_member is False:
         user_info = get_user_info(u_id)
-        for dm in data['dm']:
-            if dm.get('dm_id') is dm_id:
-                dm.get('all_members').append(user_info)
-                dm['dm_name'] = finalised_handle
+        dm.get('all_members').append(user_info)
+        dm['dm_name'] = finalised_handle
+        members_changed('dm', dm_id)
+        bump_version('dm', dm_id)
     else:
         raise AccessError(description = 'User is already a member of this DM')
 
@@ -375,17 +339,13 @@ def dm_invite_v1(token, dm_id, u_id):
     }
     # Append the user to the dm dictionary and add this dm to the user's dm membership key in 
     # data['users']
-    for person in data['users']:
-        if person.get('auth_user_id') is u_id:
-            if person.get('dms_in') == None:
-                person['dms_in'] = []
-            person.get('dms_in').append(dm_info)
+    person = get_user(u_id)
+    if person.get('dms_in') == None:
+        person['dms_in'] = []
+    person.get('dms_in').append(dm_info)
     
-    info_dict = {"u_id": u_id,
-                 "dm_id" : dm_id,
-                 "adder" : data["users"][dm_member - 1]["handle_str"]
-                }
-    data["added_info"]["dms"].append(info_dict)  
+    adder = data["users"][dm_member - 1]["handle_str"]
+    notify(u_id, -1, dm_id, f"{adder} added you to {dm['dm_name']}")
 
     
     return {
@@ -413,8 +373,8 @@ def dm_leave_v1(token, dm_id):
     member_valid = False
 
     #check that auth_user_id and dm_id are valid
-    user_valid = check_valid_info(data['users'], auth_user_id)
-    dm_valid = check_valid_info(data['dm'], dm_id)
+    user_valid = valid_user(auth_user_id)
+    dm_valid = valid_dm(dm_id)
 
     #if user_id or channel_id is invalid
     if user_valid == False or dm_valid == False:
@@ -423,9 +383,7 @@ def dm_leave_v1(token, dm_id):
     members_list = data['dm'][dm_id - 1]['all_members']
 
     #check that auth_user_id is a member of the channel
-    for members in members_list:
-        if members.get('u_id') is auth_user_id:
-            member_valid = True
+    member_valid = is_dm_member(dm_id, auth_user_id)
     
     if not member_valid:
         raise AccessError(description = "User is not a member")
@@ -438,6 +396,8 @@ def dm_leave_v1(token, dm_id):
             if member.get('u_id') == auth_user_id:
                 del members_list[i]
             i += 1
+    members_changed('dm', dm_id)
+    bump_version('dm', dm_id)
     
     #need to revert the name of the dm such that it does not include the person that has left the dm
     #do this by generating the dm_name in the absence of the user in memberslist
@@ -464,28 +424,34 @@ def dm_leave_v1(token, dm_id):
     return {
     }
 
-def dm_messages_v1(token, dm_id, start):
+def dm_messages_v1(token, dm_id, start, cursor=None):
     """
     Given a DM with ID dm_id that the authorised user is part of, return up to 50 messages between index 
     "start" and "start + 50". Message with index 0 is the most recent message in the dm. 
     This function returns a new index "end" which is the value of "start + 50", or, if this function has 
     returned the least recent messages in the dm, returns -1 in "end" to indicate there are 
     no more messages to load after this return.
+    If a cursor is given instead (use '' for the most recent messages), the
+    page is found from the cursor and "next_cursor" is returned instead of
+    "start" and "end", which is None once there are no more messages to load.
 
     Arguments: 
         token (str) - the user's token
         dm_id (int) - the dm's id
         start (int) - the starting index
+        cursor (str) - the next_cursor from the previous page
     
     Exceptions:
         InputError - DM ID is not a valid DM
         InputError - start is greater than the total number of messages in the channel
+        InputError - cursor is not a cursor for this dm
         AccessError - Authorised user is not a member of DM with dm_id
     
     Return Value: 
         messages (list of dict) - each dictionary contains types: message_id, u_id, message, time_created
         start (int) - the starting index
         end (int) - the last index
+        next_cursor (str) - the cursor of the next page, if a cursor was given
     """
     data = getData()
     # Check if inputs are valid
@@ -502,10 +468,11 @@ def dm_messages_v1(token, dm_id, start):
 
     # Ensure that dm_id and start are int values when passed through server
     dm_id = int(dm_id)
-    start = int(start)
+    if cursor == None:
+        start = int(start)
     
-    dm_valid = check_valid_info(data['dm'], dm_id)
-    is_member = check_members(data['dm'], auth_user_id)
+    dm_valid = valid_dm(dm_id)
+    is_member = is_dm_member(dm_id, auth_user_id)
     
     # Raise InputError if Id does not exist
     if dm_valid is False:
@@ -521,47 +488,45 @@ def dm_messages_v1(token, dm_id, start):
     if data.get('messages') == None:
         data['messages'] = []
         
-    # Get the length of the messages in the dm
-    length = 0
-    all_dm_messages = []
-    # Get all the messages under the dm id
-    for dm in data['messages']:
-        if dm.get('dm_id') == dm_id:
-            all_dm_messages.append(dm)
-        length = len(all_dm_messages)
-
-    if length < start:
-        raise InputError(description = 'Start is greater than the total messages')
-
-    j = 0
-    if length < 50: # if messages is less than 50
-        while j < length: 
-            message_dict = {}
-            message_dict['message_id'] = all_dm_messages[j].get('dm_message_index')
-            message_dict['u_id'] = all_dm_messages[j].get('sender')
-            message_dict['message'] = all_dm_messages[j].get('message')
-            message_dict['time_created'] = all_dm_messages[j].get('time_created')
-            message_dict['reacts'] = all_dm_messages[j].get('reacts')
-            message_dict['is_pinned'] = all_dm_messages[j].get('is_pinned')
-
-            message_list.append(message_dict)
-            j += 1
-              
-    else:    
-        i = start
-        while i < (start + 50): # for cases with greater than 50 messages
-            message_dict = {}
-            message_dict['message_id'] = all_dm_messages[i].get('message_index')
-            message_dict['u_id'] = all_dm_messages[i].get('sender')
-            message_dict['message'] = all_dm_messages[i].get('message')
-            message_dict['time_created'] = all_dm_messages[i].get('time_created')
-            message_dict['reacts'] = all_dm_messages[i].get('reacts')
-            message_dict['is_pinned'] = all_dm_messages[i].get('is_pinned')
-            
-            message_list.append(message_dict)
-            i += 1
+    if cursor != None:
+        # The page comes back most recent first
+        page_ids, next_cursor = message_page('dms', dm_id, cursor)
+        page_ids.reverse()
+        length = None
+    else:
+        # Get the ids of all the messages under the dm id from the dm's
+        # message index instead of going through every message in data
+        all_dm_ids = conversation_message_ids('dms', dm_id)
+        length = len(all_dm_ids)
+
+        if length < start:
+            raise InputError(description = 'Start is greater than the total messages')
+
+        if length < 50: # if messages is less than 50
+            page_ids = all_dm_ids
+        else: # for cases with greater than 50 messages
+            page_ids = all_dm_ids[start:start + 50]
             end = start + 50
 
+    for message_id in page_ids:
+        msg = get_message(message_id)
+        message_dict = {}
+        if length == None:
+            message_dict['message_id'] = msg.get('message_id')
+        elif length < 50:
+            message_dict['message_id'] = dm_message_index(msg)
+        else:
+            message_dict['message_id'] = msg.get('message_index')
+        message_dict['u_id'] = msg.get('sender')
+        message_dict['message'] = msg.get('message')
+        message_dict['time_created'] = msg.get('time_created')
+        message_dict['reacts'] = msg.get('reacts')
+        message_dict['is_pinned'] = msg.get('is_pinned')
+
+        message_list.append(message_dict)
+
     message_list.reverse()
 
+    if cursor != None:
+        return {'messages' : message_list, 'next_cursor' : next_cursor}
     return {'messages' : message_list, 'start' : start, 'end' : end}
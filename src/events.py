@@ -0,0 +1,172 @@
+import threading
+from collections import deque
+from json import dumps
+from uuid import uuid4
+from src.longpoll import conversation_updated
+
+# Message events for the channel/dm event streams (server-sent events).
+#
+# Whenever src/message.py sends, edits, removes, pins, unpins, reacts to or
+# unreacts to a message, an event is added to the end of a ring buffer kept
+# for its channel or dm. Each event has the next sequence number of that
+# conversation. Listeners do not get a queue of their own: each one only
+# remembers the last sequence number it has sent and reads anything newer
+# from the shared buffer, so an event costs the same however many people are
+# listening. A listener that falls more than EVENT_BUFFER events behind is
+# sent a 'reset' event (the client should reload the messages) rather than
+# having events kept for it.
+#
+# Event ids are "<epoch>-<sequence>". The epoch is picked when the server
+# starts, so a client reconnecting with an id from before a restart is sent
+# a 'reset' as well.
+#
+# The streams themselves are served by src/longpoll.py on its event loop, so
+# an open stream holds no thread. Adding an event, or a change to who is a
+# member (membership_changed(), called by registry.members_changed), calls
+# conversation_updated() to wake the streams of that channel or dm. Streams
+# only check with data whether their user is still a member after the
+# membership count of their conversation has changed.
+
+EVENT_BUFFER = 256
+
+_events = {
+    'epoch' : uuid4().hex[:12],
+    'conversations' : {},
+    'lock' : threading.Lock(),
+}
+
+def _conversation(kind, conversation_id):
+    key = (kind, conversation_id)
+    with _events['lock']:
+        conversation = _events['conversations'].get(key)
+        if conversation is None:
+            conversation = {
+                'buffer' : deque(maxlen=EVENT_BUFFER),
+                'sequence' : 0,
+                'membership' : 0,
+                'lock' : threading.Lock(),
+            }
+            _events['conversations'][key] = conversation
+    return conversation
+
+def _message_conversation(message):
+    if 'dm_id' in message:
+        return 'dm', message.get('dm_id')
+    return 'channel', message.get('channel_id')
+
+def publish_message_event(message, event_type):
+    """
+    Adds an event about a message to its channel or dm's buffer and wakes
+    everyone listening to it
+
+    Arguments:
+        message (dict) - the message as stored in data['messages']
+        event_type (str) - 'new', 'edited', 'removed', 'pinned', 'unpinned',
+                           'reacted' or 'unreacted'
+
+    Return Value:
+        None
+    """
+    kind, conversation_id = _message_conversation(message)
+    conversation = _conversation(kind, conversation_id)
+    payload = {
+        'message_id' : message.get('message_id'),
+        'u_id' : message.get('sender'),
+        'message' : message.get('message'),
+        'time_created' : message.get('time_created'),
+        'is_pinned' : message.get('is_pinned', False),
+        'reacts' : [{'react_id' : react.get('react_id'), 'u_ids' : list(react.get('u_ids', []))}
+                    for react in message.get('reacts', [])],
+    }
+    with conversation['lock']:
+        conversation['sequence'] += 1
+        sequence = conversation['sequence']
+        # Encoded once here rather than once for every listener
+        conversation['buffer'].append((sequence, _format(sequence, event_type, dumps(payload))))
+    conversation_updated(kind, conversation_id)
+
+def membership_changed(kind, conversation_id):
+    """
+    Counts a change to the members of a channel or dm (or its removal), so
+    its open streams check their user is still a member
+
+    Arguments:
+        kind (str) - 'channel' or 'dm'
+        conversation_id (int) - the channel or dm's id
+
+    Return Value:
+        None
+    """
+    conversation = _conversation(kind, conversation_id)
+    with conversation['lock']:
+        conversation['membership'] += 1
+    conversation_updated(kind, conversation_id)
+
+def membership_version(kind, conversation_id):
+    """
+    Returns the number of times the members of a channel or dm have changed
+    """
+    return _conversation(kind, conversation_id)['membership']
+
+def _format(sequence, event_type, data):
+    return f"id: {_events['epoch']}-{sequence}\nevent: {event_type}\ndata: {data}\n\n"
+
+def last_sequence(last_event_id):
+    """
+    Returns the sequence number in a Last-Event-ID, or None if it is missing
+    or from before the server started
+    """
+    if not last_event_id:
+        return None
+    epoch, _, sequence = str(last_event_id).partition('-')
+    if epoch != _events['epoch'] or not sequence.isdigit():
+        return None
+    return int(sequence)
+
+def start_position(kind, conversation_id, last_event_id=None):
+    """
+    Works out where a new stream starts reading from
+
+    Arguments:
+        kind (str) - 'channel' or 'dm'
+        conversation_id (int) - the channel or dm's id
+        last_event_id (str) - the id of the last event the client was sent, if
+                              it is reconnecting
+
+    Return Value:
+        (sequence number to read on from, the first chunk to send)
+    """
+    seen = last_sequence(last_event_id)
+    if seen is not None:
+        return seen, ': connected\n\n'
+    conversation = _conversation(kind, conversation_id)
+    with conversation['lock']:
+        seen = conversation['sequence']
+    if last_event_id:
+        return seen, _format(seen, 'reset', '{}')
+    return seen, ': connected\n\n'
+
+def read_events(kind, conversation_id, seen):
+    """
+    Returns the events of a channel or dm after sequence number seen, without
+    waiting
+
+    Arguments:
+        kind (str) - 'channel' or 'dm'
+        conversation_id (int) - the channel or dm's id
+        seen (int) - the sequence number of the last event sent
+
+    Return Value:
+        (the events as one chunk, or None if there are none, the sequence
+        number of the last of them)
+    """
+    conversation = _conversation(kind, conversation_id)
+    with conversation['lock']:
+        sequence = conversation['sequence']
+        buffer = conversation['buffer']
+        if sequence == seen:
+            return None, seen
+        if sequence < seen or not buffer or buffer[0][0] > seen + 1:
+            # Too far behind, or the client's id is from a later sequence than this one
+            return _format(sequence, 'reset', '{}'), sequence
+        return ''.join(event for number, event in buffer if number > seen), sequence
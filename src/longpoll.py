@@ -0,0 +1,331 @@
+import asyncio
+import math
+import threading
+from json import dumps
+from urllib.parse import urlsplit, parse_qs
+from src import config
+from src.error import InputError, AccessError
+from src.persistence import STATE_LOCK
+
+# Requests that wait for something to happen: long polls of
+# notifications/get/v1 and the channel/dm event streams.
+#
+#     GET /notifications/get/v1?token=...&marker=...&timeout=...
+#     GET /channel/events/v1?token=...&channel_id=...
+#     GET /dm/events/v1?token=...&dm_id=...
+#
+# marker is the "marker" from the caller's last notifications/get. If the
+# user has had no notifications since then, the request is parked until a
+# notification arrives or timeout seconds (at most MAX_TIMEOUT) have passed,
+# then answered the same way as notifications/get.
+#
+# The event streams send the events of src/events.py as server-sent events
+# until STREAM_TIMEOUT has passed, then end so the client reconnects with the
+# Last-Event-ID header (or last_event_id argument) it was sent. A stream
+# ends early once its user is no longer a member.
+#
+# The Flask app cannot park a request without holding one of its threads, so
+# these are served by a small asyncio http server on its own port
+# (config.port + 1 unless given). A parked request is just a future on its
+# event loop, however many there are. notify() calls notification_added()
+# and src/events.py calls conversation_updated(), which wake the futures
+# waiting on that user or conversation from whichever thread they are on
+# with one call_soon_threadsafe. Anything that reads data still takes the
+# state lock, so it is done on the loop's default executor for the moment
+# it takes.
+
+LONGPOLL_TIMEOUT = 30
+MAX_TIMEOUT = 120
+HEADER_TIMEOUT = 10
+KEEPALIVE = 15
+STREAM_TIMEOUT = 300
+
+_longpoll = {
+    'loop' : None,
+    'thread' : None,
+    'port' : None,
+    'waiters' : {},
+    'lock' : threading.Lock(),
+}
+
+def _wake_soon(key):
+    with _longpoll['lock']:
+        loop = _longpoll['loop']
+        waiting = key in _longpoll['waiters']
+    if loop is not None and waiting:
+        loop.call_soon_threadsafe(_wake, key)
+
+def notification_added(u_id):
+    """
+    Wakes any long polls waiting for a notification for this user. Can be
+    called from any thread.
+    """
+    _wake_soon(('notifications', u_id))
+
+def conversation_updated(kind, conversation_id):
+    """
+    Wakes any event streams of a channel or dm, after an event was added to
+    it or its members changed. Can be called from any thread.
+    """
+    _wake_soon((kind, conversation_id))
+
+def _wake(key):
+    with _longpoll['lock']:
+        futures = _longpoll['waiters'].pop(key, set())
+    for future in futures:
+        if not future.done():
+            future.set_result(True)
+
+def _add_waiter(key, future):
+    with _longpoll['lock']:
+        _longpoll['waiters'].setdefault(key, set()).add(future)
+
+def _remove_waiter(key, future):
+    with _longpoll['lock']:
+        futures = _longpoll['waiters'].get(key)
+        if futures is not None:
+            futures.discard(future)
+            if not futures:
+                del _longpoll['waiters'][key]
+
+def _check(token):
+    # Imported here as src.message imports src.notifications, which imports this module
+    from src.message import notifications_get_v1
+    from src.sessions import find_user_id
+    with STATE_LOCK:
+        result = notifications_get_v1(token)
+        return find_user_id(token), result
+
+async def wait_for_notifications(token, marker, timeout):
+    """
+    Returns the user's notifications as soon as they have any newer than
+    marker, or after timeout seconds
+
+    Arguments:
+        token (str) - the user's token
+        marker (int) - the marker of the last notifications the user has, or
+                       None to return straight away
+        timeout (float) - the most seconds to wait
+
+    Exceptions:
+        AccessError - The token is not valid
+
+    Return Value:
+        notifications (list of dict) and marker (int), as notifications/get
+    """
+    loop = asyncio.get_running_loop()
+    u_id, result = await loop.run_in_executor(None, _check, token)
+    if marker is None or result['marker'] != marker:
+        return result
+
+    key = ('notifications', u_id)
+    future = loop.create_future()
+    _add_waiter(key, future)
+    try:
+        # A notification may have arrived before the waiter was added
+        u_id, result = await loop.run_in_executor(None, _check, token)
+        if result['marker'] != marker:
+            return result
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return result
+    finally:
+        _remove_waiter(key, future)
+    return (await loop.run_in_executor(None, _check, token))[1]
+
+def _is_member(kind, conversation_id, u_id):
+    from src.registry import is_channel_member, is_dm_member
+    with STATE_LOCK:
+        if kind == 'channel':
+            return is_channel_member(conversation_id, u_id)
+        return is_dm_member(conversation_id, u_id)
+
+def _check_stream(token, kind, conversation_id):
+    from src.sessions import find_user_id
+    from src.registry import valid_channel, valid_dm
+    with STATE_LOCK:
+        auth_user_id = find_user_id(token)
+        if auth_user_id is False or auth_user_id is None:
+            raise AccessError(description = 'This is not a valid user')
+        valid = valid_channel if kind == 'channel' else valid_dm
+        if conversation_id is None or not valid(conversation_id):
+            raise InputError(description = f'This {kind} does not exist')
+        if not _is_member(kind, conversation_id, auth_user_id):
+            raise AccessError(description = f'User is not a member of this {kind}')
+        return auth_user_id
+
+async def stream_events(writer, token, kind, conversation_id, last_event_id):
+    """
+    Checks the user can see a channel or dm, then writes its events to
+    writer as server-sent events until STREAM_TIMEOUT has passed or the user
+    is no longer a member
+
+    Arguments:
+        writer (asyncio.StreamWriter) - the client's connection
+        token (str) - the user's token
+        kind (str) - 'channel' or 'dm'
+        conversation_id (int) - the channel or dm's id
+        last_event_id (str) - the id of the last event the client was sent
+
+    Exceptions:
+        InputError - The channel or dm does not exist
+        AccessError - The token is not valid, or the user is not a member
+
+    Return Value:
+        None
+    """
+    from src.events import start_position, read_events, membership_version
+    loop = asyncio.get_running_loop()
+    key = (kind, conversation_id)
+    # Taken before the check, so a change while it runs is checked again
+    membership = membership_version(kind, conversation_id)
+    u_id = await loop.run_in_executor(None, _check_stream, token, kind, conversation_id)
+
+    seen, first = start_position(kind, conversation_id, last_event_id)
+    writer.write((
+        "HTTP/1.1 200 OK\r\n"
+        "Content-Type: text/event-stream\r\n"
+        "Access-Control-Allow-Origin: *\r\n"
+        "Cache-Control: no-cache\r\n"
+        "X-Accel-Buffering: no\r\n"
+        "Connection: close\r\n\r\n"
+        + first
+    ).encode())
+    await writer.drain()
+
+    deadline = loop.time() + STREAM_TIMEOUT
+    while loop.time() < deadline:
+        future = loop.create_future()
+        _add_waiter(key, future)
+        try:
+            # Anything added before the waiter was is read straight away
+            chunk, sequence = read_events(kind, conversation_id, seen)
+            if chunk is None and membership_version(kind, conversation_id) == membership:
+                try:
+                    await asyncio.wait_for(future, min(KEEPALIVE, max(0, deadline - loop.time())))
+                except asyncio.TimeoutError:
+                    pass
+                chunk, sequence = read_events(kind, conversation_id, seen)
+        finally:
+            _remove_waiter(key, future)
+
+        if membership_version(kind, conversation_id) != membership:
+            membership = membership_version(kind, conversation_id)
+            if not await loop.run_in_executor(None, _is_member, kind, conversation_id, u_id):
+                return
+        writer.write((chunk or ': keepalive\n\n').encode())
+        await writer.drain()
+        seen = sequence
+
+def _response(writer, status, body):
+    reasons = {200 : 'OK', 400 : 'Bad Request', 403 : 'Forbidden', 404 : 'Not Found'}
+    content = body.encode()
+    writer.write((
+        f"HTTP/1.1 {status} {reasons.get(status, 'Error')}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(content)}\r\n"
+        "Access-Control-Allow-Origin: *\r\n"
+        "Cache-Control: no-cache\r\n"
+        "Connection: close\r\n\r\n"
+    ).encode() + content)
+
+def _error(code, message):
+    return dumps({'code' : code, 'name' : 'System Error', 'message' : message})
+
+def _request_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+STREAM_PATHS = {
+    '/channel/events/v1' : ('channel', 'channel_id'),
+    '/dm/events/v1' : ('dm', 'dm_id'),
+}
+
+async def _handle(reader, writer):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), HEADER_TIMEOUT)
+        headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), HEADER_TIMEOUT)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        try:
+            method, target = request_line.decode('latin-1').split(' ')[0:2]
+        except ValueError:
+            method, target = '', ''
+        url = urlsplit(target)
+        path = url.path.rstrip('/')
+        args = {key : values[0] for key, values in parse_qs(url.query).items()}
+        if method != 'GET' or (path != '/notifications/get/v1' and path not in STREAM_PATHS):
+            _response(writer, 404, _error(404, 'Not found'))
+            return
+
+        try:
+            if path in STREAM_PATHS:
+                kind, id_name = STREAM_PATHS[path]
+                last_event_id = headers.get('last-event-id') or args.get('last_event_id')
+                await stream_events(writer, args.get('token'), kind, _request_id(args.get(id_name)), last_event_id)
+                return
+
+            try:
+                marker = int(args['marker']) if args.get('marker') else None
+                timeout = float(args.get('timeout', LONGPOLL_TIMEOUT))
+                # nan would get through min/max and on to asyncio.wait_for
+                if not math.isfinite(timeout):
+                    raise ValueError(timeout)
+                timeout = min(max(timeout, 0), MAX_TIMEOUT)
+            except ValueError:
+                _response(writer, 400, _error(400, 'marker and timeout must be finite numbers'))
+                return
+            result = await wait_for_notifications(args.get('token'), marker, timeout)
+        except (InputError, AccessError) as err:
+            _response(writer, err.code, _error(err.code, err.get_description()))
+            return
+        _response(writer, 200, dumps(result))
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+def longpoll_port():
+    """
+    Returns the port the long poll server is listening on, or the one it
+    will listen on by default if it has not been started
+    """
+    if _longpoll['port'] is not None:
+        return _longpoll['port']
+    return int(config.port) + 1
+
+def start_longpoll(port=None, host='0.0.0.0'):
+    """
+    Starts the long poll server on its own thread. Does nothing if it has
+    already been started.
+
+    Arguments:
+        port (int) - port to listen on, defaults to config.port + 1
+        host (str) - address to listen on
+
+    Return Value:
+        the port being listened on
+    """
+    if _longpoll['thread'] is not None:
+        return _longpoll['port']
+    if port is None:
+        port = int(config.port) + 1
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(asyncio.start_server(_handle, host, port))
+    _longpoll['port'] = server.sockets[0].getsockname()[1]
+    with _longpoll['lock']:
+        _longpoll['loop'] = loop
+    _longpoll['thread'] = threading.Thread(target=loop.run_forever, daemon=True)
+    _longpoll['thread'].start()
+    return _longpoll['port']
@@ -1,11 +1,21 @@
 from src.data import getData
 from src.error import InputError, AccessError
-from src.helper import check_valid_info, check_members, find_user_id, get_timestamp, check_membership, check_msg_in, check_react, remove_react, react_check
+from src.sessions import find_user_id
+from src.helper import get_timestamp, check_membership, check_msg_in, check_react, remove_react, react_check
+from src.registry import valid_user, valid_channel, valid_dm, is_dreams_owner
+from src.registry import is_channel_member, is_channel_owner, is_dm_member
+from src.message_index import index_message, next_sequence, next_message_id, get_message
+from src.search_index import message_changed
+from src.stats import message_edited
+from src.notifications import notify, notify_tagged, get_notifications, notification_marker
+from src.versions import bump_message_version
+from src.events import publish_message_event
+from src.scheduler import schedule
 from datetime import datetime
 from datetime import timezone
 import pytz
 
-def message_send_v2(token, channel_id, message):
+def message_send_v2(token, channel_id, message, message_id=None):
     """
     Send a message from authorised_user to the channel specified by channel_id.
     Note: Each message should have it's own unique ID.
@@ -16,6 +26,8 @@ def message_send_v2(token, channel_id, message):
         token (str) - the user's token
         channel_id (int) - the channel's id
         message (str) - the message being sent
+        message_id (int) - the id reserved for the message when it was
+                           scheduled by message_sendlater, if it was
     
     Exceptions:
         InputError - Message is more than 1000 characters
@@ -36,7 +48,7 @@ def message_send_v2(token, channel_id, message):
     user_valid = False
     auth_user_id = find_user_id(token)
     # If token is invalid raise an Accesserror
-    user_valid = check_valid_info(data["users"], auth_user_id)
+    user_valid = valid_user(auth_user_id)
 
     if user_valid == False:
         raise AccessError(description = 'User is not a registered user')
@@ -45,65 +57,66 @@ def message_send_v2(token, channel_id, message):
     if len(message) > 1000:
         raise InputError(description= 'Too many characters. Cannot send message')
     # Check that the channel is a valid ID
-    channel_valid = check_valid_info(data['channels'], channel_id)
+    channel_valid = valid_channel(channel_id)
     
     if channel_valid is False:
         raise InputError(description= 'Channel ID invalid. Cannot send message')
     
     # Check that the user is a member of the channel they want to send a message to
-    in_channel = check_members(data['channels'], auth_user_id)
+    in_channel = is_channel_member(channel_id, auth_user_id)
     
-    for users in data['users']:
-        if users.get('auth_user_id') is auth_user_id:
-            if users.get('global_permissions') == 1:
-                dream_user = True
+    dream_user = is_dreams_owner(auth_user_id)
 
 
-    # Loop through all the message indexes for this channel and add one for
-    # this new message
-    for msg in data["messages"]:
-        if "channel_message_index" in msg:
-            msg["channel_message_index"] += 1
-
     time_created = get_timestamp()
     # Generate the message dict
 
     if channel_valid is True and in_channel is True:
+        if message_id == None:
+            message_id = next_message_id()
         new_message = {
             'message' : message,
-            'message_id': len(data['messages'])+ 1,
+            'message_id': message_id,
             'reacts' : [],
             'sender' : auth_user_id,
             'channel_id' : channel_id,
-            'message_index' : len(data['messages']) + 1, 
-            'channel_message_index' : 0,
+            'message_index' : message_id, 
+            'channel_sequence' : next_sequence('channels'),
             'time_created' : time_created,
             'is_pinned' : False, 
         }
         data['messages'].append(new_message)
+        index_message(new_message)
+        bump_message_version(new_message)
+        publish_message_event(new_message, 'new')
     
     # If the Dream owner is sending the message
     elif channel_valid is True and dream_user is True:
+        if message_id == None:
+            message_id = next_message_id()
         new_message = {
             'message' : message,
-            'message_id': len(data['messages']) + 1,
+            'message_id': message_id,
             'reacts' : [],
             'sender' : auth_user_id,
             'channel_id' : channel_id,
-            'message_index' : len(data['messages']) + 1, 
-            'channel_message_index' : 0,
+            'message_index' : message_id, 
+            'channel_sequence' : next_sequence('channels'),
             'time_created' : time_created,
             'is_pinned' : False, 
         }
         data['messages'].append(new_message)
+        index_message(new_message)
+        bump_message_version(new_message)
+        publish_message_event(new_message, 'new')
      # If channel_valid and in_channel is false, raise AccessError
     else:
         raise AccessError('User not in channel or channel does not exist')
+    notify_tagged(new_message)
 
-    print(len(data))
-    # return message_index this in a dictionary
+    # return message_id this in a dictionary
     return {
-        'message_id': len(data['messages']),
+        'message_id': message_id,
     }
 
 def message_remove_v1(token, message_id):
@@ -122,32 +135,24 @@ def message_remove_v1(token, message_id):
     Return Value:
         None
     """
-    data = getData()
     user_valid = False
     auth_user_id = find_user_id(token)
     # If token is invalid raise an Accesserror
-    user_valid = check_valid_info(data["users"], auth_user_id)
+    user_valid = valid_user(auth_user_id)
 
     if user_valid == False:
         raise AccessError(description = 'User is not a registered user')
 
-    if data['messages'][message_id-1].get('message') == "This message has been removed": 
+    target = get_message(message_id)
+    if target == None or target.get('message') == "This message has been removed": 
         raise InputError(description= "This message does not exist")
 
-    sender = data["messages"][message_id-1].get("sender") #this returns the sender of the message 
-    channel_id = data["messages"][message_id-1].get("channel_id")
-    owners_list = data["channels"][channel_id-1].get("owner_members")
+    sender = target.get("sender") #this returns the sender of the message 
+    channel_id = target.get("channel_id")
     
-    dream_owner = False
-    for users in data['users']:
-        if users.get('auth_user_id') is auth_user_id: 
-            if users.get('global_permissions') == 1:
-                dream_owner = True 
+    dream_owner = is_dreams_owner(auth_user_id)
 
-    is_owner = False 
-    for owners in owners_list: 
-        if owners.get('u_id') is auth_user_id: 
-            is_owner = True
+    is_owner = is_channel_owner(channel_id, auth_user_id)
 
     is_sender = False 
     if sender is auth_user_id: 
@@ -156,9 +161,11 @@ def message_remove_v1(token, message_id):
     if not dream_owner and not is_sender and not is_owner: 
         raise AccessError(description= "You do not have the permissions to remove this message")
 
-    for msg in data['messages']:
-        if msg['message_id'] == message_id: 
-            msg['message'] = "This message has been removed"
+    target['message'] = "This message has been removed"
+    message_changed(target)
+    bump_message_version(target)
+    publish_message_event(target, 'removed')
+    message_edited(target)
 
     return {
     }
@@ -182,16 +189,16 @@ def message_edit_v2(token, message_id, message): #remember, auth_user_id will ac
     Return Value:
         None
     """
-    data = getData()
     user_valid = False
     auth_user_id = find_user_id(token)
     # If token is invalid raise an Accesserror
-    user_valid = check_valid_info(data["users"], auth_user_id)
+    user_valid = valid_user(auth_user_id)
 
     if user_valid == False:
         raise AccessError(description = 'User is not a registered user')
 
-    if data['messages'][message_id-1].get('message') == "This message has been removed": 
+    target = get_message(message_id)
+    if target == None or target.get('message') == "This message has been removed": 
         raise InputError(description = "This message has been removed")
 
     if len(message) > 1000: 
@@ -199,21 +206,12 @@ def message_edit_v2(token, message_id, message): #remember, auth_user_id will ac
 
     #access checks: perform checks to see if they have the permissions to edit the message 
     #need to check if the user calling message edit is an owner of the channel OR an owner of dreams 
-    sender = data["messages"][message_id-1].get("sender") #this returns the sender of the message 
-    channel_id = data["messages"][message_id-1].get("channel_id")
-    owners_list = data["channels"][channel_id-1].get("owner_members")
+    sender = target.get("sender") #this returns the sender of the message 
+    channel_id = target.get("channel_id")
     
-    is_owner = False 
-    for owners in owners_list: 
-        if owners.get('u_id') is auth_user_id: 
-            is_owner = True
+    is_owner = is_channel_owner(channel_id, auth_user_id)
 
-    
-    dream_owner = False
-    for users in data['users']:
-        if users.get('auth_user_id') is auth_user_id: 
-            if users.get('global_permissions') == 1:
-                dream_owner = True 
+    dream_owner = is_dreams_owner(auth_user_id)
     
     is_sender = False 
     if sender is auth_user_id: 
@@ -222,19 +220,26 @@ def message_edit_v2(token, message_id, message): #remember, auth_user_id will ac
     if not dream_owner and not is_sender and not is_owner: 
         raise AccessError(description = "You do not have the permissions to edit this message")
 
-    for messages in data["messages"]: 
-        if messages.get("message_index") is message_id:
-            if not message: 
-                messages['message'] = "This message has been removed"
-                break 
-            #replace the current message with the message we want 
-            else:
-                messages["message"] = message
+    if not message: 
+        target['message'] = "This message has been removed"
+        message_changed(target)
+        bump_message_version(target)
+        publish_message_event(target, 'removed')
+        message_edited(target)
+    #replace the current message with the message we want 
+    else:
+        old_text = target.get("message")
+        target["message"] = message
+        message_changed(target)
+        bump_message_version(target)
+        publish_message_event(target, 'edited')
+        # Users already tagged before the edit have been notified once
+        notify_tagged(target, old_text)
         
     return {
     }
 
-def message_senddm_v1(token, dm_id, message):
+def message_senddm_v1(token, dm_id, message, message_id=None):
     """
     Send a message from authorised_user to the DM specified by dm_id.
     Note: Each message should have it's own unique ID.
@@ -245,6 +250,8 @@ def message_senddm_v1(token, dm_id, message):
         token (str) - the user's token
         dm_id (int) - the dm's id
         message (str) - the message being sent
+        message_id (int) - the id reserved for the message when it was
+                           scheduled by message_sendlaterdm, if it was
     
     Exceptions:
         InputError - Message is more than 1000 characters
@@ -258,16 +265,12 @@ def message_senddm_v1(token, dm_id, message):
     user_valid = False
     auth_user_id = find_user_id(token)
     # If token is invalid raise an Accesserror
-    user_valid = check_valid_info(data["users"], auth_user_id)
+    user_valid = valid_user(auth_user_id)
 
     if user_valid == False:
         raise AccessError(description = 'User is not a registered user')
 
-    membs_list = []
-    for membs in data["dm"][dm_id - 1]['all_members']:
-        membs_list.append(membs["u_id"])
- 
-    if auth_user_id not in membs_list:
+    if not is_dm_member(dm_id, auth_user_id):
         raise AccessError(description = "Authorised user is not a member of the DM they are trying to post to") 
         
             
@@ -279,27 +282,28 @@ def message_senddm_v1(token, dm_id, message):
     if len(message) > 1000:
         raise InputError(description= "Message is more than 1000 characters")
        
-    message_id = len(data["messages"]) + 1
+    if message_id == None:
+        message_id = next_message_id()
 
  
-    for msg in data["messages"]:
-        if "dm_message_index" in msg:
-            msg["dm_message_index"] += 1
-    
     time_created = get_timestamp()
     
     new_message_reg = { "message": message,
-                        'message_id': len(data['messages']) + 1,
+                        'message_id': message_id,
                         'reacts' : [],
                         "sender": auth_user_id,
                         'dm_id': dm_id,
-                        'message_index': len(data['messages']) + 1,
-                        "dm_message_index": 0,
+                        'message_index': message_id,
+                        "dm_sequence": next_sequence('dms'),
                         'time_created' : time_created,  
                         'is_pinned': False,
                         }
 
     data["messages"].append(new_message_reg)
+    index_message(new_message_reg)
+    bump_message_version(new_message_reg)
+    publish_message_event(new_message_reg, 'new')
+    notify_tagged(new_message_reg)
     
     return {
             'message_id': message_id,
@@ -332,32 +336,21 @@ def message_share_v1(token, og_message_id, message, channel_id, dm_id):
     user_valid = False
     auth_user_id = find_user_id(token)
     # If token is invalid raise an Accesserror
-    user_valid = check_valid_info(data["users"], auth_user_id)
+    user_valid = valid_user(auth_user_id)
 
     if user_valid == False:
         raise AccessError(description = 'Invalid user')
 
-    membs_list_channel = []
-    membs_list_dm = []
-        
-    if data.get("share_message_id_counter") == None:
-        data["share_message_id_counter"] = [1]
-    
-    shared_message_id = data["share_message_id_counter"][0]
-     
     #raise input error 
     if len(message) > 1000:
         raise InputError(description = "Message is more than 1000 characters")
 
    
-    #if bool(data):
-    message_id = len(data["messages"]) + 1
-  
-    
     #find the message that corresponds to og_message_id
-    for msg in data["messages"]:
-        if msg["message_index"] == og_message_id:
-            og_msg = msg["message"] 
+    og_message = get_message(og_message_id)
+    if og_message == None:
+        raise InputError(description = "The message being shared does not exist")
+    og_msg = og_message["message"] 
     
     shared_message = message + " " + og_msg
 
@@ -368,29 +361,24 @@ def message_share_v1(token, og_message_id, message, channel_id, dm_id):
     if channel_id == -1:
 
         #raising accesserror
-        for key in data["dm"]:
-            if key.get("dm_id") == dm_id:
-                members_dict_list = key.get('all_members')
-                for user in members_dict_list:
-                    membs_list_dm.append(user["u_id"])
-                if auth_user_id not in membs_list_dm:
-                    raise AccessError(description= "The authorised user has not joined the dm they are trying to share the message to")
+        if not is_dm_member(dm_id, auth_user_id):
+            raise AccessError(description= "The authorised user has not joined the dm they are trying to share the message to")
+
+        message_id = next_message_id()
 
-        
-        for dm_msg in data["messages"]:
-            if "dm_message_index" in dm_msg:
-                dm_msg["dm_message_index"] += 1    
-        
         msg_shared_dm_reg = { "message": shared_message,
-                             'message_id': len(data['messages']) + 1,
+                             'message_id': message_id,
                              'reacts' : [],
                              "sender": auth_user_id,
                              'dm_id': dm_id,
                              'message_index': message_id,
-                             'shared_message_id': shared_message_id,
-                             "dm_message_index": 0,
+                             "dm_sequence": next_sequence('dms'),
                              'time_created' : time_created }
         data["messages"].append(msg_shared_dm_reg)
+        index_message(msg_shared_dm_reg)
+        bump_message_version(msg_shared_dm_reg)
+        publish_message_event(msg_shared_dm_reg, 'new')
+        notify_tagged(msg_shared_dm_reg)
         
 
         
@@ -398,33 +386,29 @@ def message_share_v1(token, og_message_id, message, channel_id, dm_id):
     if dm_id == -1:
         
         #raising accesserror
-        for membs in data["channels"][channel_id - 1]['all_members']:
-            membs_list_channel.append(membs["u_id"])
-            
-        if auth_user_id not in membs_list_channel:
+        if not is_channel_member(channel_id, auth_user_id):
             raise AccessError(description = "The authorised user has not joined the channel they are trying to share the message to")   
+
+        message_id = next_message_id()
         
         
-        for chan_msg in data["messages"]:
-            if "channel_message_index" in chan_msg:
-                chan_msg["channel_message_index"] += 1
-        
         msg_shared_channel_reg = { "message": shared_message,
-                                   'message_id': len(data['messages']) + 1,
+                                   'message_id': message_id,
                                    'reacts' : [],
                                    "sender": auth_user_id,
                                    'channel_id': channel_id,
                                    'message_index': message_id,
-                                   'shared_message_id': shared_message_id,
-                                   "channel_message_index": 0,
+                                   "channel_sequence": next_sequence('channels'),
                                    'time_created' : time_created }
             
         data["messages"].append(msg_shared_channel_reg )
+        index_message(msg_shared_channel_reg)
+        bump_message_version(msg_shared_channel_reg)
+        publish_message_event(msg_shared_channel_reg, 'new')
+        notify_tagged(msg_shared_channel_reg)
     
 
-    data["share_message_id_counter"][0] += 1
-
-    return {'shared_message_id' : shared_message_id
+    return {'shared_message_id' : message_id
     }    
 
 
@@ -444,148 +428,21 @@ def notifications_get_v1(token):
             - channel_id, 
             - dm_id, 
             - notification_message
+        marker (int) - changes whenever the user gets a new notification, for
+                       long polling notifications/get (see src/longpoll.py)
     """
-    data = getData()
     user_valid = False
-    adder = False
-    joiner = False
     auth_user_id = find_user_id(token)
     # If token is invalid raise an Accesserror
-    user_valid = check_valid_info(data["users"], auth_user_id)
+    user_valid = valid_user(auth_user_id)
 
     if user_valid == False:
         raise AccessError('User is not a registered user')
 
-    user_handle = data["users"][auth_user_id - 1]["handle_str"]
-    mentioned_handle = "@" + user_handle
-    notifications = []
-    
-    
-    if "channels" in data:
-        for channel in data["channels"]:
-            for membs in channel['all_members']:
-                if auth_user_id == membs["u_id"] and auth_user_id != channel["creator"]:
-                    #need to find out the adder of the token user
-                    for reg in data["added_info"]["channels"]:
-                        if reg["u_id"] == auth_user_id and reg["channel_id"] == channel["channel_id"]:
-                            if reg.get('adder'):
-                                adder_handle = reg["adder"]
-                                adder = True
-                            if reg.get('joiner'):
-                                joiner_handle = reg['joiner']
-                                joiner = True
-                                
-                    if adder:        
-                        channel_name = channel["name"] 
-                        
-                        notification_added_channel = {"channel_id": channel["channel_id"],
-                                                    "dm_id": -1,
-                                                    "notification_message": f"{adder_handle} added you to {channel_name}"   
-                                                    }  
-                        notifications.append(notification_added_channel)  
-                    if joiner:
-                        channel_name = channel["name"] 
-                    
-                        notification_added_channel = {"channel_id": channel["channel_id"],
-                                                    "dm_id": -1,
-                                                    "notification_message": f"{joiner_handle} joined {channel_name}"   
-                                                    }  
-                        notifications.append(notification_added_channel)  
-       
-        
-    if "dm" in data:
-        for dm in data["dm"]:
-            for membs in dm['all_members']:
-                if auth_user_id == membs["u_id"] and auth_user_id != dm["creator"]:        
-                    #need to find the adder of the token user
-                    for reg in data["added_info"]["dms"]:
-                        if reg["u_id"] == auth_user_id and reg["dm_id"] == dm["dm_id"]:
-                            adder_handle = reg["adder"]
-                                        
-                    dm_name = dm["dm_name"]
-                    
-                    notification_added_dm = {"channel_id": -1,
-                                             "dm_id": dm["dm_id"],
-                                             "notification_message": f"{adder_handle} added you to {dm_name}"   
-                                            }  
-                    notifications.append(notification_added_dm)
-
-
-    if "messages" in data:
-        for msg in data["messages"]:
-            #check every single message output and check if user was @userhandle was mentioned in any of those messages 
-            if mentioned_handle in msg["message"]:
-                if "dm_id" in msg:                                
-                    dm_name = data["dm"][msg["dm_id"] - 1]["dm_name"]
-                    sender_handle = data["users"][msg["sender"] - 1]["handle_str"]            
-                    message = msg["message"]
-
-                    notification_mentioned = {"channel_id": -1,
-                                              "dm_id": msg["dm_id"],
-                                              "notification_message": f"{sender_handle} tagged you in {dm_name} : {message[0:20]}"   
-                                             }  
-                    notifications.append(notification_mentioned)
-                
-                if "channel_id" in msg:
-                    channel_name = data["channels"][msg["channel_id"] - 1]["name"]
-                    sender_handle = data["users"][msg["sender"] - 1]["handle_str"] 
-                    message = msg["message"]
-                   
-                    notification_mentioned = {"channel_id": msg["channel_id"],
-                                              "dm_id": -1,
-                                              "notification_message": f"{sender_handle} tagged you in {channel_name} : {message[0:20]}"   
-                                             }
-                    notifications.append(notification_mentioned)
-            #check every single message output ahd check if there are reacts in that message
-            #for msg in data["messages"]:
-            if bool(msg["reacts"]) and msg["sender"] == auth_user_id: 
-                #for reg_react in msg["reacts"]:
-                    #if auth_user_id not in reg_react["u_ids"]:
-                    #so far we have checked that IF there are reacts in a message
-                if "dm_id" in msg: 
-                    for reg in data["added_info"]["reacts"]:
-                        #if someone has reacted to the user token
-                        if reg["u_id"] == auth_user_id:
-                            reactor_handle = reg["reactor"]
-                            platform_name = reg["platform_name"]
-                            notification_reacted = {"channel_id": -1,
-                                                    "dm_id": msg["dm_id"],
-                                                    "notification_message": f"{reactor_handle} reacted to your message in {platform_name}"   
-                                                   }
-                            notifications.append(notification_reacted)
-                    
-                if "channel_id" in msg:  
-                    for reg in data["added_info"]["reacts"]:
-                        if reg["u_id"] == auth_user_id:
-                            #reacted message: "{User?s handle} reacted to your message in {channel/DM name}"
-                            reactor_handle = reg["reactor"]
-                            platform_name = reg["platform_name"]
-                            notification_reacted = {"channel_id": msg["channel_id"],
-                                                    "dm_id": -1,
-                                                    "notification_message": f"{reactor_handle} reacted to your message in {platform_name}"   
-                                                   }
-                            notifications.append(notification_reacted)
-                            
-                            
-                               
-    
-    
-    
-    
-    notifications.reverse()
-    
-    final_output = []
-    index = 0
-    
-    if len(notifications) <= 20:
-        final_output = notifications
-    else: #length would be >20 so need to output only first 20
-        while index < 20:
-            final_output.append(notifications[index])
-            index += 1
-        
-
-    return { "notifications" : final_output
+    # Notifications are added to the user's feed as they happen, so only the
+    # feed needs to be read
+    return { "notifications" : get_notifications(auth_user_id),
+             "marker" : notification_marker(auth_user_id)
     }
     
 def message_react_v1(token, message_id, react_id):
@@ -621,34 +478,26 @@ def message_react_v1(token, message_id, react_id):
     
     
     #input error if message is not a valid message id
-    invalid_message = False
-    for message in data["messages"]:
-        if message["message_id"] == message_id:
-            invalid_message = True
+    target = get_message(message_id)
     
-    if invalid_message == False:
+    if target == None:
         raise InputError(description = 'Message id is not a valid')
             
     
     #access error if user not in platform that message_id corresponds to
     in_platform = False
     
-    if "dm_id" in data["messages"][message_id - 1]:
-        dm_id = data["messages"][message_id - 1]["dm_id"]
+    if "dm_id" in target:
+        dm_id = target["dm_id"]
         platform_name = data["dm"][dm_id - 1]["dm_name"]
         #check if user is a member of that dm
-        for membs in data["dm"][dm_id - 1]['all_members']:
-            if membs["u_id"] == auth_user_id:
-                in_platform = True
+        in_platform = is_dm_member(dm_id, auth_user_id)
   
-    if "channel_id" in data["messages"][message_id - 1]:
-        channel_id = data["messages"][message_id - 1]["channel_id"]
+    if "channel_id" in target:
+        channel_id = target["channel_id"]
         platform_name = data["channels"][channel_id - 1]["name"]
         #check if user a member of that channel
-        for membs in data["channels"][channel_id - 1]['all_members']:
-            if membs["u_id"] == auth_user_id:
-                in_platform = True        
-        
+        in_platform = is_channel_member(channel_id, auth_user_id)
     
     if in_platform == False:
         raise AccessError(description = 'User is not a member of the channel or dm that the message is in')
@@ -657,12 +506,12 @@ def message_react_v1(token, message_id, react_id):
     
     #input error if Message with ID message_id already contains an active React with ID react_id from the authorised user 
     
-    if bool(data["messages"][message_id - 1]["reacts"]):
-        #if bool(data["messages"][message_id - 1]["reacts"][react_id - 1]):
-            if auth_user_id in data["messages"][message_id - 1]["reacts"][react_id - 1]["u_ids"]:
+    if bool(target["reacts"]):
+        #if bool(target["reacts"][react_id - 1]):
+            if auth_user_id in target["reacts"][react_id - 1]["u_ids"]:
                 raise InputError(description = 'Already contains an active react from the authorised user' )
     
-    sender = data["messages"][message_id - 1]["sender"]
+    sender = target["sender"]
     
        
     if sender == auth_user_id:    
@@ -680,8 +529,8 @@ def message_react_v1(token, message_id, react_id):
     
                    
 
-    if bool(data["messages"][message_id - 1]["reacts"]):
-        for r in data["messages"][message_id - 1]["reacts"]:
+    if bool(target["reacts"]):
+        for r in target["reacts"]:
             if r["react_id"] == react_id:
                 r["u_ids"].append(auth_user_id)
                 if sender == auth_user_id:
@@ -689,7 +538,7 @@ def message_react_v1(token, message_id, react_id):
                 
     else:
         #append a new react reg
-        data["messages"][message_id - 1]["reacts"].append(react_reg)
+        target["reacts"].append(react_reg)
 
     
  
@@ -698,18 +547,13 @@ def message_react_v1(token, message_id, react_id):
     #THE FOLLOWING CODE IS TO SUPPORT THE NOTIFICIATIONS GET FUNCTION
     
     if sender is not auth_user_id:
-        if data.get("added_info") == None:
-            data["added_info"] = { }
-        
-        if data["added_info"].get("reacts") == None:
-            data["added_info"]["reacts"] = []
-        
-        
-        info_dict = {"u_id": data["messages"][message_id - 1]["sender"],
-                     "platform_name" : platform_name,
-                     "reactor" : data["users"][auth_user_id - 1]["handle_str"]
-                    }
-        data["added_info"]["reacts"].append(info_dict)
+        reactor = data["users"][auth_user_id - 1]["handle_str"]
+        if "dm_id" in target:
+            notify(sender, -1, dm_id, f"{reactor} reacted to your message in {platform_name}")
+        else:
+            notify(sender, channel_id, -1, f"{reactor} reacted to your message in {platform_name}")
+    bump_message_version(target)
+    publish_message_event(target, 'reacted')
     return { } 
 
 
@@ -744,7 +588,7 @@ def message_unreact_v1(token, message_id, react_id):
     if not react_valid:
         raise InputError(description= 'React invalid')
 
-    user_valid = check_valid_info(data['users'], auth_user_id)
+    user_valid = valid_user(auth_user_id)
     if not user_valid:
         raise AccessError(description = 'User is not a valid member')
 
@@ -756,6 +600,9 @@ def message_unreact_v1(token, message_id, react_id):
             if check_react(auth_user_id, message_id, react_id):
                 # If react found, remove react
                 remove_react(auth_user_id, message_id, react_id)
+                unreacted = get_message(message_id)
+                bump_message_version(unreacted)
+                publish_message_event(unreacted, 'unreacted')
             else:
                 raise InputError(description = 'You have not reacted to this message')
         else:
@@ -789,38 +636,33 @@ def message_pin_v1(token, message_id):
     if auth_user_id == False: 
         raise AccessError(description="This is not a valid user")
 
-    message_id_valid = check_valid_info(data['messages'], message_id)
-    if message_id_valid == False: 
+    target = get_message(message_id)
+    if target == None: 
         raise InputError(description= "This is not a valid message")
 
-    for message in data["messages"]: 
-        if message.get("message_id") == message_id: 
-            if message.get("is_pinned") == True: 
-                raise InputError(description= "This message is already pinned") 
+    if target.get("is_pinned") == True: 
+        raise InputError(description= "This message is already pinned") 
     
     #get the channel or dm_id
     #first have to check if the message_id belongs to a dm or a channel by checking the keys of that data message dict 
-    if "dm_id" in data["messages"][message_id - 1]: 
-        dm_id = data["messages"][message_id - 1].get("dm_id")
-        members_list = data["dm"][dm_id - 1]['all_members']
+    if "dm_id" in target: 
+        dm_id = target.get("dm_id")
         creator =  data["dm"][dm_id - 1]["creator"]
-        check_member = check_valid_info(members_list, auth_user_id)
+        check_member = is_dm_member(dm_id, auth_user_id)
         if creator != auth_user_id or check_member == False: 
             raise AccessError(description="You do not have the permissions to pin this message")
 
-    if "channel_id" in data["messages"][message_id - 1]: 
-        channel_id = data["messages"][message_id - 1].get("channel_id")
-        members_list = data["channels"][channel_id - 1]['all_members']
-        owners_list = data["channels"][channel_id - 1]["owner_members"]
-        check_owner = check_valid_info(owners_list, auth_user_id)
-        check_member = check_valid_info(members_list, auth_user_id)
+    if "channel_id" in target: 
+        channel_id = target.get("channel_id")
+        check_owner = is_channel_owner(channel_id, auth_user_id)
+        check_member = is_channel_member(channel_id, auth_user_id)
         if check_owner == False or check_member == False: 
             raise AccessError(description="You do not have the permissions to pin this message")
 
     #if all input and access errors are bypassed, meaning everything is valid, pin the message
-    for message in data["messages"]: 
-        if message.get("message_id") == message_id: 
-            message["is_pinned"] = True
+    target["is_pinned"] = True
+    bump_message_version(target)
+    publish_message_event(target, 'pinned')
 
     return {
 
@@ -850,34 +692,31 @@ def message_unpin_v1(token, message_id):
     if auth_user_id == False: 
         raise AccessError(description="This is not a valid user")
 
-    message_id_valid = check_valid_info(data['messages'], message_id)
-    if message_id_valid == False: 
+    target = get_message(message_id)
+    if target == None: 
         raise InputError(description= "This is not a valid message")
 
-    for message in data["messages"]: 
-        if message.get("message_id") == message_id: 
-            if message.get("is_pinned") == False: 
-                raise InputError(description= "This message is already unpinned") 
+    if target.get("is_pinned") == False: 
+        raise InputError(description= "This message is already unpinned") 
     
     #get the channel or dm_id
     #first have to check if the message_id belongs to a dm or a channel by checking the keys of that data message dict 
-    if "dm_id" in data["messages"][message_id - 1]: 
-        dm_id = data["messages"][message_id - 1].get("dm_id")
+    if "dm_id" in target: 
+        dm_id = target.get("dm_id")
         creator =  data["dm"][dm_id - 1]["creator"]
         if creator != auth_user_id: 
             raise AccessError(description="You do not have the permissions to unpin this message")
 
-    if "channel_id" in data["messages"][message_id - 1]: 
-        channel_id = data["messages"][message_id - 1].get("channel_id")
-        owners_list = data["channels"][channel_id - 1]["owner_members"]
-        check_owner = check_valid_info(owners_list, auth_user_id)
+    if "channel_id" in target: 
+        channel_id = target.get("channel_id")
+        check_owner = is_channel_owner(channel_id, auth_user_id)
         if check_owner == False: 
             raise AccessError(description="You do not have the permissions to unpin this message")
     
     #if all input and access errors are bypassed, meaning everything is valid, unpin the message
-    for message in data["messages"]: 
-        if message.get("message_id") == message_id: 
-            message["is_pinned"] = False
+    target["is_pinned"] = False
+    bump_message_version(target)
+    publish_message_event(target, 'unpinned')
 
     return {
 
@@ -902,19 +741,17 @@ def message_sendlater_v1(token, channel_id, message, time_sent):
     Return Value:
         message_id (int) - the message's id
     """
-    data = getData()
-    empty_msgs = False
     auth_user_id = find_user_id(token)
     if auth_user_id == False: 
         raise AccessError(description= 'This is not a valid user')
     
-    channel_valid = check_valid_info(data["channels"], channel_id)
+    channel_valid = valid_channel(channel_id)
 
     if channel_valid == False: 
         raise InputError(description= 'This is not a valid channel')
     
     # If token is invalid raise an Accesserror
-    user_valid = check_valid_info(data["channels"][channel_id-1].get('all_members'), auth_user_id)
+    user_valid = is_channel_member(channel_id, auth_user_id)
 
     if user_valid == False:
             raise AccessError(description='User is not apart of this channel')
@@ -928,26 +765,18 @@ def message_sendlater_v1(token, channel_id, message, time_sent):
     if time_sent < timestamp: 
         raise InputError(description= "You cannot send a message to the past")
 
-    #create an empty send_later dictionary to store the messages 
-    if data.get("send_later") == None: 
-        data["send_later"] = [] 
-
-    if data.get("messages") == None: 
-        data["messages"] = []
-        empty_msgs = True
-
+    # The id is reserved now so it can be returned, and is given to the
+    # message when the scheduler sends it
+    message_id = next_message_id()
     new_reg = {
             "token" : token,
             "message": message, 
             "channel_id": channel_id,
+            "message_id": message_id,
             "time_sent": time_sent,  #time for it to be sent in the future 
     }
-    data["send_later"].append(new_reg)
-    #data["messages"].append({"message_id" : "id of message to be sent later"})
-    if empty_msgs:
-        message_id = 1
-    else: 
-        message_id = len(data['messages'])
+    # The scheduler sends the message once time_sent is reached
+    schedule(new_reg)
     
     return {"message_id" : message_id}
 
@@ -974,21 +803,18 @@ def message_sendlaterdm_v1(token, dm_id, message, time_sent):
         message_id (int) - the message's id
     """
 
-    data = getData()
-    empty_msgs = False
-
     auth_user_id = find_user_id(token)
     if auth_user_id == False: 
         raise AccessError(description= 'This is not a valid user')
     #check if dm is valid
-    dm_valid = check_valid_info(data["dm"], dm_id)
+    dm_valid = valid_dm(dm_id)
 
     #raise InputError if dm is invalid
     if dm_valid == False:
         raise InputError('dm is not valid')
 
     #check if user is valid
-    user_valid = check_valid_info(data["dm"][dm_id-1].get('all_members'), auth_user_id)
+    user_valid = is_dm_member(dm_id, auth_user_id)
 
     #raise AccessError is user is not valid
     if user_valid == False:
@@ -1005,26 +831,18 @@ def message_sendlaterdm_v1(token, dm_id, message, time_sent):
     if time_sent < timestamp: 
         raise InputError(description = "You cannot send a message to the past")
 
-    #create an empty send_later dictionary to store the messages 
-    if data.get("send_later") == None: 
-        data["send_later"] = [] 
-
-    if data.get("messages") == None: 
-        data["messages"] = []
-        empty_msgs = True
-
+    # The id is reserved now so it can be returned, and is given to the
+    # message when the scheduler sends it
+    message_id = next_message_id()
     new_reg = {
             "token" : token,
             "message": message, 
             "dm_id": dm_id,
+            "message_id": message_id,
             "time_sent": time_sent,  #time for it to be sent in the future 
     }
-    data["send_later"].append(new_reg)
-    #data["messages"].append({"message_id" : "id of message to be sent later"})
-    if empty_msgs:
-        message_id = 1
-    else: 
-        message_id = len(data['messages'])
+    # The scheduler sends the message once time_sent is reached
+    schedule(new_reg)
     return {
             'message_id': message_id,
     }
@@ -0,0 +1,216 @@
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from json import dumps, loads
+from src.data import getData
+from src.error import InputError
+
+# data['conversation_messages'] holds the ids of the messages sent to each
+# channel and dm in the order they were sent, so a page of one conversation
+# can be read without going through every message in data['messages'].
+# Keys are the channel/dm id as a string so the index survives json.
+
+def _get_index():
+    """
+    Returns the conversation index, building it from data['messages'] if it
+    has not been built yet (e.g. a database.json from before the index existed)
+    """
+    data = getData()
+    if data.get('conversation_messages') == None:
+        index = {'channels' : {}, 'dms' : {}}
+        for msg in data.get('messages', []):
+            if msg.get('channel_id') != None:
+                index['channels'].setdefault(str(msg['channel_id']), []).append(msg['message_id'])
+            elif msg.get('dm_id') != None:
+                index['dms'].setdefault(str(msg['dm_id']), []).append(msg['message_id'])
+        data['conversation_messages'] = index
+    return data['conversation_messages']
+
+def index_message(message):
+    """
+    Adds a newly sent message to the index of the channel or dm it was sent to
+
+    Arguments:
+        message (dict) - the message as stored in data['messages']
+
+    Return Value:
+        None
+    """
+    index = _get_index()
+    if message.get('channel_id') != None:
+        conversations = index['channels']
+        key = str(message['channel_id'])
+    else:
+        conversations = index['dms']
+        key = str(message['dm_id'])
+
+    if conversations.get(key) == None:
+        conversations[key] = []
+    conversations[key].append(message['message_id'])
+
+def conversation_message_ids(kind, conversation_id):
+    """
+    Returns the ids of the messages sent to a channel or dm, oldest first
+
+    Arguments:
+        kind (str) - 'channels' or 'dms'
+        conversation_id (int) - the channel or dm's id
+
+    Return Value:
+        list of message ids
+    """
+    return _get_index()[kind].get(str(conversation_id), [])
+
+# Each channel message stores the order it was sent in amongst all channel
+# messages as 'channel_sequence' (and dm messages as 'dm_sequence'). The
+# channel_message_index/dm_message_index of a message (how many messages
+# were sent after it) is worked out from this when it is read, so sending a
+# message no longer has to renumber every message before it.
+
+_SEQUENCE_KEYS = {
+    'channels' : ('channel_sequence', 'channel_message_index'),
+    'dms' : ('dm_sequence', 'dm_message_index'),
+}
+
+def _get_sequence():
+    """
+    Returns the count of channel and dm messages sent so far, converting any
+    messages that still have a stored message index to a sequence number
+    """
+    data = getData()
+    if data.get('message_sequence') == None:
+        sequence = {'channels' : 0, 'dms' : 0}
+        for kind, (sequence_key, index_key) in _SEQUENCE_KEYS.items():
+            stored = [msg for msg in data.get('messages', []) if index_key in msg]
+            sequence[kind] = len(stored)
+            for msg in stored:
+                msg[sequence_key] = len(stored) - 1 - msg[index_key]
+                del msg[index_key]
+        data['message_sequence'] = sequence
+    return data['message_sequence']
+
+def next_sequence(kind):
+    """
+    Returns the sequence number for a new channel or dm message
+
+    Arguments:
+        kind (str) - 'channels' or 'dms'
+
+    Return Value:
+        sequence number (int)
+    """
+    sequence = _get_sequence()
+    number = sequence[kind]
+    sequence[kind] += 1
+    return number
+
+def channel_message_index(message):
+    """
+    Returns the number of channel messages sent after this message
+    """
+    return _get_sequence()['channels'] - 1 - message['channel_sequence']
+
+def dm_message_index(message):
+    """
+    Returns the number of dm messages sent after this message
+    """
+    return _get_sequence()['dms'] - 1 - message['dm_sequence']
+
+# Message ids are handed out by next_message_id() from data['message_id_counter'],
+# so ids never depend on where a message is in data['messages']. get_message()
+# finds a message by id through a map from id to position in data['messages'],
+# which is kept in memory and filled in as messages are appended.
+
+_by_id = {
+    'messages' : None,
+    'seen' : 0,
+    'positions' : {},
+}
+
+def next_message_id():
+    """
+    Returns a new message id, shared by sent and shared messages in both
+    channels and dms
+    """
+    data = getData()
+    if data.get('message_id_counter') == None:
+        ids = [msg['message_id'] for msg in data.get('messages', []) if isinstance(msg.get('message_id'), int)]
+        data['message_id_counter'] = max(ids, default=0)
+    data['message_id_counter'] += 1
+    return data['message_id_counter']
+
+def _sync_positions():
+    messages = getData().get('messages')
+    if messages is None:
+        messages = []
+    if messages is not _by_id['messages'] or len(messages) < _by_id['seen']:
+        _by_id['messages'] = messages
+        _by_id['seen'] = 0
+        _by_id['positions'] = {}
+    for position in range(_by_id['seen'], len(messages)):
+        _by_id['positions'][messages[position].get('message_id')] = position
+    _by_id['seen'] = len(messages)
+    return messages
+
+def get_message(message_id):
+    """
+    Returns the message with this id from data['messages'], or None if there
+    is no such message
+    """
+    if not isinstance(message_id, int):
+        return None
+    messages = _sync_positions()
+    position = _by_id['positions'].get(message_id)
+    if position is None or messages[position].get('message_id') != message_id:
+        return None
+    return messages[position]
+
+# Cursors for paging through a channel or dm from the most recent message
+# back. A cursor holds a position in the conversation's list of message ids
+# above, which only ever grows at the end, so the position of a message
+# never changes when new messages are sent while a client is scrolling and
+# resuming from a cursor is a slice rather than a search.
+
+PAGE_SIZE = 50
+
+def encode_cursor(kind, conversation_id, position):
+    """
+    Returns an opaque cursor for a position in a conversation's messages
+    """
+    cursor = dumps({'kind' : kind, 'id' : conversation_id, 'position' : position})
+    return urlsafe_b64encode(cursor.encode()).decode()
+
+def message_page(kind, conversation_id, cursor):
+    """
+    Returns a page of up to 50 message ids from a channel or dm, most recent
+    first, and the cursor for the page after it
+
+    Arguments:
+        kind (str) - 'channels' or 'dms'
+        conversation_id (int) - the channel or dm's id
+        cursor (str) - a cursor returned by an earlier page, or '' for the
+                       most recent page
+
+    Exceptions:
+        InputError - cursor is not a cursor for this channel or dm
+
+    Return Value:
+        (list of message ids, cursor of the next page or None if this page
+         has the least recent messages)
+    """
+    message_ids = conversation_message_ids(kind, conversation_id)
+    if not cursor:
+        position = len(message_ids)
+    else:
+        try:
+            decoded = loads(urlsafe_b64decode(cursor.encode()).decode())
+            position = decoded['position']
+            valid = decoded['kind'] == kind and decoded['id'] == conversation_id
+        except (ValueError, KeyError, TypeError):
+            valid = False
+        if not valid or not isinstance(position, int) or not 0 <= position <= len(message_ids):
+            raise InputError(description = 'Invalid cursor')
+
+    page_start = max(0, position - PAGE_SIZE)
+    page = list(message_ids[page_start:position])
+    page.reverse()
+    next_cursor = encode_cursor(kind, conversation_id, page_start) if page_start > 0 else None
+    return page, next_cursor
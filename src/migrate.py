@@ -0,0 +1,46 @@
+import sys
+from src.data import getData
+from src.persistence import restore, flush, STATE_LOCK
+from src.workspace import export_lines, read_workspace, install_workspace
+
+# Command line entry point for moving workspaces in and out of the database
+# in database.json/database.log without running the server:
+#
+#     python3 -m src.migrate export workspace.ndjson
+#     python3 -m src.migrate import workspace.ndjson
+#
+# Don't run an import while the server is running on the same database, as
+# the server will not see it and will overwrite it.
+
+USAGE = 'usage: python3 -m src.migrate (export|import) FILE'
+
+def export_to(path):
+    with open(path, 'w') as file:
+        for chunk in export_lines():
+            file.write(chunk)
+
+def import_from(path):
+    with open(path) as file:
+        workspace, counts = read_workspace(file)
+    with STATE_LOCK:
+        install_workspace(workspace)
+        flush()
+    return counts
+
+def main(argv):
+    if len(argv) != 3 or argv[1] not in ('export', 'import'):
+        print(USAGE, file=sys.stderr)
+        return 2
+    wal = restore(getData())
+    try:
+        if argv[1] == 'export':
+            export_to(argv[2])
+        else:
+            for key, count in import_from(argv[2]).items():
+                print(f'{key}: {count}')
+    finally:
+        wal.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
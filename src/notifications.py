@@ -0,0 +1,112 @@
+import re
+from src.data import getData
+from src.registry import get_user, get_channel, get_dm, user_by_handle
+from src.versions import bump_version
+from src.longpoll import notification_added
+
+# Each user's notifications are kept in data['notifications'] as a ring
+# buffer of their most recent 20, keyed by their u_id as a string. They are
+# added when the user is added to a channel/dm, joins a channel, is tagged in
+# a message or has a message reacted to, so notifications/get only has to
+# read the buffer back. Each feed also counts every notification it has ever
+# had, which is the marker long polls wait to change (see src/longpoll.py).
+
+NOTIFICATION_LIMIT = 20
+
+def _get_feed(u_id):
+    data = getData()
+    if data.get('notifications') == None:
+        data['notifications'] = {}
+    if data['notifications'].get(str(u_id)) == None:
+        data['notifications'][str(u_id)] = {'items' : [], 'next' : 0}
+    return data['notifications'][str(u_id)]
+
+def notify(u_id, channel_id, dm_id, notification_message):
+    """
+    Adds a notification to a user's feed, replacing their oldest one if
+    they already have 20
+
+    Arguments:
+        u_id (int) - the user being notified
+        channel_id (int) - the channel the notification is about, or -1
+        dm_id (int) - the dm the notification is about, or -1
+        notification_message (str) - the text of the notification
+
+    Return Value:
+        None
+    """
+    feed = _get_feed(u_id)
+    feed['count'] = feed.get('count', len(feed['items'])) + 1
+    notification = {
+        'channel_id' : channel_id,
+        'dm_id' : dm_id,
+        'notification_message' : notification_message,
+    }
+    if len(feed['items']) < NOTIFICATION_LIMIT:
+        feed['items'].append(notification)
+    else:
+        feed['items'][feed['next']] = notification
+        feed['next'] = (feed['next'] + 1) % NOTIFICATION_LIMIT
+    bump_version('notifications', u_id)
+    notification_added(u_id)
+
+def _tagged_users(text):
+    tagged = []
+    for handle in re.findall(r'@(\w+)', text or ''):
+        u_id = user_by_handle(handle)
+        if u_id != None and u_id not in tagged:
+            tagged.append(u_id)
+    return tagged
+
+def notify_tagged(message, old_text=None):
+    """
+    Notifies every user tagged with @handle in a message. After an edit,
+    only the users tagged in the new text but not the old one are notified.
+
+    Arguments:
+        message (dict) - the message as stored in data['messages']
+        old_text (str) - the text of the message before it was edited
+
+    Return Value:
+        None
+    """
+    text = message.get('message')
+    if '@' not in text:
+        return
+    already_tagged = set(_tagged_users(old_text))
+    tagged = [u_id for u_id in _tagged_users(text) if u_id not in already_tagged]
+    if not tagged:
+        return
+    if message.get('channel_id') != None:
+        channel_id = message['channel_id']
+        dm_id = -1
+        conversation_name = get_channel(channel_id).get('name')
+    else:
+        channel_id = -1
+        dm_id = message['dm_id']
+        conversation_name = get_dm(dm_id).get('dm_name')
+    sender_handle = get_user(message.get('sender')).get('handle_str')
+
+    for u_id in tagged:
+        notify(u_id, channel_id, dm_id, f"{sender_handle} tagged you in {conversation_name} : {text[0:20]}")
+
+def notification_marker(u_id):
+    """
+    Returns the number of notifications a user has ever had
+    """
+    feed = getData().get('notifications', {}).get(str(u_id))
+    if feed == None:
+        return 0
+    return feed.get('count', len(feed['items']))
+
+def get_notifications(u_id):
+    """
+    Returns a user's notifications, most recent first
+    """
+    feed = getData().get('notifications', {}).get(str(u_id))
+    if feed == None:
+        return []
+    items = feed['items']
+    ordered = list(items[feed['next']:]) + list(items[:feed['next']])
+    ordered.reverse()
+    return ordered
@@ -1,10 +1,16 @@
 from src.data import data
-from src.helper import find_user_id, check_valid_info, check_search
+from src.helper import check_search
+from src.sessions import find_user_id, end_all_sessions
+from src.registry import get_user, valid_user
+from src.search_index import search_messages
+from src.versions import reset_versions
 from src.error import AccessError, InputError
 import string
 
 def clear_v1():
     data.clear()
+    end_all_sessions()
+    reset_versions()
     return {}
 
 def search_v2(token, query_str):
@@ -40,9 +46,7 @@ def search_v2(token, query_str):
     # Decode the token to access auth_user_id of the channel owner
     auth_user_id = find_user_id(token)
 
-    for user in data['users']:
-        if user.get('auth_user_id') is auth_user_id:
-            user_valid = True
+    user_valid = valid_user(auth_user_id)
     # If the user is not a registered user, raise an inputerror
     if not user_valid:
         raise InputError(description = 'Token is invalid. Cannot search')
@@ -53,35 +57,23 @@ def search_v2(token, query_str):
 
     # Check the token belongs to a valid user
     #if user_valid:
-    for user in data['users']:
-        if user.get('auth_user_id') is auth_user_id:
-        # Check if the user is a part of any channels or dms
-            if user.get('channels_in') == None and user.get('dms_in') == None:
-                raise AccessError(description = 'User does not belong to channel or dm. Cannot search')
+    user = get_user(auth_user_id)
+    # Check if the user is a part of any channels or dms
+    if user.get('channels_in') == None and user.get('dms_in') == None:
+        raise AccessError(description = 'User does not belong to channel or dm. Cannot search')
 
     # Loop through and add all the messages with that channel Id and dm into 
     # a message list      
-    for user in data['users']:
-        if user.get('auth_user_id') is auth_user_id:
-            if user.get('channels_in'):
-                for channel in user['channels_in']:
-                    channel_list.append(channel.get('channel_id'))
-            if user.get('dms_in'):
-                for dm in user['dms_in']:
-                    dm_list.append(dm.get('dm_id'))
+    if user.get('channels_in'):
+        for channel in user['channels_in']:
+            channel_list.append(channel.get('channel_id'))
+    if user.get('dms_in'):
+        for dm in user['dms_in']:
+            dm_list.append(dm.get('dm_id'))
                     
-    msg_list = []
-    for message in data['messages']:
-        # Get all the messages from the channel list
-        # Loop through the whole list to see all the channels/dms the user is part of
-        for chan_msg in channel_list:
-            # If the message matches a channel the user is in, append the message to a msg_list
-            if message.get('channel_id') is chan_msg:
-                msg_list.append(message)
-        # Get all the messages from the dm list
-        for dm_msg in dm_list:
-            if message.get('dm_id') is dm_msg:
-                msg_list.append(message)
+    # Look up the messages that could contain the query in the search index,
+    # keeping only those from the channels/dms the user is part of
+    msg_list = search_messages(query_str, channel_list, dm_list)
 
     matched_msgs = []
     # Compare the message value in each one of these message to the query_str
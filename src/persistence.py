@@ -0,0 +1,576 @@
+from json import dumps, loads
+import atexit
+import os
+import threading
+import time
+
+# Every top level value of data is wrapped in a tracked dict/list when the
+# server starts. Writes to any tracked container report the path of the value
+# that changed to the journal, and at the end of each request the journal is
+# appended to database.log as one json record per changed path.
+# database.json is still the snapshot that the log is replayed on top of.
+#
+# Removing an item from a list or inserting one into it is logged as a single
+# 'del'/'insert' record. As that moves the items after it, anything already
+# journalled under the list is encoded first, at the position it was made at.
+
+SNAPSHOT_FILE = 'database.json'
+LOG_FILE = 'database.log'
+
+# Marks the parent of a top level value (the data dict itself is never wrapped)
+ROOT = object()
+
+# Held while a request (or the send later timer) reads or changes data, so
+# that when the server handles requests on several threads they never see
+# each other's half finished changes or interleave their journals
+STATE_LOCK = threading.RLock()
+
+_pending = {}
+# Records already encoded because a later insert or delete moved their path
+_journal = []
+_wal = None
+_data = None
+_known = {}
+
+
+def _path_of(container):
+    """
+    Walks up the parent links of a tracked container to build its path from data.
+    Returns None if the container has been detached from data.
+    """
+    path = []
+    while container is not None:
+        if container._parent is ROOT:
+            path.append(container._key)
+            path.reverse()
+            return tuple(path)
+        path.append(container._key)
+        container = container._parent
+    return None
+
+
+def _has_pending_ancestor(path):
+    for i in range(1, len(path) + 1):
+        if path[:i] in _pending:
+            return True
+    return False
+
+
+def _record(container, key=None, whole=False):
+    """
+    Adds the path that was changed to the pending journal.
+    A whole container write supersedes anything pending underneath it.
+    """
+    path = _path_of(container)
+    if path is None:
+        return
+    if not whole:
+        path = path + (key,)
+    if _has_pending_ancestor(path):
+        return
+    if whole:
+        for pending_path in [p for p in _pending if p[:len(path)] == path]:
+            del _pending[pending_path]
+    _pending[path] = 'set'
+
+
+def _record_delete(container, key):
+    path = _path_of(container)
+    if path is None:
+        return
+    path = path + (key,)
+    if _has_pending_ancestor(path[:-1]):
+        return
+    for pending_path in [p for p in _pending if p[:len(path)] == path]:
+        del _pending[pending_path]
+    _pending[path] = 'del'
+
+
+def _wrap(value, parent, key):
+    # Convert plain dicts and lists into tracked containers so that writes to
+    # them are reported to the journal
+    if isinstance(value, TrackedDict) or isinstance(value, TrackedList):
+        if value._parent is None or (value._parent is parent and value._key == key):
+            value._parent = parent
+            value._key = key
+            return value
+        # Already stored somewhere else in data (even under another key of the
+        # same parent) so it has to be copied, or a later write to it would
+        # only be journalled under one of its paths
+        value = loads(dumps(value))
+    if isinstance(value, dict):
+        tracked = TrackedDict()
+        tracked._parent = parent
+        tracked._key = key
+        for k, v in value.items():
+            dict.__setitem__(tracked, k, _wrap(v, tracked, k))
+        return tracked
+    if isinstance(value, list):
+        tracked = TrackedList()
+        tracked._parent = parent
+        tracked._key = key
+        for i, v in enumerate(value):
+            list.append(tracked, _wrap(v, tracked, i))
+        return tracked
+    return value
+
+
+_MISSING = object()
+
+
+def _unchanged(old, value):
+    # Only scalars are compared, containers may have been changed in place
+    if old is _MISSING or isinstance(value, (dict, list)):
+        return False
+    return type(old) is type(value) and old == value
+
+
+def _detach(value):
+    if isinstance(value, TrackedDict) or isinstance(value, TrackedList):
+        value._parent = None
+        value._key = None
+
+
+class TrackedDict(dict):
+    """
+    A dict that reports every write to the persistence journal
+    """
+    _parent = None
+    _key = None
+
+    def __setitem__(self, key, value):
+        old = self.get(key, _MISSING)
+        # Writing back the value that is already stored does not dirty data
+        if _unchanged(old, value):
+            return
+        dict.__setitem__(self, key, _wrap(value, self, key))
+        if old is not value:
+            _detach(old)
+        _record(self, key)
+
+    def __delitem__(self, key):
+        _detach(self.get(key))
+        dict.__delitem__(self, key)
+        _record_delete(self, key)
+
+    def pop(self, key, *default):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        _detach(value)
+        _record_delete(self, key)
+        return key, value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        for value in self.values():
+            _detach(value)
+        dict.clear(self)
+        _record(self, whole=True)
+
+
+def _encode(path, op):
+    if op == 'del':
+        return dumps({'op': 'del', 'path': list(path)}) + '\n'
+    value, found = _resolve(_data, path)
+    if not found:
+        return None
+    return dumps({'op': 'set', 'path': list(path), 'value': value}) + '\n'
+
+
+def _before_shift(container):
+    """
+    Encodes anything journalled under a list before an insert or delete
+    moves the items it was journalled at. Returns the path of the list, or
+    None if the shift does not need to be logged.
+    """
+    path = _path_of(container)
+    if path is None or _has_pending_ancestor(path):
+        return None
+    for pending_path in [p for p in _pending if p[:len(path)] == path]:
+        line = _encode(pending_path, _pending.pop(pending_path))
+        if line is not None:
+            _journal.append(line)
+    return path
+
+
+def _record_shift(path, op, index, value=None):
+    if path is None:
+        return
+    record = {'op': op, 'path': list(path) + [index]}
+    if op == 'insert':
+        record['value'] = value
+    _journal.append(dumps(record) + '\n')
+
+
+class TrackedList(list):
+    """
+    A list that reports every write to the persistence journal.
+    Appends are logged as a write to the new index, a single insert or delete
+    as one record, and anything else that moves existing items (slices,
+    sort, reverse) as a write of the whole list.
+    """
+    _parent = None
+    _key = None
+
+    def _reindex(self, start=0, whole=True):
+        for i in range(start, len(self)):
+            value = list.__getitem__(self, i)
+            if isinstance(value, TrackedDict) or isinstance(value, TrackedList):
+                value._key = i
+        if whole:
+            _record(self, whole=True)
+
+    def append(self, value):
+        list.append(self, _wrap(value, self, len(self)))
+        _record(self, len(self) - 1)
+
+    def extend(self, values):
+        for value in values:
+            self.append(value)
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            for old in self[index]:
+                _detach(old)
+            list.__setitem__(self, index, [_wrap(v, self, 0) for v in value])
+            self._reindex()
+            return
+        if index < 0:
+            index += len(self)
+        old = self[index]
+        if _unchanged(old, value):
+            return
+        list.__setitem__(self, index, _wrap(value, self, index))
+        if old is not value:
+            _detach(old)
+        _record(self, index)
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            for old in self[index]:
+                _detach(old)
+            list.__delitem__(self, index)
+            self._reindex()
+            return
+        if index < 0:
+            index += len(self)
+        path = _before_shift(self)
+        _detach(self[index])
+        list.__delitem__(self, index)
+        self._reindex(index, whole=False)
+        _record_shift(path, 'del', index)
+
+    def insert(self, index, value):
+        # Normalised the same way list.insert does
+        if index < 0:
+            index = max(index + len(self), 0)
+        index = min(index, len(self))
+        path = _before_shift(self)
+        list.insert(self, index, _wrap(value, self, index))
+        self._reindex(index + 1, whole=False)
+        _record_shift(path, 'insert', index, list.__getitem__(self, index))
+
+    def pop(self, index=-1):
+        if index < 0:
+            index += len(self)
+        value = self[index]
+        del self[index]
+        return value
+
+    def remove(self, value):
+        index = self.index(value)
+        del self[index]
+
+    def clear(self):
+        for value in self:
+            _detach(value)
+        list.clear(self)
+        _record(self, whole=True)
+
+    def sort(self, *args, **kwargs):
+        list.sort(self, *args, **kwargs)
+        self._reindex()
+
+    def reverse(self):
+        list.reverse(self)
+        self._reindex()
+
+
+def _resolve(data, path):
+    value = data
+    for key in path:
+        try:
+            value = value[key]
+        except (KeyError, IndexError, TypeError):
+            return None, False
+    return value, True
+
+
+def _apply(data, record):
+    """
+    Applies a single log record to data.
+    A write to a list index equal to its length is an append, and records
+    under a path that no longer exists are skipped. List inserts and deletes
+    are not idempotent, so a log is only ever replayed on the snapshot it was
+    started from (see WriteAheadLog.compact).
+    """
+    path = record['path']
+    parent, found = _resolve(data, path[:-1])
+    if not found:
+        return
+    key = path[-1]
+    if record['op'] == 'del':
+        if isinstance(parent, dict):
+            parent.pop(key, None)
+        elif isinstance(parent, list) and key < len(parent):
+            del parent[key]
+        return
+    if record['op'] == 'insert':
+        if isinstance(parent, list) and key <= len(parent):
+            parent.insert(key, record['value'])
+        return
+    if isinstance(parent, list):
+        if key < len(parent):
+            parent[key] = record['value']
+        elif key == len(parent):
+            parent.append(record['value'])
+    elif isinstance(parent, dict):
+        parent[key] = record['value']
+
+
+class WriteAheadLog:
+    """
+    Append only log of changes to data with group commit and compaction
+
+    Arguments:
+        snapshot_path (str) - file the full data is compacted into
+        log_path (str) - file records are appended to
+        group_size (int) - number of records written before the log is fsynced
+        group_interval (float) - longest time in seconds a record waits to be fsynced
+        compact_every (int) - number of records in the log before it is compacted
+    """
+    def __init__(self, snapshot_path=SNAPSHOT_FILE, log_path=LOG_FILE, group_size=64,
+                 group_interval=0.05, compact_every=10000):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        self.group_size = group_size
+        self.group_interval = group_interval
+        self.compact_every = compact_every
+        self.lock = threading.Lock()
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        self.log_records = 0
+        self.file = None
+
+    def replay(self, data):
+        """
+        Loads the snapshot and every record in the log into data
+        """
+        if os.path.exists(self.log_path + '.old'):
+            # A compaction stopped after moving the log aside. The new
+            # snapshot was written in full before that, so finish replacing
+            # the old snapshot with it (if that had not happened yet)
+            if os.path.exists(self.snapshot_path + '.tmp'):
+                os.replace(self.snapshot_path + '.tmp', self.snapshot_path)
+            os.remove(self.log_path + '.old')
+        data.clear()
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'r') as file:
+                contents = file.read()
+            if contents:
+                data.update(loads(contents))
+        self.log_records = 0
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'r') as file:
+                for line in file:
+                    # A torn final line from a crash mid write is ignored
+                    try:
+                        record = loads(line)
+                    except ValueError:
+                        break
+                    _apply(data, record)
+                    self.log_records += 1
+        self.file = open(self.log_path, 'a')
+
+    def append(self, lines):
+        """
+        Appends encoded records to the log, fsyncing once per group
+        """
+        with self.lock:
+            self.file.write(''.join(lines))
+            self.unsynced += len(lines)
+            self.log_records += len(lines)
+            if self.unsynced >= self.group_size or time.monotonic() - self.last_sync >= self.group_interval:
+                self._sync()
+
+    def sync(self):
+        with self.lock:
+            if self.unsynced:
+                self._sync()
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def needs_compaction(self):
+        return self.log_records >= self.compact_every
+
+    def compact(self, data):
+        """
+        Writes data as a new snapshot and starts a new empty log. The old log
+        is moved aside before the snapshot is replaced, so it is never
+        replayed on top of a snapshot that already has its records in it.
+        """
+        with self.lock:
+            tmp_path = self.snapshot_path + '.tmp'
+            old_log_path = self.log_path + '.old'
+            with open(tmp_path, 'w') as file:
+                file.write(dumps(data))
+                file.flush()
+                os.fsync(file.fileno())
+            self.file.close()
+            if os.path.exists(self.log_path):
+                os.replace(self.log_path, old_log_path)
+            os.replace(tmp_path, self.snapshot_path)
+            self.file = open(self.log_path, 'w')
+            if os.path.exists(old_log_path):
+                os.remove(old_log_path)
+            self.unsynced = 0
+            self.log_records = 0
+
+    def close(self):
+        with self.lock:
+            if self.file is not None and not self.file.closed:
+                self._sync()
+                self.file.close()
+
+
+def _track_top_level():
+    """
+    Wraps any top level value of data that has been replaced since the last
+    flush and journals it as a whole, then journals removed top level keys.
+    """
+    for key in list(_data.keys()):
+        value = _data[key]
+        if _known.get(key) is not value or not (isinstance(value, TrackedDict) or isinstance(value, TrackedList)):
+            for pending_path in [p for p in _pending if p[0] == key]:
+                del _pending[pending_path]
+            _pending[(key,)] = 'set'
+            if _known.get(key) is not value:
+                _detach(_known.get(key))
+            wrapped = _wrap(value, ROOT, key)
+            dict.__setitem__(_data, key, wrapped)
+            _known[key] = wrapped
+    for key in list(_known.keys()):
+        if key not in _data:
+            _detach(_known.pop(key))
+            _pending[(key,)] = 'del'
+
+
+def is_dirty():
+    """
+    Returns whether data has been changed since the last flush
+    """
+    if _pending or _journal:
+        return True
+    if len(_known) != len(_data):
+        return True
+    for key, value in _data.items():
+        if _known.get(key) is not value:
+            return True
+    return False
+
+
+def flush():
+    """
+    Writes the journal of changes made since the last flush to the log
+    """
+    if _wal is None or not is_dirty():
+        return
+    _track_top_level()
+    lines = list(_journal)
+    for path, op in _pending.items():
+        line = _encode(path, op)
+        if line is not None:
+            lines.append(line)
+    _journal.clear()
+    _pending.clear()
+    if lines:
+        _wal.append(lines)
+    if _wal.needs_compaction():
+        _wal.compact(_data)
+
+
+def restore(data, snapshot_path=SNAPSHOT_FILE, log_path=LOG_FILE, **options):
+    """
+    Loads the snapshot and replays the log into data, then starts journalling
+    writes to data. Called once when the server starts.
+
+    Arguments:
+        data (dict) - the data dict from src.data
+        snapshot_path (str) - path of the snapshot file
+        log_path (str) - path of the log file
+        options - passed through to WriteAheadLog
+
+    Return Value:
+        The WriteAheadLog in use
+    """
+    global _wal, _data
+    _wal = WriteAheadLog(snapshot_path, log_path, **options)
+    _wal.replay(data)
+    _data = data
+    _known.clear()
+    _pending.clear()
+    _journal.clear()
+    for key in list(data.keys()):
+        wrapped = _wrap(data[key], ROOT, key)
+        dict.__setitem__(data, key, wrapped)
+        _known[key] = wrapped
+    # Start from a compact snapshot so the log only holds this run's changes
+    _wal.compact(data)
+
+    # Records that are waiting on a group to fill are fsynced in the background
+    # so they are never left unsynced for longer than the group interval
+    def sync_loop(wal):
+        while _wal is wal:
+            time.sleep(wal.group_interval)
+            wal.sync()
+    threading.Thread(target=sync_loop, args=(_wal,), daemon=True).start()
+    atexit.register(_wal.close)
+    return _wal
+
+
+def persist_and_return(result):
+    """
+    Appends the changes made while handling a request to the log and
+    returns the result of the request as json.
+    Requests that did not change data do not touch the log at all.
+
+    Arguments:
+        result (dict) - value returned from the request's function
+
+    Return Value:
+        json string of result
+    """
+    flush()
+    return dumps(result)
@@ -0,0 +1,223 @@
+import os
+import hashlib
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from PIL import Image
+from src import config
+from src.registry import get_user
+from src.error import InputError
+from src.persistence import STATE_LOCK, flush
+from src.versions import bump_version
+from src.users import directory_changed
+
+# Downloads, crops and saves profile photos for user/profile/uploadphoto off
+# the request thread.
+#
+# Each upload is a job run by a small pool of worker threads. The image is
+# downloaded once, streamed through a shared requests.Session (which keeps
+# connections to image hosts open between jobs) and stopped as soon as it
+# goes over MAX_PHOTO_BYTES. It is then decoded and cropped from memory and
+# saved to static/. The request that starts a job only gets back its id;
+# the job's status can be checked with photo_job_status(). Jobs are kept in
+# memory only, at most JOB_LIMIT of them.
+#
+# Cropped photos are saved under static/avatars/ named by a hash of their
+# pixels, along with a smaller copy for each of THUMBNAIL_SIZES:
+#     static/avatars/<hash>.jpg, static/avatars/<hash>_64.jpg, ...
+# A photo that has already been saved (e.g. the same crop uploaded again, or
+# by another user) is not saved again. As a file's name changes whenever its
+# content does, its url can be cached forever.
+
+MAX_PHOTO_BYTES = 5 * 1024 * 1024
+DOWNLOAD_TIMEOUT = 10
+DOWNLOAD_CHUNK = 64 * 1024
+PHOTO_WORKERS = 4
+JOB_LIMIT = 1000
+AVATAR_DIR = "static/avatars"
+THUMBNAIL_SIZES = (32, 64, 128)
+DETAILS_THUMBNAIL = 64
+
+_session = requests.Session()
+_session.mount('http://', HTTPAdapter(pool_maxsize=PHOTO_WORKERS))
+_session.mount('https://', HTTPAdapter(pool_maxsize=PHOTO_WORKERS))
+
+_photos = {
+    'pool' : ThreadPoolExecutor(max_workers=PHOTO_WORKERS),
+    'jobs' : {},
+    'next_job' : 1,
+    'lock' : threading.Lock(),
+}
+
+def download_image(img_url):
+    """
+    Downloads an image, giving up if it is bigger than MAX_PHOTO_BYTES
+
+    Arguments:
+        img_url (str) - url of the image
+
+    Exceptions:
+        InputError - img_url returns an HTTP status other than 200, cannot be
+                     reached or is too big
+
+    Return Value:
+        the image (bytes)
+    """
+    try:
+        with _session.get(img_url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+            if response.status_code != 200:
+                raise InputError(description="This image url is not valid")
+            if int(response.headers.get('Content-Length') or 0) > MAX_PHOTO_BYTES:
+                raise InputError(description="This image is too big")
+            content = bytearray()
+            for chunk in response.iter_content(DOWNLOAD_CHUNK):
+                content.extend(chunk)
+                if len(content) > MAX_PHOTO_BYTES:
+                    raise InputError(description="This image is too big")
+    except requests.RequestException:
+        raise InputError(description="This image url is not valid")
+    return bytes(content)
+
+def crop_image(content, x_start, y_start, x_end, y_end):
+    """
+    Decodes a jpg and crops it within bounds (x_start, y_start) and (x_end, y_end)
+
+    Exceptions:
+        InputError - The image is not a jpg
+        InputError - any of x_start, y_start, x_end, y_end are not within the
+                     dimensions of the image
+
+    Return Value:
+        the cropped image (PIL.Image)
+    """
+    try:
+        image = Image.open(BytesIO(content))
+    except OSError:
+        raise InputError(description="This image is not a jpg")
+    if image.format != 'JPEG':
+        raise InputError(description="This image is not a jpg")
+
+    width, height = image.size
+    #check if end crop values are more than the image size
+    if x_end > width or y_end > height:
+        raise InputError(description="Invalid bounds for crop - end crop co-ords are invalid")
+    return image.crop((x_start, y_start, x_end, y_end))
+
+def _save(image, path):
+    # Saved under another name first, so a file with the final name is always whole
+    partial = f"{path}.{threading.get_ident()}.partial"
+    image.save(partial, 'JPEG')
+    os.replace(partial, path)
+
+def store_image(image):
+    """
+    Saves a cropped photo and its thumbnails, unless the same photo has
+    already been saved
+
+    Arguments:
+        image (PIL.Image) - the cropped photo
+
+    Return Value:
+        (url of the photo, dict of the url of each thumbnail keyed by its size as a string)
+    """
+    image = image.convert('RGB')
+    digest = hashlib.sha256(f"{image.size}".encode() + image.tobytes()).hexdigest()[:32]
+    os.makedirs(AVATAR_DIR, exist_ok=True)
+
+    base_url = str(config.url) + AVATAR_DIR + "/"
+    path = f"{AVATAR_DIR}/{digest}.jpg"
+    thumbnails = {}
+    for size in THUMBNAIL_SIZES:
+        thumbnail_path = f"{AVATAR_DIR}/{digest}_{size}.jpg"
+        if not os.path.exists(thumbnail_path):
+            thumbnail = image.copy()
+            thumbnail.thumbnail((size, size))
+            _save(thumbnail, thumbnail_path)
+        thumbnails[str(size)] = f"{base_url}{digest}_{size}.jpg"
+    # The full size photo is saved last, so if it exists its thumbnails do too
+    if not os.path.exists(path):
+        _save(image, path)
+    return f"{base_url}{digest}.jpg", thumbnails
+
+def profile_thumbnail(u_id, size=DETAILS_THUMBNAIL):
+    """
+    Returns the url of a thumbnail of a user's profile photo, or their full
+    size photo's url if it was uploaded before thumbnails were kept
+    """
+    user = get_user(u_id)
+    if user is None:
+        return ''
+    thumbnails = user.get('profile_img_thumbnails') or {}
+    return thumbnails.get(str(size), user.get('profile_img_url', ''))
+
+def with_thumbnails(members):
+    """
+    Returns copies of a list of members, each with the url of a small
+    thumbnail of their current profile photo added
+    """
+    return [dict(member, profile_img_thumbnail_url = profile_thumbnail(member.get('u_id'))) for member in members]
+
+def _set_status(job_id, status, error=None):
+    with _photos['lock']:
+        job = _photos['jobs'].get(job_id)
+        if job is not None:
+            job['status'] = status
+            job['error'] = error
+
+def _run_job(job_id, u_id, img_url, bounds):
+    try:
+        cropped = crop_image(download_image(img_url), *bounds)
+        profile_image_url, thumbnails = store_image(cropped)
+    except InputError as err:
+        _set_status(job_id, 'failed', err.get_description())
+        return
+    except Exception:
+        _set_status(job_id, 'failed', 'This image could not be uploaded')
+        return
+
+    with STATE_LOCK:
+        # The user may have been cleared away while the photo was downloading
+        user = get_user(u_id)
+        if user is not None:
+            user['profile_img_url'] = profile_image_url
+            user['profile_img_thumbnails'] = thumbnails
+            bump_version('users')
+            directory_changed(u_id)
+            flush()
+    _set_status(job_id, 'done')
+
+def start_photo_job(u_id, img_url, x_start, y_start, x_end, y_end):
+    """
+    Starts downloading, cropping and saving a user's profile photo
+
+    Return Value:
+        job_id (int)
+    """
+    with _photos['lock']:
+        job_id = _photos['next_job']
+        _photos['next_job'] += 1
+        jobs = _photos['jobs']
+        jobs[job_id] = {'u_id' : u_id, 'status' : 'pending', 'error' : None}
+        if len(jobs) > JOB_LIMIT:
+            del jobs[next(iter(jobs))]
+    _photos['pool'].submit(_run_job, job_id, u_id, img_url, (x_start, y_start, x_end, y_end))
+    return job_id
+
+def photo_job_status(u_id, job_id):
+    """
+    Returns the status of one of a user's photo jobs
+
+    Exceptions:
+        InputError - job_id is not one of the user's photo jobs
+
+    Return Value:
+        status (str) - 'pending', 'done' or 'failed'
+        error (str) - why the job failed, or None
+    """
+    with _photos['lock']:
+        job = _photos['jobs'].get(job_id)
+        if job is None or job['u_id'] != u_id:
+            raise InputError(description="This is not a valid photo upload")
+        return {'status' : job['status'], 'error' : job['error']}
@@ -0,0 +1,283 @@
+import heapq
+from src.data import getData
+from src.stats import conversation_changed
+from src import user_index
+from src.events import membership_changed
+
+# Lookups of users, channels and dms without going through every record.
+#
+# Ids are handed out in order, so the record for an id is always at
+# position id - 1 of its list. A record is only valid if its id key still
+# matches (removed channels and dms have their id replaced with a message).
+#
+# Emails, handles and **Dreams** owners are kept in dicts/sets that are filled in as new users
+# appear at the end of data['users'] and updated by the functions that
+# change them. Emails and handles are looked up in lowercase, so two users
+# cannot have the same one in different cases. Member and owner sets are
+# cached per channel/dm, dropped by members_changed() and rebuilt if the list
+# they came from is replaced or changes length.
+#
+# For generate_handle() (used by auth_register_v2 in src/auth.py), each
+# handle that is already taken remembers the next number after it that has
+# not been given out, and a min-heap of the numbers below that which were
+# given out and then freed by update_handle() (a handle change or a removed
+# user). A new handle is then found without going through every user with
+# the same name.
+
+_registry = {
+    'users' : None,
+    'users_seen' : 0,
+    'emails' : {},
+    'handles' : {},
+    'handle_numbers' : {},
+    'freed_numbers' : {},
+    'owners' : set(),
+    'members' : {},
+}
+
+def _key(value):
+    return value.lower() if isinstance(value, str) else value
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _sync_users():
+    """
+    Indexes the emails and handles of any users registered since the last lookup.
+    Starts again from scratch if data['users'] has been replaced or cleared.
+    """
+    users = getData().get('users')
+    if users is None:
+        users = []
+    if users is not _registry['users'] or len(users) < _registry['users_seen']:
+        _registry['users'] = users
+        _registry['users_seen'] = 0
+        _registry['emails'] = {}
+        _registry['handles'] = {}
+        _registry['handle_numbers'] = {}
+        _registry['freed_numbers'] = {}
+        _registry['owners'] = set()
+    for user in users[_registry['users_seen']:]:
+        if user.get('email'):
+            _registry['emails'][_key(user['email'])] = user['auth_user_id']
+        if user.get('handle_str'):
+            _registry['handles'][_key(user['handle_str'])] = user['auth_user_id']
+        if user.get('global_permissions') == 1:
+            _registry['owners'].add(user['auth_user_id'])
+    _registry['users_seen'] = len(users)
+
+def _record(key, id_key, record_id):
+    if not _is_id(record_id) or record_id < 1:
+        return None
+    records = getData().get(key)
+    if records is None or record_id > len(records):
+        return None
+    record = records[record_id - 1]
+    if record.get(id_key) != record_id:
+        return None
+    return record
+
+def get_user(u_id):
+    """
+    Returns the user with this u_id from data['users'], or None if there is no such user
+    """
+    return _record('users', 'auth_user_id', u_id)
+
+def get_channel(channel_id):
+    """
+    Returns the channel with this channel_id from data['channels'], or None if
+    it does not exist or has been removed
+    """
+    return _record('channels', 'channel_id', channel_id)
+
+def get_dm(dm_id):
+    """
+    Returns the dm with this dm_id from data['dm'], or None if it does not
+    exist or has been removed
+    """
+    return _record('dm', 'dm_id', dm_id)
+
+def valid_user(u_id):
+    return get_user(u_id) is not None
+
+def valid_channel(channel_id):
+    return get_channel(channel_id) is not None
+
+def valid_dm(dm_id):
+    return get_dm(dm_id) is not None
+
+def is_dreams_owner(u_id):
+    """
+    Returns whether the user is an owner of **Dreams**
+    """
+    user = get_user(u_id)
+    return user is not None and user.get('global_permissions') == 1
+
+def dreams_owner_count():
+    """
+    Returns the number of **Dreams** owners
+    """
+    _sync_users()
+    return len(_registry['owners'])
+
+def permissions_changed(u_id):
+    """
+    Updates the set of **Dreams** owners after a user's global permissions changed
+    """
+    _sync_users()
+    if is_dreams_owner(u_id):
+        _registry['owners'].add(u_id)
+    else:
+        _registry['owners'].discard(u_id)
+
+def user_by_email(email):
+    """
+    Returns the u_id of the user registered with this email (in any case), or None
+    """
+    _sync_users()
+    return _registry['emails'].get(_key(email))
+
+def user_by_handle(handle_str):
+    """
+    Returns the u_id of the user with this handle (in any case), or None
+    """
+    _sync_users()
+    return _registry['handles'].get(_key(handle_str))
+
+def update_email(u_id, old_email, new_email):
+    """
+    Moves a user's entry in the email index after their email has changed
+    """
+    _sync_users()
+    if old_email and _registry['emails'].get(_key(old_email)) == u_id:
+        del _registry['emails'][_key(old_email)]
+    if new_email:
+        _registry['emails'][_key(new_email)] = u_id
+
+def update_handle(u_id, old_handle, new_handle):
+    """
+    Moves a user's entry in the handle index after their handle has changed
+    """
+    _sync_users()
+    if old_handle and _registry['handles'].get(_key(old_handle)) == u_id:
+        del _registry['handles'][_key(old_handle)]
+        _free_number(_key(old_handle))
+    if new_handle:
+        _registry['handles'][_key(new_handle)] = u_id
+
+def _free_number(handle):
+    """
+    Offers the number at the end of a handle that has just been freed to the
+    handle it was generated from, so generate_handle() can give it out again
+    """
+    # A handle that ends in digits may have been numbered after any of them
+    for i in range(len(handle) - 1, 0, -1):
+        if not handle[i].isdigit():
+            break
+        suffix = handle[i:]
+        if suffix != '0' and suffix.startswith('0'):
+            continue
+        number = int(suffix)
+        if number < _registry['handle_numbers'].get(handle[:i], 0):
+            heapq.heappush(_registry['freed_numbers'].setdefault(handle[:i], []), number)
+
+def generate_handle(name_first, name_last):
+    """
+    Returns a handle for a new user that no other user has: their first and
+    last name in lowercase with anything but letters and numbers removed, cut
+    to 20 characters. If that is taken, the smallest number (from 0) that
+    makes it unique is added to the end. Used by auth_register_v2.
+
+    Arguments:
+        name_first (str) - the user's first name
+        name_last (str) - the user's last name
+
+    Return Value:
+        handle_str (str)
+    """
+    _sync_users()
+    handle = ''.join(c for c in (name_first + name_last).lower() if c.isalnum())[:20]
+    if handle not in _registry['handles']:
+        return handle
+    # Numbers that were freed come before any that were never given out.
+    # Those that have been taken again since are dropped as they are found.
+    freed = _registry['freed_numbers'].get(handle, [])
+    while freed:
+        if handle + str(freed[0]) not in _registry['handles']:
+            return handle + str(freed[0])
+        heapq.heappop(freed)
+
+    # Numbers before this one have all been given out, so the search starts
+    # here. It only goes past it if a user picked a numbered handle themselves
+    number = _registry['handle_numbers'].get(handle, 0)
+    while handle + str(number) in _registry['handles']:
+        number += 1
+    _registry['handle_numbers'][handle] = number
+    return handle + str(number)
+
+def _member_set(kind, record, list_key):
+    """
+    Returns the set of u_ids in one of a channel/dm's member lists
+    """
+    members = record.get(list_key)
+    if members is None:
+        return set()
+    cache_key = (kind, record[kind + '_id'], list_key)
+    cached = _registry['members'].get(cache_key)
+    if cached is None or cached[0] is not members or cached[1] != len(members):
+        cached = (members, len(members), {member.get('u_id') for member in members})
+        _registry['members'][cache_key] = cached
+    return cached[2]
+
+def members_changed(kind, record_id):
+    """
+    Drops the cached member and owner sets of a channel or dm, updates the
+    membership counts in src.stats and the user indexes in src.user_index,
+    and tells its open event streams to check their user is still a member.
+    Called by anything that changes its member lists.
+
+    Arguments:
+        kind (str) - 'channel' or 'dm'
+        record_id (int) - the channel or dm's id
+    """
+    _registry['members'].pop((kind, record_id, 'all_members'), None)
+    _registry['members'].pop((kind, record_id, 'owner_members'), None)
+    conversation_changed(kind, record_id)
+    user_index.conversation_changed(kind, record_id)
+    membership_changed(kind, record_id)
+
+def channel_members(channel_id):
+    """
+    Returns the set of u_ids that are members of a channel
+    """
+    channel = get_channel(channel_id)
+    if channel is None:
+        return set()
+    return _member_set('channel', channel, 'all_members')
+
+def channel_owners(channel_id):
+    """
+    Returns the set of u_ids that are owners of a channel
+    """
+    channel = get_channel(channel_id)
+    if channel is None:
+        return set()
+    return _member_set('channel', channel, 'owner_members')
+
+def dm_members(dm_id):
+    """
+    Returns the set of u_ids that are members of a dm
+    """
+    dm = get_dm(dm_id)
+    if dm is None:
+        return set()
+    return _member_set('dm', dm, 'all_members')
+
+def is_channel_member(channel_id, u_id):
+    return u_id in channel_members(channel_id)
+
+def is_channel_owner(channel_id, u_id):
+    return u_id in channel_owners(channel_id)
+
+def is_dm_member(dm_id, u_id):
+    return u_id in dm_members(dm_id)
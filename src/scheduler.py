@@ -0,0 +1,145 @@
+import heapq
+import sys
+import threading
+import time
+import traceback
+from src.data import getData
+from src.error import InputError, AccessError
+from src.persistence import STATE_LOCK, flush
+
+# Sends the messages scheduled by message/sendlater and message/sendlaterdm.
+#
+# Scheduled messages are stored in data['send_later'] keyed by a number
+# (as a string, so they survive json) so a sent message can be removed
+# without rewriting the others. A min-heap of (time_sent, key) is kept in
+# memory and rebuilt from data['send_later'] when the scheduler starts. The
+# scheduler thread sleeps until the earliest message is due, or until an
+# earlier one is scheduled, then sends everything that is due at once. A
+# message that fails to send for any other reason than its sender no longer
+# being allowed to post is printed and dropped, so it cannot stop the thread.
+
+_scheduler = {
+    'heap' : [],
+    'condition' : threading.Condition(),
+    'thread' : None,
+}
+
+def _get_pending():
+    """
+    Returns data['send_later'], converting it from the list it used to be
+    """
+    data = getData()
+    pending = data.get('send_later')
+    if pending == None:
+        data['send_later'] = {}
+    elif isinstance(pending, list):
+        data['send_later'] = {str(i + 1) : entry for i, entry in enumerate(pending)}
+        data['send_later_count'] = len(pending)
+    return data['send_later']
+
+def _push(time_sent, key):
+    with _scheduler['condition']:
+        heapq.heappush(_scheduler['heap'], (time_sent, key))
+        _scheduler['condition'].notify()
+
+def schedule(entry):
+    """
+    Stores a message to be sent later and wakes the scheduler if it is due
+    before the messages already waiting
+
+    Arguments:
+        entry (dict) - contains token, message, time_sent and either
+                       channel_id or dm_id
+
+    Return Value:
+        None
+    """
+    data = getData()
+    pending = _get_pending()
+    key = data.get('send_later_count', 0) + 1
+    data['send_later_count'] = key
+    pending[str(key)] = entry
+    _push(entry['time_sent'], key)
+
+def _send(due):
+    """
+    Sends each of the due messages that is still scheduled and removes it
+    from data['send_later']
+    """
+    # Imported here as src.message imports this module to schedule messages
+    from src.message import message_send_v2, message_senddm_v1
+
+    with STATE_LOCK:
+        pending = _get_pending()
+        for time_sent, key in due:
+            entry = pending.get(str(key))
+            # The message may have been cleared, or replaced by a newer
+            # message with the same key after a clear
+            if entry == None or entry.get('time_sent') != time_sent:
+                continue
+            del pending[str(key)]
+            try:
+                if entry.get('channel_id') != None:
+                    message_send_v2(entry['token'], entry['channel_id'], entry['message'], entry.get('message_id'))
+                else:
+                    message_senddm_v1(entry['token'], entry['dm_id'], entry['message'], entry.get('message_id'))
+            except (InputError, AccessError):
+                # The sender is no longer allowed to post there
+                pass
+            except Exception:
+                print(f'Could not send scheduled message {key}:', file=sys.stderr)
+                traceback.print_exc()
+        flush()
+
+def _run():
+    condition = _scheduler['condition']
+    heap = _scheduler['heap']
+    while True:
+        with condition:
+            now = time.time()
+            while not heap or heap[0][0] > now:
+                condition.wait(heap[0][0] - now if heap else None)
+                now = time.time()
+            due = []
+            while heap and heap[0][0] <= now:
+                due.append(heapq.heappop(heap))
+        try:
+            _send(due)
+        except Exception:
+            # e.g. the log could not be written. The messages were already
+            # taken off the heap, so the rest carry on as normal
+            traceback.print_exc()
+
+def reschedule():
+    """
+    Rebuilds the heap from the messages in data['send_later'], e.g. after a
+    workspace has been imported. The caller must hold the state lock.
+
+    Return Value:
+        None
+    """
+    pending = getData().get('send_later')
+    with _scheduler['condition']:
+        _scheduler['heap'].clear()
+        if pending:
+            pending = _get_pending()
+            for key, entry in pending.items():
+                _scheduler['heap'].append((entry['time_sent'], int(key)))
+            heapq.heapify(_scheduler['heap'])
+        _scheduler['condition'].notify()
+
+def start_scheduler():
+    """
+    Rebuilds the heap from the messages in data['send_later'] and starts the
+    scheduler thread. Does nothing if it has already been started.
+
+    Return Value:
+        None
+    """
+    if _scheduler['thread'] is not None:
+        return
+    with STATE_LOCK:
+        reschedule()
+        flush()
+    _scheduler['thread'] = threading.Thread(target=_run, daemon=True)
+    _scheduler['thread'].start()
@@ -0,0 +1,124 @@
+import re
+from src.data import getData
+from src.message_index import conversation_message_ids, get_message
+
+# An inverted index for search/v2 that maps each GRAM_SIZE character piece
+# of text (a trigram) to the set of ids of the messages containing it. check_search
+# matches the query anywhere in a message, including part of a word (e.g.
+# "tes" or "lo wor" in "testing hello world"), so a message can only match
+# if it contains every trigram of the query. Text is lowercased and has its
+# whitespace removed before it is cut up, so the messages looked up are
+# always a superset of the ones check_search accepts. A query shorter than
+# GRAM_SIZE has no trigrams, so every message the user can see is checked.
+#
+# Newly sent and shared messages are appended to the end of data['messages']
+# and are indexed the next time the index is used. Anything that changes the
+# text of a message already sent calls message_changed(). The index is kept
+# in memory only and is rebuilt from data when the server starts.
+
+GRAM_SIZE = 3
+
+_index = {
+    'messages' : None,
+    'indexed' : 0,
+    'postings' : {},
+    'grams' : {},
+}
+
+def trigrams(text):
+    """
+    Returns the set of GRAM_SIZE character pieces of a piece of text, after
+    it has been lowercased and had its whitespace removed
+    """
+    text = re.sub(r'\s+', '', text.lower())
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+def _add(message):
+    grams = trigrams(message.get('message', ''))
+    _index['grams'][message['message_id']] = grams
+    for gram in grams:
+        _index['postings'].setdefault(gram, set()).add(message['message_id'])
+
+def _discard(message_id):
+    for gram in _index['grams'].pop(message_id, ()):
+        posting = _index['postings'][gram]
+        posting.discard(message_id)
+        if not posting:
+            del _index['postings'][gram]
+
+def _sync():
+    """
+    Indexes any messages sent since the index was last used, starting again
+    if data['messages'] has been replaced or cleared
+    """
+    messages = getData().get('messages')
+    if messages is None:
+        messages = []
+    if messages is not _index['messages'] or len(messages) < _index['indexed']:
+        _index['messages'] = messages
+        _index['indexed'] = 0
+        _index['postings'] = {}
+        _index['grams'] = {}
+    for message in messages[_index['indexed']:]:
+        _add(message)
+    _index['indexed'] = len(messages)
+
+def rebuild():
+    """
+    Throws away the index and builds it again from data['messages']
+    """
+    _index['messages'] = None
+    _sync()
+
+def message_changed(message):
+    """
+    Re-indexes a message after its text has been edited or removed
+
+    Arguments:
+        message (dict) - the message as stored in data['messages']
+
+    Return Value:
+        None
+    """
+    _sync()
+    _discard(message['message_id'])
+    _add(message)
+
+def search_messages(query_str, channel_ids, dm_ids):
+    """
+    Returns the messages in the given channels and dms that could contain the
+    query, oldest first. Every message that contains it is returned, but
+    some that do not may be too, so each one still has to be checked.
+
+    Arguments:
+        query_str (str) - the string being searched
+        channel_ids (list of int) - the channels to search in
+        dm_ids (list of int) - the dms to search in
+
+    Return Value:
+        list of messages as stored in data['messages']
+    """
+    _sync()
+    grams = trigrams(query_str)
+
+    if not grams:
+        message_ids = set()
+        for channel_id in channel_ids:
+            message_ids.update(conversation_message_ids('channels', channel_id))
+        for dm_id in dm_ids:
+            message_ids.update(conversation_message_ids('dms', dm_id))
+    else:
+        # Intersect starting from the rarest trigram so the candidate set stays small
+        postings = sorted((_index['postings'].get(gram, set()) for gram in grams), key=len)
+        message_ids = set(postings[0])
+        for posting in postings[1:]:
+            message_ids &= posting
+
+    channel_ids = set(channel_ids)
+    dm_ids = set(dm_ids)
+    found = []
+    for message_id in sorted(message_ids):
+        message = get_message(message_id)
+        if message.get('channel_id') in channel_ids or message.get('dm_id') in dm_ids:
+            found.append(message)
+    return found
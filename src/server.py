@@ -1,10 +1,25 @@
 import sys
+import os
+import hashlib
+import mimetypes
+import threading
+from collections import OrderedDict
 from json import dumps, loads 
-from flask import Flask, request
+from flask import Flask, request, Response, g, send_file, redirect
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
 from flask_cors import CORS
-from src.error import InputError
+from src.error import InputError, AccessError
 from src import config
-from src.data import saveAndReturn, getData
+from src.data import getData
+from src.persistence import restore, persist_and_return, flush, STATE_LOCK
+from src.search_index import rebuild as rebuild_search_index
+from src.scheduler import start_scheduler
+from src.sessions import find_user_id, end_session, end_user_sessions
+from src.registry import user_by_email
+from src.message_index import conversation_message_ids
+from src.versions import get_version, make_etag
+from src.longpoll import start_longpoll, longpoll_port
 import src.auth
 import src.other
 import src.channels
@@ -13,12 +28,11 @@ import src.admin
 import src.user
 import src.users
 import src.dm
-import src.timer
-import _thread
 import src.message
 import src.standup
+import src.workspace
 
-#After the server starts, we read from the file to get the most recent data stored
+#After the server starts, we read from the snapshot and log to get the most recent data stored
 
 def defaultHandler(err):
     response = err.get_response()
@@ -31,12 +45,34 @@ def defaultHandler(err):
     response.content_type = 'application/json'
     return response
 
-APP = Flask(__name__)
+# Files in static/ are served by static_wrapper() below instead of Flask's own static route
+APP = Flask(__name__, static_folder=None)
 CORS(APP)
 
 APP.config['TRAP_HTTP_EXCEPTIONS'] = True
 APP.register_error_handler(Exception, defaultHandler)
 
+# Requests can be handled on several threads (see src/wsgi.py), so each one
+# holds the state lock from before its handler runs until it has finished.
+# The body is read in full before the lock is taken (and kept for
+# request.get_json()), so a client that is slow to upload only holds up its
+# own thread. Static files do not touch data, so they are served without the
+# lock, and neither are the redirects to the event streams. Workspace imports
+# read their body without it and take it themselves.
+UNLOCKED_ENDPOINTS = ('static_wrapper', 'workspace_import_wrapper', 'channel_events_wrapper', 'dm_events_wrapper')
+
+@APP.before_request
+def acquire_state_lock():
+    g.holds_state_lock = request.endpoint not in UNLOCKED_ENDPOINTS
+    if g.holds_state_lock:
+        request.get_data()
+        STATE_LOCK.acquire()
+
+@APP.teardown_request
+def release_state_lock(exc):
+    if g.get('holds_state_lock'):
+        STATE_LOCK.release()
+
 # Example
 @APP.route("/echo", methods=['GET'])
 def echo():
@@ -47,40 +83,91 @@ def echo():
         'data': data
     })
 
-try: 
-    with open('database.json', 'r') as file:
-        data = loads(file.read())
-except: 
-    data = {}
+# Conditional GETs
+# =====================================================
+# Routes that clients poll work out an ETag from the version counters in
+# src/versions.py before running their handler, and answer 304 if the client
+# already has that version. The ETag includes the requesting user, so only a
+# user who has already been allowed to see the response can get a 304 for it.
+
+def request_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def run_handler(handler, encoded):
+    if encoded:
+        flush()
+        return handler()
+    return persist_and_return(handler())
+
+def conditional_get(etag, handler, encoded=False):
+    """
+    Returns 304 Not Modified if the request's If-None-Match has the etag,
+    otherwise runs the handler and returns its result with the etag. If etag
+    is None (e.g. the token is not valid) the handler is always run. If
+    encoded is True the handler returns its result already as json.
+    """
+    if etag is None:
+        return run_handler(handler, encoded)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = APP.make_response(run_handler(handler, encoded))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def conversation_etag(token, kind, conversation_id, *parts):
+    u_id = find_user_id(token)
+    conversation_id = request_id(conversation_id)
+    if u_id is False or u_id is None or conversation_id is None:
+        return None
+    version = get_version(kind, conversation_id)
+    message_count = len(conversation_message_ids(kind + 's', conversation_id))
+    return make_etag(kind, conversation_id, version, message_count, u_id, *parts)
+
+# Load the snapshot in database.json and replay database.log on top of it.
+# From here on each request appends only what it changed to database.log
+restore(getData())
+# The search index is only kept in memory, so build it from the restored data
+rebuild_search_index()
 
 # Auth routes
 # =====================================================
 @APP.route("/auth/login/v2", methods=['POST'])
 def auth_login_wrapper():
     info = request.get_json()
-    return saveAndReturn(src.auth.auth_login_v2(info['email'], info['password']))
+    return persist_and_return(src.auth.auth_login_v2(info['email'], info['password']))
 
 @APP.route("/auth/register/v2", methods=['POST'])
 def auth_register_wrapper():
     data = request.get_json()
     registered_user = src.auth.auth_register_v2(data['email'], data['password'], data['name_first'], data['name_last'])
-    return saveAndReturn(registered_user)
+    return persist_and_return(registered_user)
 
 @APP.route("/auth/logout/v1", methods=['POST'])
 def auth_logout_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.auth.auth_logout_v1(data['token']))
+    # Forget the cached session before the token is logged out
+    end_session(data['token'])
+    return persist_and_return(src.auth.auth_logout_v1(data['token']))
 
 @APP.route("/auth/passwordreset/request/v1", methods=['POST'])
 def password_reset_request_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.auth.auth_passwordreset_request_v1(data['email']))
+    # Requesting a reset logs the user out everywhere, so drop their cached sessions
+    u_id = user_by_email(data['email'])
+    if u_id != None:
+        end_user_sessions(u_id)
+    return persist_and_return(src.auth.auth_passwordreset_request_v1(data['email']))
 
 
 @APP.route("/auth/passwordreset/reset/v1", methods=['POST'])
 def passoword_reset_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.auth.auth_passwordreset_reset_v1(data['reset_code'], data['new_password']))
+    return persist_and_return(src.auth.auth_passwordreset_reset_v1(data['reset_code'], data['new_password']))
 
 
 # Channel routes
@@ -88,117 +175,120 @@ def passoword_reset_wrapper():
 @APP.route("/channel/invite/v2", methods=['POST'])
 def channel_invite_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.channel.channel_invite_v2(data['token'], data['channel_id'], data['u_id']))
+    return persist_and_return(src.channel.channel_invite_v2(data['token'], data['channel_id'], data['u_id']))
 
 @APP.route("/channel/details/v2", methods=['GET'])
 def channel_details_wrapper():
     token = request.args.get('token')
     channel_id = request.args.get('channel_id')
-    return saveAndReturn(src.channel.channel_details_v2(token, channel_id))
+    etag = conversation_etag(token, 'channel', channel_id, 'details', get_version('users'))
+    return conditional_get(etag, lambda: src.channel.channel_details_v2(token, channel_id))
 
 @APP.route("/channel/messages/v2", methods=['GET'])
 def channel_messages_wrapper():
     token = request.args.get('token')
     channel_id = request.args.get('channel_id')
     start = request.args.get('start')
-    return saveAndReturn(src.channel.channel_messages_v2(token, channel_id, start))
+    cursor = request.args.get('cursor')
+    etag = conversation_etag(token, 'channel', channel_id, 'messages', start, cursor)
+    return conditional_get(etag, lambda: src.channel.channel_messages_v2(token, channel_id, start, cursor))
 
 @APP.route("/channel/join/v2", methods=['POST'])
 def channel_join_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.channel.channel_join_v2(data['token'], data['channel_id']))
+    return persist_and_return(src.channel.channel_join_v2(data['token'], data['channel_id']))
 
 @APP.route("/channel/addowner/v1", methods=['POST'])
 def channel_addowner_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.channel.channel_addowner_v1(data['token'], data['channel_id'], data['u_id']))
+    return persist_and_return(src.channel.channel_addowner_v1(data['token'], data['channel_id'], data['u_id']))
 
 
 @APP.route("/channel/removeowner/v1", methods=['POST'])
 def channel_removeowner_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.channel.channel_removeowner_v1(data['token'], data['channel_id'], data['u_id']))
+    return persist_and_return(src.channel.channel_removeowner_v1(data['token'], data['channel_id'], data['u_id']))
 
 
 @APP.route("/channel/leave/v1", methods=['POST'])
 def channel_leave_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.channel.channel_leave_v1(data['token'], data['channel_id']))
+    return persist_and_return(src.channel.channel_leave_v1(data['token'], data['channel_id']))
 
 # Channels routes
 # =====================================================
 @APP.route("/channels/list/v2", methods=['GET'])
 def channels_list_wrapper():
     token = request.args.get('token')
-    return saveAndReturn(src.channels.channels_list_v2(token))
+    return persist_and_return(src.channels.channels_list_v2(token))
 
 @APP.route("/channels/listall/v2", methods=['GET'])
 def channels_listall_wrapper():
     token = request.args.get('token')
-    return saveAndReturn(src.channels.channels_listall_v2(token))
+    return persist_and_return(src.channels.channels_listall_v2(token))
 
 @APP.route("/channels/create/v2", methods=['POST'])
 def channels_create_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.channels.channels_create_v2(data['token'], data['name'], data['is_public']))
+    return persist_and_return(src.channels.channels_create_v2(data['token'], data['name'], data['is_public']))
 
 # Message routes
 # =====================================================
 @APP.route("/message/send/v2", methods=['POST'])
 def message_send_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.message.message_send_v2(data['token'], data['channel_id'], data['message']))
+    return persist_and_return(src.message.message_send_v2(data['token'], data['channel_id'], data['message']))
 
 @APP.route("/message/edit/v2", methods=['PUT'])
 def message_edit_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.message.message_edit_v2(data['token'], data['message_id'], data['message']))
+    return persist_and_return(src.message.message_edit_v2(data['token'], data['message_id'], data['message']))
 
 @APP.route("/message/remove/v1", methods=['DELETE'])
 def message_remove_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.message.message_remove_v1(data['token'], data['message_id']))
+    return persist_and_return(src.message.message_remove_v1(data['token'], data['message_id']))
 
 @APP.route("/message/share/v1", methods=['POST'])
 def message_share_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.message.message_share_v1(data['token'], data['og_message_id'], data['message'], data['channel_id'], data['dm_id']))
+    return persist_and_return(src.message.message_share_v1(data['token'], data['og_message_id'], data['message'], data['channel_id'], data['dm_id']))
 
 @APP.route("/message/senddm/v1", methods=['POST'])
 def message_senddm_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.message.message_senddm_v1(data['token'], data['dm_id'], data['message']))
+    return persist_and_return(src.message.message_senddm_v1(data['token'], data['dm_id'], data['message']))
 
 @APP.route("/message/react/v1", methods=['POST'])
 def message_react_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.message.message_react_v1(data['token'], data['message_id'], data['react_id']))
+    return persist_and_return(src.message.message_react_v1(data['token'], data['message_id'], data['react_id']))
 
 @APP.route("/message/sendlater/v1", methods=['POST'])
 def message_sendlater_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.message.message_sendlater_v1(data['token'], data['channel_id'], data['message'], data['time_sent']))
+    return persist_and_return(src.message.message_sendlater_v1(data['token'], data['channel_id'], data['message'], data['time_sent']))
 
 @APP.route("/message/sendlaterdm/v1", methods=['POST'])
 def message_sendlaterdm_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.message.message_sendlaterdm_v1(data['token'], data['dm_id'], data['message'], data['time_sent']))
+    return persist_and_return(src.message.message_sendlaterdm_v1(data['token'], data['dm_id'], data['message'], data['time_sent']))
 
 @APP.route("/message/unreact/v1", methods=['POST'])
 def message_unreact_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.message.message_unreact_v1(data['token'], data['message_id'], data['react_id']))
+    return persist_and_return(src.message.message_unreact_v1(data['token'], data['message_id'], data['react_id']))
 
 @APP.route("/message/pin/v1", methods=['POST'])
 def message_pin_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.message.message_pin_v1(data['token'], data['message_id']))
+    return persist_and_return(src.message.message_pin_v1(data['token'], data['message_id']))
 
 
 @APP.route("/message/unpin/v1", methods=['POST'])
 def message_unpin_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.message.message_unpin_v1(data['token'], data['message_id']))
+    return persist_and_return(src.message.message_unpin_v1(data['token'], data['message_id']))
 
 
 # Dm routes
@@ -207,51 +297,53 @@ def message_unpin_wrapper():
 def dm_details_wrapper():
     token = request.args.get('token')
     dm_id = request.args.get('dm_id')
-    return dumps(src.dm.dm_details_v1(token, dm_id))
+    return persist_and_return(src.dm.dm_details_v1(token, dm_id))
 
 @APP.route("/dm/list/v1", methods=['GET'])
 def dm_list_wrapper():
     token = request.args.get('token')
-    return dumps(src.dm.dm_list_v1(token))
+    return persist_and_return(src.dm.dm_list_v1(token))
 
 @APP.route("/dm/create/v1", methods=['POST'])
 def dm_create_wrapper():
     data = request.get_json()
-    return dumps(src.dm.dm_create_v1(data['token'], data['u_ids']))
+    return persist_and_return(src.dm.dm_create_v1(data['token'], data['u_ids']))
 
 @APP.route("/dm/remove/v1", methods=['DELETE'])
 def dm_remove_wrapper():
     data = request.get_json()
-    return dumps(src.dm.dm_remove_v1(data['token'], data['dm_id']))
+    return persist_and_return(src.dm.dm_remove_v1(data['token'], data['dm_id']))
 
 @APP.route("/dm/invite/v1", methods=['POST'])
 def dm_invite_wrapper(): 
     data = request.get_json()
-    return dumps(src.dm.dm_invite_v1(data['token'], data['dm_id'], data['u_id']))
+    return persist_and_return(src.dm.dm_invite_v1(data['token'], data['dm_id'], data['u_id']))
 
 @APP.route("/dm/leave/v1", methods=['POST'])
 def dm_leave_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.dm.dm_leave_v1(data['token'], data['dm_id']))
+    return persist_and_return(src.dm.dm_leave_v1(data['token'], data['dm_id']))
 
 @APP.route("/dm/messages/v1", methods=['GET'])
 def dm_messages_wrapper():
     token = request.args.get('token')
     dm_id = request.args.get('dm_id')
     start = request.args.get('start')
-    return saveAndReturn(src.dm.dm_messages_v1(token, dm_id, start))
+    cursor = request.args.get('cursor')
+    etag = conversation_etag(token, 'dm', dm_id, 'messages', start, cursor)
+    return conditional_get(etag, lambda: src.dm.dm_messages_v1(token, dm_id, start, cursor))
 
 # Admin routes
 # =====================================================
 @APP.route("/admin/user/remove/v1", methods=['DELETE'])
 def user_remove_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.admin.admin_user_remove_v1(data['token'], data['u_id']))
+    return persist_and_return(src.admin.admin_user_remove_v1(data['token'], data['u_id']))
 
 @APP.route("/admin/userpermission/change/v1", methods=['POST'])
 def user_permissions_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.admin.admin_userpermissions_change_v1(data['token'], data['u_id'], data['permission_id']))
+    return persist_and_return(src.admin.admin_userpermissions_change_v1(data['token'], data['u_id'], data['permission_id']))
     
 
 # User routes
@@ -260,34 +352,40 @@ def user_permissions_wrapper():
 def user_profile_wrapper():
     token = request.args.get('token')
     u_id = request.args.get('u_id')
-    return saveAndReturn(src.user.user_profile_v2(token, u_id))
+    return persist_and_return(src.user.user_profile_v2(token, u_id))
     
 @APP.route("/user/profile/setname/v2", methods=['PUT'])
 def user_setname_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.user.user_profile_setname_v2(data['token'], data['name_first'], data['name_last']))
+    return persist_and_return(src.user.user_profile_setname_v2(data['token'], data['name_first'], data['name_last']))
 
 @APP.route("/user/profile/setemail/v2", methods=['PUT'])
 def user_setemail_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.user.user_profile_setemail_v2(data['token'], data['email']))
+    return persist_and_return(src.user.user_profile_setemail_v2(data['token'], data['email']))
 
 
 @APP.route("/user/profile/sethandle/v1", methods=['PUT'])
 def user_sethandle_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.user.user_profile_sethandle_v1(data['token'], data['handle_str']))
+    return persist_and_return(src.user.user_profile_sethandle_v1(data['token'], data['handle_str']))
 
 @APP.route("/user/stats/v1", methods=['GET'])
 def user_stats_wrapper():
     token = request.args.get('token')
-    return saveAndReturn(src.user.user_stats_v1(token))
+    return persist_and_return(src.user.user_stats_v1(token))
 
 
 @APP.route("/user/profile/uploadphoto/v1", methods=['POST'])
 def user_profile_pic_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.user.user_profile_uploadphoto_v1(data['token'], data['img_url'], data['x_start'], data['y_start'], data['x_end'], data['y_end']))
+    return persist_and_return(src.user.user_profile_uploadphoto_v1(data['token'], data['img_url'], data['x_start'], data['y_start'], data['x_end'], data['y_end']))
+
+@APP.route("/user/profile/uploadphoto/status/v1", methods=['GET'])
+def user_profile_pic_status_wrapper():
+    token = request.args.get('token')
+    job_id = request.args.get('job_id')
+    return persist_and_return(src.user.user_profile_uploadphoto_status_v1(token, job_id))
 
 
 
@@ -297,30 +395,36 @@ def user_profile_pic_wrapper():
 @APP.route("/users/all/v1", methods=['GET'])
 def users_all_wrapper():
     token = request.args.get('token')
-    return saveAndReturn(src.users.users_all_v1(token))
+    limit = request.args.get('limit')
+    offset = request.args.get('offset')
+    etag = None
+    if find_user_id(token) not in (False, None):
+        etag = make_etag('users', get_version('users'), len(getData().get('users') or []), limit, offset)
+    # The directory is kept encoded as json, so it is returned as it is
+    return conditional_get(etag, lambda: src.users.users_all_encoded(token, limit, offset), encoded=True)
 
 @APP.route("/users/stats/v1", methods=['GET'])
 def users_stats_wrapper():
     token = request.args.get('token')
-    return saveAndReturn(src.users.users_stats_v1(token))
+    return persist_and_return(src.users.users_stats_v1(token))
 
 # Standup routes
 # ===========================================================
 @APP.route("/standup/start/v1", methods=['POST'])
 def standup_start_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.standup.standup_start_v1(data['token'], data['channel_id'], data['length']))
+    return persist_and_return(src.standup.standup_start_v1(data['token'], data['channel_id'], data['length']))
 
 @APP.route("/standup/active/v1", methods=['GET'])
 def standup_active_wrapper():
     token = request.args.get('token')
     channel_id = request.args.get('channel_id')
-    return saveAndReturn(src.standup.standup_active_v1(token, channel_id))
+    return persist_and_return(src.standup.standup_active_v1(token, channel_id))
 
 @APP.route("/standup/send/v1", methods=['POST'])
 def standup_send_wrapper():
     data = request.get_json()
-    return saveAndReturn(src.standup.standup_send_v1(data['token'], data['channel_id'], data['message']))
+    return persist_and_return(src.standup.standup_send_v1(data['token'], data['channel_id'], data['message']))
 
 
 # Other routes
@@ -328,21 +432,288 @@ def standup_send_wrapper():
 @APP.route("/notifications/get/v1", methods=['GET'])
 def get_notifications_wrapper():
     token = request.args.get('token')
+    u_id = find_user_id(token)
+    etag = None
+    if u_id not in (False, None):
+        etag = make_etag('notifications', u_id, get_version('notifications', u_id))
     # Check that this is the file notificaitons is in 
-    return saveAndReturn(src.message.notifications_get_v1(token))
+    return conditional_get(etag, lambda: src.message.notifications_get_v1(token))
 
 @APP.route("/search/v2", methods=['GET'])
 def search_wrapper():
     token = request.args.get('token')
     query_str = request.args.get('query_str')
-    return saveAndReturn(src.other.search_v2(token, query_str))
+    return persist_and_return(src.other.search_v2(token, query_str))
 
 @APP.route('/clear/v1', methods=['DELETE'])
 # Try not to call these the same as the functions you already have because that might lead to clashes
 def clear_wrapper():
     clear_data = src.other.clear_v1()
-    return saveAndReturn(clear_data)
+    return persist_and_return(clear_data)
+
+# Workspace routes
+# =====================================================
+@APP.route("/admin/workspace/export/v1", methods=['GET'])
+def workspace_export_wrapper():
+    token = request.args.get('token')
+    # Streamed back in chunks, taking the state lock for each chunk
+    chunks = src.workspace.workspace_export_v1(token)
+    return Response(chunks, mimetype='application/x-ndjson')
+
+@APP.route("/admin/workspace/import/v1", methods=['POST'])
+def workspace_import_wrapper():
+    token = request.args.get('token')
+    # The body is read from the request stream a line at a time without the
+    # state lock, which the import takes itself and flushes under
+    return dumps(src.workspace.workspace_import_v1(token, request.stream))
+
+# Event stream routes
+# =====================================================
+# Server-sent events for the messages of a channel or dm (see src/events.py).
+# An open stream would hold one of this app's threads for minutes, so the
+# streams are served by the asyncio listener in src/longpoll.py on its own
+# port, where an open stream holds no thread. These routes redirect there,
+# keeping the query string, so clients that only know the api's url still
+# find them.
+
+def event_stream_redirect():
+    host = request.host.split(':')[0]
+    return redirect(f"{request.scheme}://{host}:{longpoll_port()}{request.full_path}", code=307)
+
+@APP.route("/channel/events/v1", methods=['GET'])
+def channel_events_wrapper():
+    return event_stream_redirect()
+
+@APP.route("/dm/events/v1", methods=['GET'])
+def dm_events_wrapper():
+    return event_stream_redirect()
+
+# Static routes
+# =====================================================
+# Profile photos and other files in static/. Each file's ETag is a hash of
+# its content, worked out the first time it is asked for and kept until the
+# file changes. Files up to STATIC_CACHE_BYTES are kept in memory, the
+# STATIC_CACHE_LIMIT most recently used of them. Bigger files are handed to
+# the server with send_file, which uses sendfile when the server supports it.
+# Photos in static/avatars/ are named by their content, so they are cached
+# by clients for a year without asking again.
+
+STATIC_DIR = 'static'
+STATIC_CACHE_LIMIT = 512
+STATIC_CACHE_BYTES = 64 * 1024
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
+
+_static = {
+    'etags' : OrderedDict(),
+    'files' : OrderedDict(),
+    'lock' : threading.Lock(),
+}
+
+def _remember(cache, key, value):
+    with _static['lock']:
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > STATIC_CACHE_LIMIT:
+            cache.popitem(last=False)
+
+def _recall(cache, key):
+    with _static['lock']:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+def static_file_etag(path, version):
+    """
+    Returns the hash of a file's content, reading it only if it has changed
+    since it was last hashed
+    """
+    etag = _recall(_static['etags'], (path, version))
+    if etag is None:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(STATIC_CACHE_BYTES), b''):
+                digest.update(chunk)
+        etag = digest.hexdigest()[:32]
+        _remember(_static['etags'], (path, version), etag)
+    return etag
+
+@APP.route("/static/<path:filename>", methods=['GET'])
+def static_wrapper(filename):
+    path = safe_join(os.path.abspath(STATIC_DIR), filename)
+    if path is None or not os.path.isfile(path):
+        raise NotFound()
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    etag = static_file_etag(path, version)
+
+    if filename.startswith('avatars/'):
+        max_age = STATIC_MAX_AGE
+    else:
+        # Files outside avatars/ can change without their name changing
+        max_age = 0
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    if stat.st_size > STATIC_CACHE_BYTES:
+        response = send_file(path, mimetype=mimetype, conditional=True, etag=etag, max_age=max_age)
+    else:
+        content = _recall(_static['files'], (path, version))
+        if content is None:
+            with open(path, 'rb') as file:
+                content = file.read()
+            _remember(_static['files'], (path, version), content)
+        response = Response(content, mimetype=mimetype)
+        response.set_etag(etag)
+        response.cache_control.max_age = max_age
+        response = response.make_conditional(request, accept_ranges=True, complete_length=len(content))
+
+    response.cache_control.public = True
+    if max_age:
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+# Batch route
+# =====================================================
+# Routes that can be run through /batch/v1, with the names of the arguments
+# their function takes from the request body, in order
+BATCH_OPERATIONS = {
+    'channel/invite/v2' : (src.channel.channel_invite_v2, ('token', 'channel_id', 'u_id')),
+    'channel/join/v2' : (src.channel.channel_join_v2, ('token', 'channel_id')),
+    'channel/addowner/v1' : (src.channel.channel_addowner_v1, ('token', 'channel_id', 'u_id')),
+    'channel/removeowner/v1' : (src.channel.channel_removeowner_v1, ('token', 'channel_id', 'u_id')),
+    'channel/leave/v1' : (src.channel.channel_leave_v1, ('token', 'channel_id')),
+    'channels/create/v2' : (src.channels.channels_create_v2, ('token', 'name', 'is_public')),
+    'message/send/v2' : (src.message.message_send_v2, ('token', 'channel_id', 'message')),
+    'message/edit/v2' : (src.message.message_edit_v2, ('token', 'message_id', 'message')),
+    'message/remove/v1' : (src.message.message_remove_v1, ('token', 'message_id')),
+    'message/share/v1' : (src.message.message_share_v1, ('token', 'og_message_id', 'message', 'channel_id', 'dm_id')),
+    'message/senddm/v1' : (src.message.message_senddm_v1, ('token', 'dm_id', 'message')),
+    'message/react/v1' : (src.message.message_react_v1, ('token', 'message_id', 'react_id')),
+    'message/unreact/v1' : (src.message.message_unreact_v1, ('token', 'message_id', 'react_id')),
+    'message/pin/v1' : (src.message.message_pin_v1, ('token', 'message_id')),
+    'message/unpin/v1' : (src.message.message_unpin_v1, ('token', 'message_id')),
+    'message/sendlater/v1' : (src.message.message_sendlater_v1, ('token', 'channel_id', 'message', 'time_sent')),
+    'message/sendlaterdm/v1' : (src.message.message_sendlaterdm_v1, ('token', 'dm_id', 'message', 'time_sent')),
+    'dm/create/v1' : (src.dm.dm_create_v1, ('token', 'u_ids')),
+    'dm/remove/v1' : (src.dm.dm_remove_v1, ('token', 'dm_id')),
+    'dm/invite/v1' : (src.dm.dm_invite_v1, ('token', 'dm_id', 'u_id')),
+    'dm/leave/v1' : (src.dm.dm_leave_v1, ('token', 'dm_id')),
+    'admin/user/remove/v1' : (src.admin.admin_user_remove_v1, ('token', 'u_id')),
+    'admin/userpermission/change/v1' : (src.admin.admin_userpermissions_change_v1, ('token', 'u_id', 'permission_id')),
+    'user/profile/setname/v2' : (src.user.user_profile_setname_v2, ('token', 'name_first', 'name_last')),
+    'user/profile/setemail/v2' : (src.user.user_profile_setemail_v2, ('token', 'email')),
+    'user/profile/sethandle/v1' : (src.user.user_profile_sethandle_v1, ('token', 'handle_str')),
+    'standup/send/v1' : (src.standup.standup_send_v1, ('token', 'channel_id', 'message')),
+}
+
+# The type each argument must have. The route functions expect these and do
+# not check them, so a batch checks them all before running an operation
+# rather than stopping partway through one.
+BATCH_ARGUMENT_TYPES = {
+    'token' : str,
+    'channel_id' : int,
+    'dm_id' : int,
+    'u_id' : int,
+    'u_ids' : list,
+    'message_id' : int,
+    'og_message_id' : int,
+    'react_id' : int,
+    'permission_id' : int,
+    'time_sent' : (int, float),
+    'is_public' : bool,
+    'name' : str,
+    'message' : str,
+    'name_first' : str,
+    'name_last' : str,
+    'email' : str,
+    'handle_str' : str,
+}
+
+def valid_batch_argument(name, value):
+    expected = BATCH_ARGUMENT_TYPES[name]
+    # JSON true and false are bools, which are also ints in Python
+    if isinstance(value, bool) and expected is not bool:
+        return False
+    if name == 'u_ids':
+        return isinstance(value, list) and all(valid_batch_argument('u_id', u_id) for u_id in value)
+    return isinstance(value, expected)
+
+def batch_error(code, message):
+    return {'error' : {'code' : code, 'name' : 'System Error', 'message' : message}}
+
+@APP.route("/batch/v1", methods=['POST'])
+def batch_wrapper():
+    """
+    Runs a list of operations in order, e.g.
+        {"operations" : [{"route" : "message/send/v2", "body" : {"token" : ..., ...}}, ...]}
+    and returns the result or error of each one, in the same order. An
+    InputError or AccessError in one operation, or a malformed operation or
+    body, does not stop the ones after it. Anything else is a bug and is
+    raised as it would be by the operation's own route. The changes made by
+    the whole batch are written to the log once.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('operations'), list):
+        raise InputError(description = 'The body must have a list of operations')
+    results = []
+    for operation in data['operations']:
+        if not isinstance(operation, dict) or not isinstance(operation.get('route', ''), str):
+            results.append(batch_error(400, "Each operation must have a route and a body"))
+            continue
+        route = operation.get('route', '').strip('/')
+        if route not in BATCH_OPERATIONS:
+            results.append(batch_error(400, f"Cannot run {route} in a batch"))
+            continue
+        function, arg_names = BATCH_OPERATIONS[route]
+        body = operation.get('body', {})
+        if not isinstance(body, dict):
+            results.append(batch_error(400, f"The body of {route} must be an object"))
+            continue
+        missing = [name for name in arg_names if name not in body]
+        if missing:
+            results.append(batch_error(400, f"Missing {', '.join(missing)}"))
+            continue
+        invalid = [name for name in arg_names if not valid_batch_argument(name, body[name])]
+        if invalid:
+            results.append(batch_error(400, f"Invalid {', '.join(invalid)}"))
+            continue
+        try:
+            results.append({'result' : function(*[body[name] for name in arg_names])})
+        except (InputError, AccessError) as err:
+            results.append(batch_error(err.code, err.get_description()))
+    return persist_and_return({'results' : results})
+
+TIMER_LOCK_FILE = 'database.timer.lock'
+_timer_lock = None
+
+def start_timer():
+    """
+    Starts the send later scheduler and the replacing of removed users'
+    messages, unless another server process using the same database has
+    already started them.
+    Returns whether the scheduler was started by this process.
+    """
+    global _timer_lock
+    if _timer_lock is not None:
+        return False
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+    _timer_lock = open(TIMER_LOCK_FILE, 'a')
+    if fcntl is not None:
+        try:
+            fcntl.flock(_timer_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+    start_scheduler()
+    # Carry on replacing the messages of users removed before a restart
+    src.admin.start_removals()
+    return True
 
 if __name__ == "__main__":
-    _thread.start_new_thread(src.timer.timer, ())
+    start_timer()
+    start_longpoll()
     APP.run(port=config.port) # Do not edit this port
@@ -0,0 +1,79 @@
+import threading
+from collections import OrderedDict
+from src.helper import find_user_id as decode_token
+from src.registry import valid_user
+
+# Remembers which user each recently used token belongs to, so a request
+# only has to decode its token the first time it is seen. Holds at most
+# SESSION_LIMIT tokens, dropping the least recently used one when full.
+# Tokens are dropped by the auth/logout/v1 route as soon as they are logged
+# out, and all of a user's tokens are dropped when they are removed or their
+# permissions change.
+
+SESSION_LIMIT = 10000
+
+_sessions = {
+    'tokens' : OrderedDict(),
+    'users' : {},
+    'lock' : threading.Lock(),
+}
+
+def _forget(token):
+    u_id = _sessions['tokens'].pop(token, None)
+    if u_id is not None:
+        user_tokens = _sessions['users'].get(u_id, set())
+        user_tokens.discard(token)
+        if not user_tokens:
+            _sessions['users'].pop(u_id, None)
+
+def find_user_id(token):
+    """
+    Returns the u_id of the user the token belongs to, or False if it is
+    not a valid token. Same as src.helper.find_user_id, but cached.
+
+    Arguments:
+        token (str) - the user's token
+
+    Return Value:
+        u_id (int) or False
+    """
+    tokens = _sessions['tokens']
+    with _sessions['lock']:
+        u_id = tokens.get(token) if isinstance(token, str) else None
+        if u_id is not None:
+            tokens.move_to_end(token)
+    if u_id is not None and valid_user(u_id):
+        return u_id
+
+    u_id = decode_token(token)
+    if u_id is not False and u_id is not None and isinstance(token, str):
+        with _sessions['lock']:
+            tokens[token] = u_id
+            tokens.move_to_end(token)
+            _sessions['users'].setdefault(u_id, set()).add(token)
+            if len(tokens) > SESSION_LIMIT:
+                _forget(next(iter(tokens)))
+    return u_id
+
+def end_session(token):
+    """
+    Forgets a token, e.g. after it has been logged out
+    """
+    with _sessions['lock']:
+        _forget(token)
+
+def end_user_sessions(u_id):
+    """
+    Forgets every token belonging to a user
+    """
+    with _sessions['lock']:
+        for token in list(_sessions['users'].get(u_id, ())):
+            _forget(token)
+
+def end_all_sessions():
+    """
+    Forgets every token, e.g. after data has been cleared
+    """
+    with _sessions['lock']:
+        _sessions['tokens'].clear()
+        _sessions['users'].clear()
@@ -0,0 +1,141 @@
+from src.data import getData
+from src.user_index import member_channel_ids, member_dm_ids
+
+# Running counts behind users/stats and user/stats, so neither has to go
+# through every channel, dm and message to work out its numbers. The
+# channels and dms each user is in are looked up in src.user_index.
+#
+# Channels, dms, messages and users are only ever appended to their lists,
+# so anything new at the end of a list is counted the next time the counts
+# are used. The member sets of each channel/dm are kept so that
+# conversation_changed() (called through registry.members_changed) can work
+# out who joined. Messages that are removed are reported through
+# message_edited(). The counts are kept in memory only and are counted again
+# from data if any of the lists are replaced (e.g. by clear).
+
+REMOVED_MESSAGES = ("This message has been removed", "This dm has been removed")
+
+_LISTS = (('users', 'users'), ('channels', 'channels'), ('dms', 'dm'), ('messages', 'messages'))
+
+def _empty():
+    return {
+        'lists' : {},
+        'seen' : {'users' : 0, 'channels' : 0, 'dms' : 0, 'messages' : 0},
+        'members' : {'channels' : {}, 'dms' : {}},
+        'user_messages' : {},
+        'active_users' : set(),
+        'live_dms' : set(),
+        'removed_messages' : set(),
+    }
+
+_stats = _empty()
+
+def _count(counter, u_id, change):
+    counter[u_id] = counter.get(u_id, 0) + change
+
+def _set_members(kind, conversation_id, members):
+    """
+    Replaces the stored member set of a channel/dm and marks everyone that
+    joined as active
+    """
+    old = _stats['members'][kind].get(conversation_id, set())
+    for u_id in members - old:
+        _stats['active_users'].add(u_id)
+    if members:
+        _stats['members'][kind][conversation_id] = members
+    else:
+        _stats['members'][kind].pop(conversation_id, None)
+
+def _member_ids(conversation):
+    return {member.get('u_id') for member in conversation.get('all_members', [])}
+
+def _sync():
+    """
+    Counts anything appended to data since the counts were last used
+    """
+    global _stats
+    data = getData()
+    lists = {}
+    for name, key in _LISTS:
+        lists[name] = data.get(key)
+        if lists[name] is None:
+            lists[name] = []
+    for name, records in lists.items():
+        if records is not _stats['lists'].get(name, records) or len(records) < _stats['seen'][name]:
+            _stats = _empty()
+            break
+    _stats['lists'] = lists
+
+    for user in lists['users'][_stats['seen']['users']:]:
+        if 'channels_in' in user or 'dms_in' in user:
+            _stats['active_users'].add(user.get('auth_user_id'))
+    for channel in lists['channels'][_stats['seen']['channels']:]:
+        _set_members('channels', channel.get('channel_id'), _member_ids(channel))
+    for dm in lists['dms'][_stats['seen']['dms']:]:
+        if isinstance(dm.get('dm_id'), int):
+            _stats['live_dms'].add(dm.get('dm_id'))
+            _set_members('dms', dm.get('dm_id'), _member_ids(dm))
+    for message in lists['messages'][_stats['seen']['messages']:]:
+        _count(_stats['user_messages'], message.get('sender'), 1)
+        if message.get('message') in REMOVED_MESSAGES:
+            _stats['removed_messages'].add(message.get('message_id'))
+
+    for name, records in lists.items():
+        _stats['seen'][name] = len(records)
+
+def conversation_changed(kind, conversation_id):
+    """
+    Updates the counts after the members of a channel or dm changed, or a dm
+    was removed
+
+    Arguments:
+        kind (str) - 'channel' or 'dm'
+        conversation_id (int) - the channel or dm's id
+
+    Return Value:
+        None
+    """
+    _sync()
+    name = kind + 's'
+    records = _stats['lists'][name]
+    if not isinstance(conversation_id, int) or not 0 < conversation_id <= len(records):
+        return
+    conversation = records[conversation_id - 1]
+    if name == 'dms' and conversation.get('dm_id') != conversation_id:
+        # The dm has been removed
+        _stats['live_dms'].discard(conversation_id)
+        _set_members('dms', conversation_id, set())
+        return
+    _set_members(name, conversation_id, _member_ids(conversation))
+
+def message_edited(message):
+    """
+    Updates the count of messages after the text of a message has changed
+    """
+    _sync()
+    if message.get('message') in REMOVED_MESSAGES:
+        _stats['removed_messages'].add(message.get('message_id'))
+
+def dreams_counts():
+    """
+    Returns the numbers that make up users/stats
+
+    Return Value:
+        (channels_exist, dms_exist, messages_exist, active_users, total_users)
+    """
+    _sync()
+    lists = _stats['lists']
+    messages_exist = len(lists['messages']) - len(_stats['removed_messages'])
+    return (len(lists['channels']), len(_stats['live_dms']), messages_exist,
+            len(_stats['active_users']), len(lists['users']))
+
+def user_counts(u_id):
+    """
+    Returns the numbers that make up a user's user/stats
+
+    Return Value:
+        (channels_joined, dms_joined, messages_sent)
+    """
+    _sync()
+    return (len(member_channel_ids(u_id)), len(member_dm_ids(u_id)),
+            _stats['user_messages'].get(u_id, 0))
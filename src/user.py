@@ -1,14 +1,13 @@
 from src.data import getData
 from src.error import InputError, AccessError
-from src.helper import check_valid_info, find_user_id, get_user_info, check_valid, user_message_count, is_jpg, get_timestamp
-from src.helper import all_dm_count, all_message_count, get_involvement_rate
-from src.channels import channels_list_v2, channels_listall_v2
-from src.dm import dm_list_v1
-import urllib.request
-from PIL import Image
-from src import config
-import os 
-import requests
+from src.helper import get_user_info, check_valid, is_jpg, get_timestamp
+from src.sessions import find_user_id
+from src.helper import get_involvement_rate
+from src.stats import dreams_counts, user_counts
+from src.registry import get_user, valid_user, user_by_email, user_by_handle, update_email, update_handle
+from src.versions import bump_version
+from src.users import directory_changed
+from src.photos import start_photo_job, photo_job_status
 
 
 
@@ -39,7 +38,7 @@ def user_profile_v2(token, u_id):
     if auth_user_id == False:
         raise AccessError(description = 'User is not a registered user')
 
-    if check_valid_info(data['users'], auth_user_id) and check_valid_info(data['users'], u_id):
+    if valid_user(auth_user_id) and valid_user(u_id):
             user_info = {
                 'u_id' : data['users'][u_id - 1].get('auth_user_id'),
                 'email' : data['users'][u_id - 1].get('email'),
@@ -75,10 +74,12 @@ def user_profile_setname_v2(token, name_first, name_last):
         raise InputError("First name or last name is not between 1 and 50 characters inclusively in length") 
     
     auth_user_id = find_user_id(token)
-    if check_valid_info(data['users'], auth_user_id):
+    if valid_user(auth_user_id):
         #if token is found, set new names as requested
         data['users'][auth_user_id - 1]['f_name'] = name_first
         data['users'][auth_user_id - 1]['l_name'] = name_last
+        bump_version('users')
+        directory_changed(auth_user_id)
         return {
         }
     else:  
@@ -105,14 +106,17 @@ def user_profile_setemail_v2(token, email):
         raise InputError(description ="Requested new email is not valid")
 
     # Check that the email being changed to is not already being used by another user
-    for user in data['users']:
-        if user.get('email') == email:
-            raise InputError(description ='Email already being used by another user')
+    if user_by_email(email) != None:
+        raise InputError(description ='Email already being used by another user')
 
     auth_user_id = find_user_id(token)
-    if check_valid_info(data['users'], auth_user_id):
+    if valid_user(auth_user_id):
         #if token is found, set new names as requested
-        data['users'][auth_user_id - 1]['email'] = email
+        user = get_user(auth_user_id)
+        update_email(auth_user_id, user.get('email'), email)
+        user['email'] = email
+        bump_version('users')
+        directory_changed(auth_user_id)
         
     else:  
         raise AccessError(description = "Can only set email for a registered user")
@@ -140,16 +144,17 @@ def user_profile_sethandle_v1(token, handle_str):
         raise InputError(description ="Requested handle is not of valid length")
 
     #check that handle is not already in use 
-    i = 0
-    while i < len(data["users"]):
-        if data["users"][i].get("handle_str") == handle_str:
-            raise InputError(description = "This handle is already in use by another user")
-        i += 1
+    if user_by_handle(handle_str) != None:
+        raise InputError(description = "This handle is already in use by another user")
 
     auth_user_id = find_user_id(token)
-    if check_valid_info(data['users'], auth_user_id):
+    if valid_user(auth_user_id):
         #if token is found, set new names as requested
-        data['users'][auth_user_id - 1]['handle_str'] = handle_str
+        user = get_user(auth_user_id)
+        update_handle(auth_user_id, user.get('handle_str'), handle_str)
+        user['handle_str'] = handle_str
+        bump_version('users')
+        directory_changed(auth_user_id)
         return {
         }
     else:  
@@ -178,38 +183,15 @@ def user_stats_v1(token):
     # Get the current timestamp
     time_stamp = get_timestamp()
 
-    #set desired stats to zero
-    num_channels_joined = 0
-    num_dms_joined = 0
-    num_msgs_sent = 0
-    num_dreams_channels = 0
-    num_dreams_dms = 0
-    num_dreams_msgs = 0
-    
     auth_user_id = find_user_id(token)
     if auth_user_id == False: 
         raise AccessError(description ="This is not a valid user")
     
-    #find total number of dreams channels
-    all_channels_list = channels_listall_v2(token)
-    num_dreams_channels = len(all_channels_list)
-
-    #find total number of dreams dms
-    num_dreams_dms = all_dm_count()
-
-    #find total number of dreams messages
-    num_dreams_msgs = all_message_count()
-
-    #find num of channels joined
-    channel_list = channels_list_v2(token)
-    num_channels_joined = len(channel_list["channels"])
+    #find total number of dreams channels, dms and messages
+    num_dreams_channels, num_dreams_dms, num_dreams_msgs = dreams_counts()[0:3]
 
-    #find num of dm's joined
-    dm_list = dm_list_v1(token)
-    num_dms_joined = len(dm_list['dms'])
-    
-    #find num of messages sent
-    num_msgs_sent = user_message_count(token)
+    #find num of channels joined, dm's joined and messages sent
+    num_channels_joined, num_dms_joined, num_msgs_sent = user_counts(auth_user_id)
 
     #calculate involvment rate
     involvement_rate = get_involvement_rate(num_channels_joined, num_dms_joined, num_msgs_sent, num_dreams_channels, num_dreams_dms, num_dreams_msgs)
@@ -249,6 +231,8 @@ def user_stats_v1(token):
 def user_profile_uploadphoto_v1(token, img_url, x_start, y_start, x_end, y_end): 
     """
     Given a URL of an image on the internet, crops the image within bounds (x_start, y_start) and (x_end, y_end). Position (0,0) is the top left.
+    The image is downloaded and cropped in the background, and the returned job_id can be
+    passed to user/profile/uploadphoto/status/v1 to find out when it is done.
 
     Arguments: 
     token (str) - unique session id for the authorised user 
@@ -259,63 +243,60 @@ def user_profile_uploadphoto_v1(token, img_url, x_start, y_start, x_end, y_end):
     y_end (int) - y coordinate for the end of the crop 
     
     Exceptions:
-        InputError - img_url returns an HTTP status other than 200.
-        InputError - any of x_start, y_start, x_end, y_end are not within the dimensions of the image at the URL.
         InputError - Image uploaded is not a JPG
+        InputError - the crop bounds are negative or end before they start
+        AccessError - This is not a valid user
+    The job fails with the reason if:
+        - img_url returns an HTTP status other than 200.
+        - any of x_start, y_start, x_end, y_end are not within the dimensions of the image at the URL.
+        - the image is bigger than src.photos.MAX_PHOTO_BYTES
     
     Return Value: 
-        None
+        job_id (int) - the id of the upload
     """
-    data = getData()
-    
-    #if the response status is not 200, raise an input error
-    status = requests.get(img_url)
-    if status.status_code != 200:
-        raise InputError(description="This image url is not valid")
-
-    #get the size of the image from url 
-    image = Image. open(urllib. request. urlopen(img_url))
-    width, height = image. size
+    auth_user_id = find_user_id(token)
+    if auth_user_id == False: 
+        raise AccessError(description ="This is not a valid user")
 
     #check negative coordinates for crop 
-    if x_start < 0 or y_start < 0 or x_end < 0 or y_start < 0: 
+    if x_start < 0 or y_start < 0 or x_end < 0 or y_end < 0: 
         raise InputError(description="Invalid bounds for crop - negative values are invalid")
 
     #check if end crop values are below start values
     if x_end < x_start or y_end < y_start:
         raise InputError(description="Invalid bounds for crop - start crop co-ords are invalid")
 
-    #check if end crop values are more than the image size 
-    if x_end > width or y_end > height:
-        raise InputError(description="Invalid bounds for crop - end crop co-ords are invalid")
-   
     #if the image is not a jpg, raise an input error
     if not is_jpg(img_url): 
         raise InputError(description="This image is not a jpg")
-    
-    auth_user_id = find_user_id(token)
-    if auth_user_id == False: 
-        raise AccessError(description ="This is not a valid user")
 
-    #retrieve image and save 
-    imagename = str(auth_user_id) + "_profile.jpg"
-    urllib.request.urlretrieve(img_url, imagename)
-    # opens the image 
-    imageObject = Image.open(imagename)
-    #crop the image 
-    cropped = imageObject.crop((x_start, y_start, x_end, y_end))
-    
-    #save the image, first must check if the static file exists to save the cropped image. If not, create one 
-    path = "static"
-    if not os.path.exists(path): 
-        os.mkdir(path)
+    # Checking the image against its size happens once it has been downloaded
+    job_id = start_photo_job(auth_user_id, img_url, x_start, y_start, x_end, y_end)
+    return { 
+        'job_id' : job_id
+    }
 
-    cropped.save("static/" + imagename)
-    
-    profile_image_url = str(config.url) + "static/" + imagename
-    #store the image url 
+def user_profile_uploadphoto_status_v1(token, job_id):
+    """
+    Returns whether a profile photo upload has finished
 
-    data['users'][auth_user_id - 1]['profile_img_url'] = profile_image_url
+    Arguments:
+        token (str) - unique session id for the authorised user
+        job_id (int) - the job_id returned by user/profile/uploadphoto/v1
 
-    return { 
-    }
+    Exceptions:
+        InputError - job_id is not one of the user's uploads
+        AccessError - This is not a valid user
+
+    Return Value:
+        status (str) - 'pending', 'done' or 'failed'
+        error (str) - why the upload failed, or None
+    """
+    auth_user_id = find_user_id(token)
+    if auth_user_id == False: 
+        raise AccessError(description ="This is not a valid user")
+    try:
+        job_id = int(job_id)
+    except (TypeError, ValueError):
+        raise InputError(description="This is not a valid photo upload")
+    return photo_job_status(auth_user_id, job_id)
@@ -0,0 +1,137 @@
+from src.data import getData
+
+# Reverse indexes from a user to the messages they sent, the channels they
+# own and the channels and dms they are a member of, so anything that works
+# on one user's records only has to touch those records.
+#
+# Channels, dms and messages are only ever appended to their lists, so
+# anything new at the end of a list is indexed the next time an index is
+# used. The member and owner sets of each channel/dm are kept so that
+# conversation_changed() (called through registry.members_changed) can work
+# out who joined or left. The indexes are kept in memory only and are built
+# again from data if any of the lists are replaced (e.g. by clear).
+
+_LISTS = (('channels', 'channels'), ('dms', 'dm'), ('messages', 'messages'))
+
+def _empty():
+    return {
+        'lists' : {},
+        'seen' : {'channels' : 0, 'dms' : 0, 'messages' : 0},
+        'conversations' : {},
+        'channels' : {},
+        'owned' : {},
+        'dms' : {},
+        'messages' : {},
+    }
+
+_index = _empty()
+
+def _member_ids(conversation, list_key):
+    return {member.get('u_id') for member in conversation.get(list_key) or []}
+
+def _set_members(index_key, conversation_id, members):
+    """
+    Replaces the stored member set of a channel/dm and adds or removes it
+    from the sets of everyone that joined or left
+    """
+    by_user = _index[index_key]
+    old = _index['conversations'].get((index_key, conversation_id), set())
+    for u_id in members - old:
+        by_user.setdefault(u_id, set()).add(conversation_id)
+    for u_id in old - members:
+        conversation_ids = by_user.get(u_id, set())
+        conversation_ids.discard(conversation_id)
+        if not conversation_ids:
+            by_user.pop(u_id, None)
+    if members:
+        _index['conversations'][(index_key, conversation_id)] = members
+    else:
+        _index['conversations'].pop((index_key, conversation_id), None)
+
+def _index_channel(channel):
+    channel_id = channel.get('channel_id')
+    _set_members('channels', channel_id, _member_ids(channel, 'all_members'))
+    _set_members('owned', channel_id, _member_ids(channel, 'owner_members'))
+
+def _index_dm(dm_id, dm):
+    if dm.get('dm_id') != dm_id:
+        # The dm has been removed
+        _set_members('dms', dm_id, set())
+    else:
+        _set_members('dms', dm_id, _member_ids(dm, 'all_members'))
+
+def _sync():
+    """
+    Indexes anything appended to data since the indexes were last used
+    """
+    global _index
+    data = getData()
+    lists = {}
+    for name, key in _LISTS:
+        lists[name] = data.get(key)
+        if lists[name] is None:
+            lists[name] = []
+    for name, records in lists.items():
+        if records is not _index['lists'].get(name, records) or len(records) < _index['seen'][name]:
+            _index = _empty()
+            break
+    _index['lists'] = lists
+
+    for channel in lists['channels'][_index['seen']['channels']:]:
+        _index_channel(channel)
+    for dm_id, dm in enumerate(lists['dms'][_index['seen']['dms']:], _index['seen']['dms'] + 1):
+        _index_dm(dm_id, dm)
+    for message in lists['messages'][_index['seen']['messages']:]:
+        _index['messages'].setdefault(message.get('sender'), []).append(message.get('message_id'))
+
+    for name, records in lists.items():
+        _index['seen'][name] = len(records)
+
+def conversation_changed(kind, conversation_id):
+    """
+    Updates the indexes after the members or owners of a channel or dm
+    changed, or a dm was removed
+
+    Arguments:
+        kind (str) - 'channel' or 'dm'
+        conversation_id (int) - the channel or dm's id
+
+    Return Value:
+        None
+    """
+    _sync()
+    records = _index['lists'][kind + 's']
+    if not isinstance(conversation_id, int) or not 0 < conversation_id <= len(records):
+        return
+    if kind == 'channel':
+        _index_channel(records[conversation_id - 1])
+    else:
+        _index_dm(conversation_id, records[conversation_id - 1])
+
+def sent_message_ids(u_id):
+    """
+    Returns the ids of the messages a user has sent, oldest first
+    """
+    _sync()
+    return _index['messages'].get(u_id, [])
+
+def member_channel_ids(u_id):
+    """
+    Returns the set of ids of the channels a user is a member of
+    """
+    _sync()
+    return _index['channels'].get(u_id, set())
+
+def owned_channel_ids(u_id):
+    """
+    Returns the set of ids of the channels a user is an owner of
+    """
+    _sync()
+    return _index['owned'].get(u_id, set())
+
+def member_dm_ids(u_id):
+    """
+    Returns the set of ids of the dms a user is a member of
+    """
+    _sync()
+    return _index['dms'].get(u_id, set())
@@ -1,43 +1,131 @@
 from src.data import getData
 from src.error import InputError, AccessError
-from src.helper import get_end_nums, check_valid, find_user_id, get_timestamp, all_chan_count
-from src.helper import all_dm_count, all_message_count, get_timestamp, get_utilization_rate
-from src.channels import channels_listall_v2, channels_list_v2
-from src.dm import dm_list_v1
+from src.helper import get_end_nums, check_valid, get_timestamp
+from src.sessions import find_user_id
+from src.helper import get_utilization_rate
+from src.stats import dreams_counts
 import re
+from json import dumps
+
+# users/all is answered from a cached directory of every user's entry, each
+# also kept encoded as json, and the encoded response for all users is kept
+# until a user changes. Users registered since the directory was last used are
+# appended to the end of it. Anything that changes the name, email, handle or
+# photo of a user already registered calls directory_changed().
+
+_directory = {
+    'users' : None,
+    'entries' : [],
+    'encoded' : [],
+    'snapshot' : None,
+}
+
+def _entry(user):
+    return {
+        "u_id": user.get('auth_user_id'),
+        "email": user.get('email'),
+        "name_first": user.get('f_name'),
+        "name_last": user.get('l_name'),
+        "handle_str": user.get('handle_str')
+    }
+
+def _sync_directory():
+    """
+    Adds any users registered since the directory was last used, starting
+    again if data['users'] has been replaced or cleared
+    """
+    users = getData().get('users')
+    if users is None:
+        users = []
+    if users is not _directory['users'] or len(users) < len(_directory['entries']):
+        _directory['users'] = users
+        _directory['entries'] = []
+        _directory['encoded'] = []
+        _directory['snapshot'] = None
+    if len(users) > len(_directory['entries']):
+        for user in users[len(_directory['entries']):]:
+            entry = _entry(user)
+            _directory['entries'].append(entry)
+            _directory['encoded'].append(dumps(entry))
+        _directory['snapshot'] = None
+
+def directory_changed(u_id):
+    """
+    Updates a user's entry in the directory after their profile has changed
+
+    Arguments:
+        u_id (int) - the user's id
+
+    Return Value:
+        None
+    """
+    index = u_id - 1 if isinstance(u_id, int) else -1
+    users = _directory['users']
+    if users is getData().get('users') and 0 <= index < len(_directory['entries']):
+        entry = _entry(users[index])
+        _directory['entries'][index] = entry
+        _directory['encoded'][index] = dumps(entry)
+    else:
+        _directory['users'] = None
+    _directory['snapshot'] = None
+
+def _page(token, limit, offset):
+    """
+    Checks the token and returns the range of the directory being asked for
+    """
+    token_valid = find_user_id(token)
+    if token_valid == False:
+        raise AccessError(description = 'User not registered in Dreams')
 
-def users_all_v1(token):
+    _sync_directory()
+    total = len(_directory['entries'])
+    if limit == None:
+        return 0, total, total
+    try:
+        limit = int(limit)
+        offset = int(offset) if offset != None else 0
+    except (TypeError, ValueError):
+        raise InputError(description = 'limit and offset must be numbers')
+    if limit < 0 or offset < 0:
+        raise InputError(description = 'limit and offset cannot be negative')
+    return min(offset, total), min(offset + limit, total), total
+
+def users_all_v1(token, limit=None, offset=None):
     """
-    Returns a list of all users and their associated details
+    Returns a list of all users and their associated details, or up to limit
+    of them starting from offset
 
     Arguments:
         token (str) - the user's token
+        limit (int) - the most users to return, or None for all of them
+        offset (int) - the number of users to skip
     
     Exceptions:
-        N/A
+        InputError - limit or offset is not a number that is 0 or more
     
     Return Value:
         users (list of dict) - each dictionary contains types: user
+        total (int) - the number of users, if a limit was given
     """
-    data = getData()
-
-    token_valid = find_user_id(token)
-    if token_valid == False:
-        raise AccessError(description = 'User not registered in Dreams')
-   
-    users_list = {'users' : []}
-    for user in data['users']:
-        user_dict = {
-            "u_id": user.get('auth_user_id'),
-            "email": user.get('email'),
-            "name_first": user.get('f_name'),
-            "name_last": user.get('l_name'),
-            "handle_str": user.get('handle_str')
-        }
-        users_list['users'].append(user_dict)
-
+    start, end, total = _page(token, limit, offset)
+    users_list = {'users' : [dict(entry) for entry in _directory['entries'][start:end]]}
+    if limit != None:
+        users_list['total'] = total
     return users_list
 
+def users_all_encoded(token, limit=None, offset=None):
+    """
+    Same as users_all_v1, but returns the response already encoded as json.
+    The encoded response for all users is kept until a user changes.
+    """
+    start, end, total = _page(token, limit, offset)
+    if limit != None:
+        users = ', '.join(_directory['encoded'][start:end])
+        return f'{{"users": [{users}], "total": {total}}}'
+    if _directory['snapshot'] == None:
+        _directory['snapshot'] = '{"users": [' + ', '.join(_directory['encoded']) + ']}'
+    return _directory['snapshot']
+
 def users_stats_v1(token):
     """
     Fetches the required statistics about this user's use of UNSW Dreams
@@ -67,32 +155,9 @@ def users_stats_v1(token):
         raise AccessError(description = 'User is not a registered user')
 
 
-    #set desired stats to zero
-    num_dreams_channels = 0
-    num_dreams_dms = 0
-    num_dreams_msgs = 0
-
-
-    #find total number of dreams channels
-    num_dreams_channels = all_chan_count()
-
-    #find total number of dreams dms
-    num_dreams_dms = all_dm_count()
-
-    #find total number of dreams messages
-    num_dreams_msgs = all_message_count()
-
-    #find number of users who have joined at least one channel or dm
-    active_users = 0
-    for user in data['users']:
-        if 'channels_in' in user:
-            active_users += 1
-        elif 'dms_in' in user:
-            active_users += 1
-
-
-    #find the total number of users
-    total_users = len(data['users'])
+    #find the number of dreams channels, dms and messages, the number of users
+    #who have joined at least one channel or dm and the total number of users
+    num_dreams_channels, num_dreams_dms, num_dreams_msgs, active_users, total_users = dreams_counts()
 
     #calculate utilization rate
     utilization_rate = get_utilization_rate(active_users, total_users)
@@ -0,0 +1,62 @@
+from uuid import uuid4
+
+# Version counters for the things clients poll, so a GET route can work out
+# an ETag for its response without running its handler. Every function that
+# changes a channel, dm, user or notification feed bumps its counter.
+#
+#     ('channel', channel_id) - members, owners and the channel's messages
+#     ('dm', dm_id)           - members and the dm's messages
+#     ('users', None)         - the name, email, handle or photo of any user
+#     ('notifications', u_id) - the user's notification feed
+#
+# The counters are kept in memory only. ETags start with an epoch that is
+# picked again when the server starts or data is cleared, so an ETag from
+# before then never matches a counter that has been counted up again.
+
+_versions = {
+    'epoch' : uuid4().hex[:12],
+    'counters' : {},
+}
+
+def bump_version(kind, record_id=None):
+    """
+    Marks a channel, dm, the user directory or a notification feed as changed
+    """
+    key = (kind, record_id)
+    _versions['counters'][key] = _versions['counters'].get(key, 0) + 1
+
+def bump_message_version(message):
+    """
+    Marks the channel or dm a message was sent to as changed
+    """
+    if 'dm_id' in message:
+        bump_version('dm', message.get('dm_id'))
+    elif 'channel_id' in message:
+        bump_version('channel', message.get('channel_id'))
+
+def get_version(kind, record_id=None):
+    """
+    Returns the number of times a channel, dm, the user directory or a
+    notification feed has been marked as changed
+    """
+    return _versions['counters'].get((kind, record_id), 0)
+
+def reset_versions():
+    """
+    Forgets every counter and starts a new epoch, e.g. after data has been
+    cleared or replaced
+    """
+    _versions['epoch'] = uuid4().hex[:12]
+    _versions['counters'] = {}
+
+def make_etag(*parts):
+    """
+    Returns an ETag (without quotes) made from the epoch and the given parts
+
+    Arguments:
+        parts - versions, ids and request arguments the response depends on
+
+    Return Value:
+        etag (str)
+    """
+    return '-'.join([_versions['epoch']] + [str(part) for part in parts])
@@ -0,0 +1,233 @@
+from json import dumps, loads
+from src.data import getData
+from src.error import InputError, AccessError
+from src.persistence import STATE_LOCK, flush
+from src.registry import is_dreams_owner
+from src.sessions import find_user_id, end_all_sessions
+from src.message_index import index_message
+from src.search_index import rebuild as rebuild_search_index
+from src.scheduler import reschedule
+from src.admin import start_removals
+from src.versions import reset_versions
+
+# Moves a whole workspace in and out of Dreams as newline delimited json.
+#
+# Every top level key of data is written in turn. Lists (users, channels, dm,
+# messages, ...) are written one record per line:
+#     {"key": "messages", "list": true}
+#     {"key": "messages", "record": {...}}
+# and anything else as a single line:
+#     {"key": "message_sequence", "value": {...}}
+#
+# Exports are read in chunks of EXPORT_CHUNK records, holding the state lock
+# only while each chunk is being encoded, so an export never holds the whole
+# file in memory. Which records are exported is fixed when the export starts:
+# under one hold of the lock every value that is not a list is encoded and
+# the length of every list is taken, and only that many records of each list
+# are written. Records added while the export runs are left out, so the
+# export never has messages for a channel it does not have, or counters
+# behind its records. Imports are read and checked a line at a time into a
+# separate dict without the state lock, and only replace data once the last
+# line has been read, so a bad line or a dropped upload leaves the workspace
+# as it was. Indexes that can be worked out from the records are left out of
+# the export and built once the records have been imported.
+
+DERIVED_KEYS = ('conversation_messages',)
+EXPORT_CHUNK = 500
+
+# The key each record of these lists must have. Users are at position
+# auth_user_id - 1 of their list, and channels and dms at position id - 1
+# unless they have been removed (their id is then replaced with a message).
+RECORD_IDS = {
+    'users' : 'auth_user_id',
+    'channels' : 'channel_id',
+    'dm' : 'dm_id',
+}
+# The type of each value that is not a list
+VALUE_TYPES = {
+    'message_id_counter' : int,
+    'send_later_count' : int,
+    'message_sequence' : dict,
+    'notifications' : dict,
+    'send_later' : dict,
+    'removals' : dict,
+    'dreams_stats' : dict,
+}
+
+def _check_owner(token):
+    auth_user_id = find_user_id(token)
+    if auth_user_id == False:
+        raise AccessError(description = 'User is not a registered user')
+    if not is_dreams_owner(auth_user_id):
+        raise AccessError(description = 'Only owners of Dreams can import or export the workspace')
+
+def export_lines():
+    """
+    Yields the workspace as ndjson, a chunk of lines at a time, as it was
+    when the export started
+    """
+    data = getData()
+    values = []
+    lists = []
+    with STATE_LOCK:
+        for key, value in data.items():
+            if key in DERIVED_KEYS:
+                continue
+            if isinstance(value, list):
+                lists.append((key, value, len(value)))
+            else:
+                values.append(dumps({'key' : key, 'value' : value}) + '\n')
+    if values:
+        yield ''.join(values)
+
+    for key, records, length in lists:
+        yield dumps({'key' : key, 'list' : True}) + '\n'
+        position = 0
+        while position < length:
+            with STATE_LOCK:
+                chunk = [dumps({'key' : key, 'record' : record}) + '\n'
+                         for record in records[position:min(position + EXPORT_CHUNK, length)]]
+            if not chunk:
+                break
+            position += len(chunk)
+            yield ''.join(chunk)
+
+def read_workspace(lines):
+    """
+    Reads and checks a workspace from ndjson lines without touching data
+
+    Arguments:
+        lines (iterable of str or bytes) - the lines of an export
+
+    Exceptions:
+        InputError - A line is not a valid workspace record
+
+    Return Value:
+        (dict of every top level key read, counts of the records read for each list)
+    """
+    workspace = {}
+    counts = {}
+
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            try:
+                line = line.decode('utf-8')
+            except UnicodeDecodeError:
+                raise InputError(description = f'Line {number} is not a valid workspace record')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = loads(line)
+            key = item['key']
+        except (ValueError, KeyError, TypeError):
+            raise InputError(description = f'Line {number} is not a valid workspace record')
+        if key in DERIVED_KEYS:
+            continue
+
+        if 'record' in item:
+            if not isinstance(workspace.get(key), list):
+                workspace[key] = []
+            record = item['record']
+            if not _valid_record(key, record, len(workspace[key]) + 1):
+                raise InputError(description = f'Line {number} is not a valid workspace record')
+            workspace[key].append(record)
+            counts[key] = counts.get(key, 0) + 1
+        elif item.get('list'):
+            if key in VALUE_TYPES:
+                raise InputError(description = f'Line {number} is not a valid workspace record')
+            workspace[key] = []
+            counts[key] = 0
+        else:
+            if not _valid_value(key, item.get('value')):
+                raise InputError(description = f'Line {number} is not a valid workspace record')
+            workspace[key] = item.get('value')
+    return workspace, counts
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _valid_record(key, record, position):
+    if key in VALUE_TYPES:
+        return False
+    if key == 'messages':
+        return (isinstance(record, dict) and _is_id(record.get('message_id'))
+                and (record.get('channel_id') != None or record.get('dm_id') != None))
+    if key in RECORD_IDS:
+        if not isinstance(record, dict):
+            return False
+        record_id = record.get(RECORD_IDS[key])
+        removed = key != 'users' and isinstance(record_id, str)
+        return record_id == position or removed
+    return True
+
+def _valid_value(key, value):
+    if key in RECORD_IDS or key == 'messages':
+        return False
+    if key in VALUE_TYPES:
+        if not isinstance(value, VALUE_TYPES[key]) or isinstance(value, bool):
+            return False
+        if key == 'removals':
+            # Keyed by u_id as a string, holding how far through it has got
+            return all(u_id.isdigit() and _is_id(done) for u_id, done in value.items())
+    return True
+
+def install_workspace(workspace):
+    """
+    Replaces everything in data with a workspace from read_workspace(),
+    builds the indexes for it and starts the send later timer and message
+    removals it has left to do. The caller must hold the state lock.
+    """
+    data = getData()
+    data.clear()
+    end_all_sessions()
+    reset_versions()
+    for key, value in workspace.items():
+        data[key] = value
+    data['conversation_messages'] = {'channels' : {}, 'dms' : {}}
+    for message in data.get('messages') or []:
+        index_message(message)
+    rebuild_search_index()
+    reschedule()
+    start_removals()
+
+def workspace_export_v1(token):
+    """
+    Exports the whole workspace as ndjson
+
+    Arguments:
+        token (str) - the token of an owner of **Dreams**
+
+    Exceptions:
+        AccessError - The user is not an owner of **Dreams**
+
+    Return Value:
+        generator of ndjson chunks
+    """
+    _check_owner(token)
+    return export_lines()
+
+def workspace_import_v1(token, lines):
+    """
+    Replaces the whole workspace with one read from ndjson
+
+    Arguments:
+        token (str) - the token of an owner of **Dreams**
+        lines (iterable of str or bytes) - the lines of an export
+
+    Exceptions:
+        AccessError - The user is not an owner of **Dreams**
+        InputError - A line is not a valid workspace record
+
+    Return Value:
+        counts (dict) - the number of records imported for each list
+    """
+    with STATE_LOCK:
+        _check_owner(token)
+    # Read without the state lock, as the lines may be coming from a slow
+    # upload. data is only replaced once every line has been read and checked.
+    workspace, counts = read_workspace(lines)
+    with STATE_LOCK:
+        install_workspace(workspace)
+        flush()
+    return {'counts' : counts}
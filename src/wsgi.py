@@ -0,0 +1,57 @@
+import sys
+from src import config
+from src.server import APP, start_timer
+from src.longpoll import start_longpoll
+
+# Production entry point for the server:
+#
+#     python3 -m src.wsgi [threads]
+#
+# Requests are served on a pool of threads by waitress if it is installed,
+# or by werkzeug's threaded server if it is not. Handlers still run one at a
+# time, as each request holds src.persistence.STATE_LOCK from before its
+# handler runs until it returns. What overlaps is everything outside the
+# lock: reading request bodies (done before the lock is taken), writing
+# responses back to slow clients, streamed exports and workspace import
+# uploads and static files.
+#
+# data only lives in the memory of one process, so run a single process with
+# several threads rather than several processes. If more than one process is
+# started on the same database anyway, only the first one runs the send
+# later timer.
+#
+# Long polls of notifications/get and the channel/dm event streams are served
+# on config.port + 1 by src/longpoll.py, so parked requests and open streams
+# do not take up any of these threads.
+
+DEFAULT_THREADS = 8
+
+def serve(threads=DEFAULT_THREADS, port=None):
+    """
+    Starts the send later timer and the long poll server, and serves APP
+    until the process is stopped
+
+    Arguments:
+        threads (int) - number of requests that can be handled at once
+        port (int) - port to listen on, defaults to config.port
+
+    Return Value:
+        None
+    """
+    if port is None:
+        port = config.port
+    start_timer()
+    start_longpoll(port + 1)
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        waitress_serve = None
+
+    if waitress_serve is not None:
+        waitress_serve(APP, host='0.0.0.0', port=port, threads=threads)
+    else:
+        from werkzeug.serving import run_simple
+        run_simple('0.0.0.0', port, APP, threaded=True)
+
+if __name__ == "__main__":
+    serve(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_THREADS)
@@ -0,0 +1,63 @@
+from src.admin import admin_user_remove_v1, remove_messages
+from src.channel import channel_invite_v2, channel_addowner_v1, channel_details_v2
+from src.message import message_send_v2
+from src.message_index import get_message
+from src.data import data
+import src.admin
+import pytest
+from tests.fixture import channel_set_up
+
+"""
+Given a User by their user ID, remove the user from the Dreams.
+Once users are removed from **Dreams**, the contents of the messages they sent will be replaced by 'Removed user'.
+
+Arguments:
+    token (str) - the user's token that is requesting user remove
+    u_id (int) - the user's u_id that is being removed
+
+Exceptions:
+    InputError - u_id does not refer to a valid user
+    InputError - The user is currently the only owner
+    AccessError - The authorised user is not an owner
+
+Return Value:
+    None
+"""
+
+def test_remove_member_and_owner(channel_set_up):
+    # Test that the removed user is no longer a member or owner of the channel
+    token = channel_set_up[0].get('token')
+    channel_id = channel_set_up[2].get('channel_id')
+    u_id = channel_set_up[1].get('auth_user_id')
+    channel_invite_v2(token, channel_id, u_id)
+    channel_addowner_v1(token, channel_id, u_id)
+
+    admin_user_remove_v1(token, u_id)
+
+    details = channel_details_v2(token, channel_id)
+    assert u_id not in [member['u_id'] for member in details['all_members']]
+    assert u_id not in [owner['u_id'] for owner in details['owner_members']]
+
+def test_remove_messages_in_chunks(channel_set_up, monkeypatch):
+    # Test that the removed user's messages are replaced a chunk at a time
+    monkeypatch.setattr(src.admin, 'REMOVAL_CHUNK', 2)
+    monkeypatch.setattr(src.admin, 'start_removals', lambda: None)
+    token = channel_set_up[0].get('token')
+    channel_id = channel_set_up[2].get('channel_id')
+    u_id = channel_set_up[1].get('auth_user_id')
+    channel_invite_v2(token, channel_id, u_id)
+
+    message_ids = [message_send_v2(channel_set_up[1].get('token'), channel_id, str(number))['message_id']
+                   for number in range(5)]
+    kept_id = message_send_v2(token, channel_id, 'kept')['message_id']
+
+    admin_user_remove_v1(token, u_id)
+    assert [get_message(message_id)['message'] for message_id in message_ids[:2]] == ['Removed User'] * 2
+    assert get_message(message_ids[2])['message'] == '2'
+    assert data['removals'] == {str(u_id) : 2}
+
+    assert remove_messages(u_id, 2) == False
+    assert remove_messages(u_id, 2) == True
+    assert [get_message(message_id)['message'] for message_id in message_ids] == ['Removed User'] * 5
+    assert get_message(kept_id)['message'] == 'kept'
+    assert data['removals'] == {}
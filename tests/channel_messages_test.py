@@ -225,4 +225,38 @@ def test_no_messages(channel_set_up):
     channel_check = channel_messages_v2(channel_set_up[0]['token'], channel_set_up[2]['channel_id'], 0)
     assert channel_check['start'] == 0
     assert channel_check['end'] == -1
-    assert len(channel_check['messages']) == 0
\ No newline at end of file
+    assert len(channel_check['messages']) == 0
+
+def test_channel_messages_cursor(channel_set_up):
+    # Test paging through a channel with cursors, with new messages sent
+    # between pages
+    token = channel_set_up[0].get('token')
+    channel_id = channel_set_up[2].get('channel_id')
+
+    for number in range(120):
+        message_send_v2(token, channel_id, str(number))
+
+    first_page = channel_messages_v2(token, channel_id, None, '')
+    assert len(first_page['messages']) == 50
+    assert first_page['messages'][0]['message'] == '119'
+    assert first_page['messages'][-1]['message'] == '70'
+
+    message_send_v2(token, channel_id, 'new message')
+
+    second_page = channel_messages_v2(token, channel_id, None, first_page['next_cursor'])
+    assert second_page['messages'][0]['message'] == '69'
+    assert second_page['messages'][-1]['message'] == '20'
+
+    last_page = channel_messages_v2(token, channel_id, None, second_page['next_cursor'])
+    assert len(last_page['messages']) == 20
+    assert last_page['messages'][-1]['message'] == '0'
+    assert last_page['next_cursor'] == None
+
+def test_channel_messages_bad_cursor(channel_set_up):
+    # Test that an input error is raised for a cursor that is not valid
+    token = channel_set_up[0].get('token')
+    channel_id = channel_set_up[2].get('channel_id')
+    message_send_v2(token, channel_id, 'hello')
+
+    with pytest.raises(InputError):
+        channel_messages_v2(token, channel_id, None, 'not a cursor')
@@ -0,0 +1,41 @@
+from src.auth import auth_register_v2
+from src.dm import dm_list_v1, dm_create_v1, dm_invite_v1, dm_leave_v1, dm_remove_v1
+from src.error import AccessError
+import pytest
+from tests.fixture import auth_set_up
+
+"""
+Returns the list of DMs that the user is a member of
+
+Arguments: 
+    token (str) - the user's token
+
+Exceptions:
+    N/A
+
+Return Value:
+    dms (list of dict) - each dictionary contains types: dm_id, name
+"""
+
+def test_membership_changes(auth_set_up):
+    # Test that the list follows the user being invited, leaving and dms being removed
+    token = auth_set_up[0]['token']
+    user3 = auth_register_v2('spencerreid@testemail.com', 'testpassworhj1245', 'spencer', 'reid')
+    dm1 = dm_create_v1(token, [auth_set_up[1]['auth_user_id']])['dm_id']
+    dm2 = dm_create_v1(token, [auth_set_up[1]['auth_user_id']])['dm_id']
+
+    assert dm_list_v1(user3['token'])['dms'] == []
+    dm_invite_v1(token, dm1, user3['auth_user_id'])
+    dm_invite_v1(token, dm2, user3['auth_user_id'])
+    assert [dm['dm_id'] for dm in dm_list_v1(user3['token'])['dms']] == [dm1, dm2]
+
+    dm_leave_v1(user3['token'], dm1)
+    assert [dm['dm_id'] for dm in dm_list_v1(user3['token'])['dms']] == [dm2]
+
+    dm_remove_v1(token, dm2)
+    assert dm_list_v1(user3['token'])['dms'] == []
+    assert dm_list_v1(token)['dms'] == [{'dm_id' : dm1, 'name' : dm_list_v1(token)['dms'][0]['name']}]
+
+def test_invalid_token(auth_set_up):
+    with pytest.raises(AccessError):
+        dm_list_v1('invalid token')
@@ -0,0 +1,75 @@
+import src.events
+from src.events import publish_message_event, start_position, read_events, membership_changed, membership_version
+import pytest
+
+"""
+Events for the server-sent event streams of a channel or dm
+
+Arguments:
+    kind (str) - 'channel' or 'dm'
+    conversation_id (int) - the channel or dm's id
+    last_event_id (str) - the id of the last event the client was sent
+    seen (int) - the sequence number of the last event sent
+
+Return Value:
+    (chunk of events or None, sequence number of the last of them)
+"""
+
+def message(message_id, text, channel_id=1):
+    return {'message_id' : message_id, 'sender' : 1, 'message' : text, 'channel_id' : channel_id,
+            'time_created' : 0, 'is_pinned' : False, 'reacts' : []}
+
+def event_ids(chunk):
+    return [line[len('id: '):] for line in chunk.split('\n') if line.startswith('id: ')]
+
+def test_new_events():
+    # Test that a listener is sent events published after it connected, in order
+    seen, first = start_position('channel', 101)
+    assert first == ': connected\n\n'
+    assert read_events('channel', 101, seen) == (None, seen)
+
+    publish_message_event(message(1, 'hello', 101), 'new')
+    publish_message_event(message(1, 'hello again', 101), 'edited')
+    chunk, seen = read_events('channel', 101, seen)
+    assert 'event: new' in chunk and 'event: edited' in chunk
+    assert chunk.index('hello"') < chunk.index('hello again')
+
+    # Nothing new since
+    assert read_events('channel', 101, seen) == (None, seen)
+
+def test_reconnect():
+    # Test that a reconnecting listener gets only the events it missed
+    publish_message_event(message(1, 'first', 103), 'new')
+    seen, _ = start_position('channel', 103)
+    publish_message_event(message(2, 'second', 103), 'new')
+    chunk, seen = read_events('channel', 103, seen)
+    last_id = event_ids(chunk)[-1]
+
+    publish_message_event(message(3, 'third', 103), 'new')
+    seen, first = start_position('channel', 103, last_id)
+    assert first == ': connected\n\n'
+    chunk, _ = read_events('channel', 103, seen)
+    assert 'third' in chunk and 'second' not in chunk
+
+def test_slow_listener_reset(monkeypatch):
+    # Test that a listener too far behind is told to reset instead of sent everything
+    monkeypatch.setattr(src.events, 'EVENT_BUFFER', 2)
+    seen, _ = start_position('channel', 104)
+    for message_id in range(5):
+        publish_message_event(message(message_id, str(message_id), 104), 'new')
+    chunk, seen = read_events('channel', 104, seen)
+    assert 'event: reset' in chunk and 'event: new' not in chunk
+    assert seen == 5
+
+def test_old_epoch():
+    # Test that an id from before the server started is told to reset
+    _, first = start_position('channel', 105, 'oldepoch-4')
+    assert 'event: reset' in first
+
+def test_membership_changed():
+    # Test that changes to the members of a conversation are counted for it alone
+    before = membership_version('dm', 106)
+    other = membership_version('dm', 107)
+    membership_changed('dm', 106)
+    assert membership_version('dm', 106) == before + 1
+    assert membership_version('dm', 107) == other
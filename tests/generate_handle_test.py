@@ -0,0 +1,53 @@
+from src.user import user_profile_sethandle_v1
+from src.registry import generate_handle, user_by_email, user_by_handle
+from src.data import data
+import pytest
+from tests.fixture import auth_set_up
+
+"""
+Returns a handle for a new user that no other user has: their first and
+last name in lowercase with anything but letters and numbers removed, cut
+to 20 characters, with the smallest number that makes it unique added to
+the end if it is taken.
+
+Arguments:
+    name_first (str) - the user's first name
+    name_last (str) - the user's last name
+
+Return Value:
+    handle_str (str)
+"""
+
+def test_unique_handle(auth_set_up):
+    # Test that a new name gets its own handle and a taken one gets a number
+    assert generate_handle('Spencer', 'Reid') == 'spencerreid'
+
+    taken = data['users'][0]['handle_str']
+    assert generate_handle(data['users'][0]['f_name'], data['users'][0]['l_name']) == taken + '0'
+
+def test_freed_number(auth_set_up):
+    # Test that a numbered handle given up by its user is given out again
+    # before any higher number
+    first = auth_set_up[0].get('token')
+    second = auth_set_up[1].get('token')
+    user_profile_sethandle_v1(first, 'spencerreid')
+    user_profile_sethandle_v1(second, 'spencerreid0')
+    assert generate_handle('Spencer', 'Reid') == 'spencerreid1'
+
+    user_profile_sethandle_v1(second, 'somethingelse')
+    assert generate_handle('Spencer', 'Reid') == 'spencerreid0'
+
+    # Taken again, so the next number after the highest given out is used
+    user_profile_sethandle_v1(second, 'spencerreid0')
+    assert generate_handle('Spencer', 'Reid') == 'spencerreid1'
+
+def test_long_name():
+    # Test that handles are cut to 20 characters before the number is added
+    assert generate_handle('Abcdefghijklm', 'Nopqrstuvwxyz!') == 'abcdefghijklmnopqrst'
+
+def test_case_insensitive(auth_set_up):
+    # Test that emails and handles are found in any case
+    email = data['users'][0]['email']
+    handle = data['users'][0]['handle_str']
+    assert user_by_email(email.upper()) == data['users'][0]['auth_user_id']
+    assert user_by_handle(handle.upper()) == data['users'][0]['auth_user_id']
@@ -2,11 +2,12 @@ from src.other import clear_v1
 from src.channel import channel_join_v2, channel_invite_v2
 from src.channels import channels_create_v2
 from src.auth import auth_register_v2
-from src.message import message_send_v2
+from src.message import message_send_v2, message_share_v1, message_edit_v2
 from tests.fixture import channel_set_up
 from src.error import AccessError, InputError
 from src.admin import admin_userpermissions_change_v1
 from src.data import data
+from src.message_index import channel_message_index
 from tests.fixture import auth_set_up, channel_set_up, message_set_up
 import pytest
 
@@ -115,9 +116,9 @@ def test_message_diff_channels():
     assert message_id3 == {'message_id' : 3}
 
     for message in data['messages']:
-        check_message1 = message.get('channel_message_index')
-        check_message2 = message.get('channel_message_index')
-        check_message3 = message.get('channel_message_index')
+        check_message1 = channel_message_index(message)
+        check_message2 = channel_message_index(message)
+        check_message3 = channel_message_index(message)
 
     assert check_message1 == 0
     assert check_message2 == 0
@@ -127,4 +128,21 @@ def test_wrong_input(channel_set_up):
     #test for accesserror when invalid user tries to send message
 
     with pytest.raises(AccessError):
-        message_send_v2(123, channel_set_up[2].get('channel_id'), 'hi')
\ No newline at end of file
+        message_send_v2(123, channel_set_up[2].get('channel_id'), 'hi')
+
+def test_shared_message_id(channel_set_up):
+    #test that shared messages get ids from the same counter as sent messages
+
+    token = channel_set_up[0].get('token')
+    channel_id = channel_set_up[2].get('channel_id')
+    message_id1 = message_send_v2(token, channel_id, 'hello')
+    shared_id = message_share_v1(token, message_id1['message_id'], 'look', channel_id, -1)
+    message_id2 = message_send_v2(token, channel_id, 'there')
+
+    assert message_id1 == {'message_id' : 1}
+    assert shared_id == {'shared_message_id' : 2}
+    assert message_id2 == {'message_id' : 3}
+
+    # The shared message can be edited through its id
+    message_edit_v2(token, shared_id['shared_message_id'], 'edited')
+    assert data['messages'][1]['message'] == 'edited'
@@ -0,0 +1,66 @@
+from src.message import message_sendlater_v1, message_send_v2
+from src.scheduler import start_scheduler, schedule
+from src.channel import channel_messages_v2
+from tests.fixture import channel_set_up
+import time
+import pytest
+
+"""
+Send a message from authorised_user to the channel specified by channel_id
+automatically at a specified time in the future
+
+Arguments:
+    token (str) - users unique session id
+    channel_id (int) - the channel's id
+    messsage (str) - the message being sent
+    time_sent (int) - a time in the future
+
+Exceptions:
+    InputError - Channel ID is not a valid channel
+    InputError - Message is more than 1000 characters
+    InputError - Time sent is a time in the past
+    AccessError - the authorised user has not joined the channel they are trying to post to
+
+Return Value:
+    message_id (int) - the message's id
+"""
+
+def test_functionality(channel_set_up):
+    # Test that scheduled messages are sent once they are due, earliest first
+    start_scheduler()
+    token = channel_set_up[0].get('token')
+    channel_id = channel_set_up[2].get('channel_id')
+    now = time.time()
+    message_sendlater_v1(token, channel_id, 'second', now + 1.0)
+    message_sendlater_v1(token, channel_id, 'first', now + 0.5)
+
+    assert channel_messages_v2(token, channel_id, 0)['messages'] == []
+    time.sleep(1.5)
+    messages = channel_messages_v2(token, channel_id, 0)['messages']
+    assert [message['message'] for message in messages] == ['second', 'first']
+
+def test_reserved_id(channel_set_up):
+    # Test that a scheduled message is sent with the id returned when it was scheduled
+    start_scheduler()
+    token = channel_set_up[0].get('token')
+    channel_id = channel_set_up[2].get('channel_id')
+    later_id = message_sendlater_v1(token, channel_id, 'later', time.time() + 0.5)['message_id']
+    now_id = message_send_v2(token, channel_id, 'now')['message_id']
+    assert later_id != now_id
+
+    time.sleep(1.0)
+    messages = channel_messages_v2(token, channel_id, 0)['messages']
+    assert {message['message'] : message['message_id'] for message in messages} == {'later' : later_id, 'now' : now_id}
+
+def test_failed_send(channel_set_up):
+    # Test that a scheduled message that fails to send does not stop later ones
+    start_scheduler()
+    token = channel_set_up[0].get('token')
+    channel_id = channel_set_up[2].get('channel_id')
+    # Missing its message, so sending it raises a KeyError
+    schedule({'token' : token, 'channel_id' : channel_id, 'time_sent' : time.time() + 0.2})
+    message_sendlater_v1(token, channel_id, 'after', time.time() + 0.6)
+
+    time.sleep(1.0)
+    messages = channel_messages_v2(token, channel_id, 0)['messages']
+    assert [message['message'] for message in messages] == ['after']
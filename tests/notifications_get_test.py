@@ -0,0 +1,84 @@
+from src.message import notifications_get_v1, message_send_v2, message_edit_v2
+from src.channels import channels_create_v2
+from src.channel import channel_invite_v2
+from src.data import data
+from tests.fixture import auth_set_up
+import pytest
+
+"""
+Returns the users most recent 20 notifications
+
+Arguments:
+    token (str) - the user's token
+
+Exceptions:
+    N/A
+
+Return Value:
+    notifications (list of dict) - each dictionary contains:
+        - channel_id,
+        - dm_id,
+        - notification_message
+"""
+
+def test_functionality(auth_set_up):
+    # Test that being added to a channel and tagged in it are both notified, most recent first
+    channel_id = channels_create_v2(auth_set_up[0].get('token'), 'testchannel1', True)['channel_id']
+    channel_invite_v2(auth_set_up[0].get('token'), channel_id, auth_set_up[1].get('auth_user_id'))
+    adder = data['users'][auth_set_up[0].get('auth_user_id') - 1]['handle_str']
+    tagged = data['users'][auth_set_up[1].get('auth_user_id') - 1]['handle_str']
+    message_send_v2(auth_set_up[0].get('token'), channel_id, '@' + tagged + ' hello')
+
+    notifications = notifications_get_v1(auth_set_up[1].get('token'))['notifications']
+    assert notifications == [
+        {
+            'channel_id' : channel_id,
+            'dm_id' : -1,
+            'notification_message' : f"{adder} tagged you in testchannel1 : {('@' + tagged + ' hello')[0:20]}",
+        },
+        {
+            'channel_id' : channel_id,
+            'dm_id' : -1,
+            'notification_message' : f"{adder} added you to testchannel1",
+        },
+    ]
+
+def test_only_recent_twenty(auth_set_up):
+    # Test that only the 20 most recent notifications are kept
+    channel_id = channels_create_v2(auth_set_up[0].get('token'), 'testchannel1', True)['channel_id']
+    channel_invite_v2(auth_set_up[0].get('token'), channel_id, auth_set_up[1].get('auth_user_id'))
+    tagged = data['users'][auth_set_up[1].get('auth_user_id') - 1]['handle_str']
+    for i in range(25):
+        message_send_v2(auth_set_up[0].get('token'), channel_id, f"@{tagged} {i}")
+
+    notifications = notifications_get_v1(auth_set_up[1].get('token'))['notifications']
+    assert len(notifications) == 20
+    assert notifications[0]['notification_message'].endswith(f"@{tagged} 24"[0:20])
+    assert notifications[-1]['notification_message'].endswith(f"@{tagged} 5"[0:20])
+
+def test_marker(auth_set_up):
+    # Test that the marker changes only when a new notification arrives
+    token = auth_set_up[1].get('token')
+    marker = notifications_get_v1(token)['marker']
+    assert notifications_get_v1(token)['marker'] == marker
+
+    channel_id = channels_create_v2(auth_set_up[0].get('token'), 'testchannel1', True)['channel_id']
+    channel_invite_v2(auth_set_up[0].get('token'), channel_id, auth_set_up[1].get('auth_user_id'))
+    assert notifications_get_v1(token)['marker'] == marker + 1
+
+def test_edit_tags_only_new(auth_set_up):
+    # Test that editing a message only notifies users who were not tagged before the edit
+    channel_id = channels_create_v2(auth_set_up[0].get('token'), 'testchannel1', True)['channel_id']
+    channel_invite_v2(auth_set_up[0].get('token'), channel_id, auth_set_up[1].get('auth_user_id'))
+    sender = data['users'][auth_set_up[0].get('auth_user_id') - 1]['handle_str']
+    tagged = data['users'][auth_set_up[1].get('auth_user_id') - 1]['handle_str']
+    message_id = message_send_v2(auth_set_up[0].get('token'), channel_id, f"@{tagged} hello")['message_id']
+    before = notifications_get_v1(auth_set_up[1].get('token'))['notifications']
+
+    message_edit_v2(auth_set_up[0].get('token'), message_id, f"@{tagged} hello again")
+    assert notifications_get_v1(auth_set_up[1].get('token'))['notifications'] == before
+
+    message_edit_v2(auth_set_up[0].get('token'), message_id, f"@{tagged} @{sender} hello")
+    assert notifications_get_v1(auth_set_up[1].get('token'))['notifications'] == before
+    notifications = notifications_get_v1(auth_set_up[0].get('token'))['notifications']
+    assert notifications[0]['notification_message'].startswith(f"{sender} tagged you in testchannel1")
@@ -0,0 +1,192 @@
+import json
+import os
+from src.persistence import restore, flush, persist_and_return, is_dirty
+import pytest
+
+"""
+Loads the snapshot and replays the log into data, then starts journalling
+writes to data.
+
+Arguments:
+    data (dict) - the data dict from src.data
+    snapshot_path (str) - path of the snapshot file
+    log_path (str) - path of the log file
+
+Return Value:
+    The WriteAheadLog in use
+"""
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / 'database.json'), str(tmp_path / 'database.log')
+
+def reload(paths):
+    # Replay the files on disk into a fresh dict as if the server restarted
+    fresh = {}
+    wal = restore(fresh, paths[0], paths[1])
+    wal.close()
+    return fresh
+
+def test_functionality(paths):
+    # Test that changes made between flushes survive a restart
+    data = {}
+    wal = restore(data, paths[0], paths[1])
+    data['users'] = [{'auth_user_id' : 1, 'handle_str' : 'kimseeto'}]
+    data['messages'] = []
+    flush()
+    data['messages'].append({'message_id' : 1, 'message' : 'hello', 'reacts' : []})
+    data['messages'][0]['reacts'].append({'react_id' : 1, 'u_ids' : [1]})
+    data['users'][0]['handle_str'] = 'kimseeto0'
+    assert persist_and_return({'message_id' : 1}) == '{"message_id": 1}'
+    wal.close()
+
+    assert reload(paths) == data
+
+def test_append_is_logged_as_one_record(paths):
+    # Test that sending a message only writes the new message to the log
+    data = {}
+    wal = restore(data, paths[0], paths[1])
+    data['messages'] = []
+    flush()
+    for i in range(10):
+        data['messages'].append({'message_id' : i + 1, 'message' : 'hello'})
+    flush()
+    wal.close()
+
+    with open(paths[1]) as file:
+        lines = file.readlines()
+    assert len(lines) == 11
+    assert '"path": ["messages"]' in lines[0]
+    assert '"path": ["messages", 9]' in lines[-1]
+
+def test_removals(paths):
+    # Test that deleting from lists and dicts replays correctly
+    data = {}
+    wal = restore(data, paths[0], paths[1])
+    data['channels'] = [{'channel_id' : 1, 'all_members' : [{'u_id' : 1}, {'u_id' : 2}, {'u_id' : 3}]}]
+    data['added_info'] = {'channels' : [], 'dms' : []}
+    flush()
+    del data['channels'][0]['all_members'][0]
+    data['channels'][0]['all_members'][0]['u_id'] = 5
+    del data['added_info']['dms']
+    flush()
+    wal.close()
+
+    assert reload(paths) == {
+        'channels' : [{'channel_id' : 1, 'all_members' : [{'u_id' : 5}, {'u_id' : 3}]}],
+        'added_info' : {'channels' : []},
+    }
+
+def test_clear(paths):
+    # Test that clearing data is persisted
+    data = {}
+    wal = restore(data, paths[0], paths[1])
+    data['users'] = [{'auth_user_id' : 1}]
+    flush()
+    data.clear()
+    flush()
+    wal.close()
+
+    assert reload(paths) == {}
+
+def test_compaction(paths):
+    # Test that the log is folded into the snapshot once it grows too large
+    data = {}
+    wal = restore(data, paths[0], paths[1], compact_every=5)
+    data['messages'] = []
+    for i in range(12):
+        data['messages'].append({'message_id' : i + 1})
+        flush()
+    wal.close()
+
+    with open(paths[1]) as file:
+        assert len(file.readlines()) < 5
+    assert reload(paths) == data
+
+def test_torn_write(paths):
+    # Test that a partially written last record is ignored on replay
+    data = {}
+    wal = restore(data, paths[0], paths[1])
+    data['messages'] = [{'message_id' : 1}]
+    flush()
+    wal.close()
+    with open(paths[1], 'a') as file:
+        file.write('{"op": "set", "path": ["messa')
+
+    assert reload(paths) == {'messages' : [{'message_id' : 1}]}
+
+def test_read_only_request(paths):
+    # Test that a request which does not change data writes nothing to the log
+    data = {}
+    wal = restore(data, paths[0], paths[1])
+    data['messages'] = [{'message_id' : 1, 'message' : 'hello', 'is_pinned' : False}]
+    flush()
+    records = wal.log_records
+
+    # Reads and writes of a value that is already stored are not changes
+    assert data['messages'][0]['message'] == 'hello'
+    data['messages'][0]['is_pinned'] = False
+    assert not is_dirty()
+    persist_and_return({'messages' : data['messages']})
+    assert wal.log_records == records
+
+    data['messages'][0]['is_pinned'] = True
+    assert is_dirty()
+    persist_and_return({})
+    assert wal.log_records == records + 1
+    wal.close()
+
+def test_reassigned_within_parent(paths):
+    # Test that a value stored again under another key of the same dict is
+    # copied, so later writes to either one replay the same way
+    data = {}
+    wal = restore(data, paths[0], paths[1])
+    data['b'] = {'y' : 2}
+    flush()
+    data['c'] = data['b']
+    flush()
+    data['b']['y'] = 5
+    flush()
+    wal.close()
+
+    assert data == {'b' : {'y' : 5}, 'c' : {'y' : 2}}
+    assert reload(paths) == data
+
+def test_list_shift_is_one_record(paths):
+    # Test that removing and inserting single items logs one record each,
+    # and that changes made before and after they move items replay correctly
+    data = {}
+    wal = restore(data, paths[0], paths[1])
+    data['messages'] = [{'message_id' : i, 'message' : 'hello'} for i in range(100)]
+    flush()
+    records = wal.log_records
+
+    data['messages'][50]['message'] = 'edited before'
+    del data['messages'][10]
+    data['messages'].insert(0, {'message_id' : 100, 'message' : 'first'})
+    data['messages'].pop()
+    data['messages'].remove(data['messages'][5])
+    data['messages'][50]['message'] = 'edited after'
+    flush()
+    wal.close()
+
+    assert wal.log_records - records == 6
+    assert reload(paths) == data
+
+def test_interrupted_compaction(paths):
+    # Test that a compaction stopped after moving the log aside does not
+    # replay the old log on top of the new snapshot
+    data = {}
+    wal = restore(data, paths[0], paths[1])
+    data['messages'] = [{'message_id' : 1}, {'message_id' : 2}]
+    flush()
+    del data['messages'][0]
+    flush()
+    wal.close()
+
+    with open(paths[0] + '.tmp', 'w') as file:
+        file.write(json.dumps(data))
+    os.replace(paths[1], paths[1] + '.old')
+
+    assert reload(paths) == {'messages' : [{'message_id' : 2}]}
+    assert not os.path.exists(paths[1] + '.old')
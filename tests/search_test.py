@@ -0,0 +1,77 @@
+from src.other import search_v2
+from src.message import message_send_v2, message_edit_v2, message_remove_v1
+from src.channel import channel_join_v2
+from src.channels import channels_create_v2
+from src.error import InputError
+from tests.fixture import auth_set_up, channel_set_up
+import pytest
+
+"""
+Given a query string, return a collection of messages in all
+of the channels/DMs that the user has joined that match the query
+
+Arguments:
+    token (str) - the user's token
+    query_str (str) - the string being searched
+
+Return Value:
+    messages (list of dict) - each dictionary contains types:
+        - message_id
+        - u_id, message
+        - time_created
+"""
+
+def test_functionality(channel_set_up):
+    # Test that only messages containing the query are returned
+    token = channel_set_up[0].get('token')
+    channel_id = channel_set_up[2].get('channel_id')
+    message_send_v2(token, channel_id, 'the owl flies at night')
+    message_send_v2(token, channel_id, 'the owl sleeps')
+    message_send_v2(token, channel_id, 'night falls')
+
+    found = search_v2(token, 'owl flies')
+    assert [msg['message'] for msg in found['messages']] == ['the owl flies at night']
+
+def test_partial_words(channel_set_up):
+    # Test that a query matching part of a word, or parts of two words, is found
+    token = channel_set_up[0].get('token')
+    channel_id = channel_set_up[2].get('channel_id')
+    message_send_v2(token, channel_id, 'testing hello world')
+    message_send_v2(token, channel_id, 'goodbye')
+
+    for query in ('tes', 'lo wor', 'ting hel', 'he'):
+        found = search_v2(token, query)
+        assert [msg['message'] for msg in found['messages']] == ['testing hello world']
+
+def test_edited_message(channel_set_up):
+    # Test that a message is found by its new text after an edit and not by its old text
+    token = channel_set_up[0].get('token')
+    channel_id = channel_set_up[2].get('channel_id')
+    message_id = message_send_v2(token, channel_id, 'hello world')['message_id']
+    message_edit_v2(token, message_id, 'goodbye world')
+
+    found = search_v2(token, 'goodbye')
+    assert [msg['message'] for msg in found['messages']] == ['goodbye world']
+    with pytest.raises(InputError):
+        search_v2(token, 'hello')
+
+def test_removed_message(channel_set_up):
+    # Test that a removed message can no longer be found
+    token = channel_set_up[0].get('token')
+    channel_id = channel_set_up[2].get('channel_id')
+    message_id = message_send_v2(token, channel_id, 'secret plans')['message_id']
+    message_remove_v1(token, message_id)
+
+    with pytest.raises(InputError):
+        search_v2(token, 'secret')
+
+def test_other_channels(auth_set_up):
+    # Test that messages in channels the user has not joined are not returned
+    channel1 = channels_create_v2(auth_set_up[0].get('token'), 'testchannel1', True)
+    channel2 = channels_create_v2(auth_set_up[1].get('token'), 'testchannel2', True)
+    channel_join_v2(auth_set_up[1].get('token'), channel1['channel_id'])
+    message_send_v2(auth_set_up[0].get('token'), channel1['channel_id'], 'shared news')
+    message_send_v2(auth_set_up[1].get('token'), channel2['channel_id'], 'private news')
+
+    found = search_v2(auth_set_up[0].get('token'), 'news')
+    assert [msg['message'] for msg in found['messages']] == ['shared news']
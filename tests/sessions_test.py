@@ -0,0 +1,29 @@
+from src.sessions import find_user_id
+from src.auth import auth_logout_v1
+from tests.fixture import auth_set_up
+import pytest
+
+"""
+Returns the u_id of the user the token belongs to, or False if it is
+not a valid token. Same as src.helper.find_user_id, but cached.
+
+Arguments:
+    token (str) - the user's token
+
+Return Value:
+    u_id (int) or False
+"""
+
+def test_functionality(auth_set_up):
+    # Test that a token resolves to the same user when it is cached
+    token = auth_set_up[0].get('token')
+    assert find_user_id(token) == auth_set_up[0].get('auth_user_id')
+    assert find_user_id(token) == auth_set_up[0].get('auth_user_id')
+
+def test_logout(auth_set_up):
+    # Test that a token logged out before it was cached is not valid. Logging
+    # out a cached token is tested through its route in https_tests, as the
+    # route is what drops it from the cache
+    token = auth_set_up[1].get('token')
+    auth_logout_v1(token)
+    assert find_user_id(token) == False
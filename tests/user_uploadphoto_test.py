@@ -0,0 +1,130 @@
+import time
+import threading
+from io import BytesIO
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from PIL import Image
+from src.user import user_profile_uploadphoto_v1, user_profile_uploadphoto_status_v1
+from src.error import AccessError, InputError
+from src.data import data
+import src.photos
+import pytest
+from tests.fixture import auth_set_up
+
+"""
+Given a URL of an image on the internet, crops the image within bounds (x_start, y_start) and (x_end, y_end). Position (0,0) is the top left.
+The image is downloaded and cropped in the background.
+
+Arguments: 
+token (str) - unique session id for the authorised user 
+img_url (str) - url of the image to be uploaded 
+x_start (int) - x coordinate for the start of the crop 
+y_start (int) - y coordinate for the end of the crop 
+x_end (int) - x coordinate for the end of the crop 
+y_end (int) - y coordinate for the end of the crop 
+
+Exceptions:
+    InputError - Image uploaded is not a JPG
+    InputError - the crop bounds are negative or end before they start
+    AccessError - This is not a valid user
+
+Return Value: 
+    job_id (int) - the id of the upload
+"""
+
+def make_jpg(width, height):
+    image = BytesIO()
+    Image.new('RGB', (width, height), (255, 0, 0)).save(image, 'JPEG')
+    return image.getvalue()
+
+class ImageHandler(BaseHTTPRequestHandler):
+    # Serves a 100x80 jpg at /photo.jpg and 404 for everything else
+    image = make_jpg(100, 80)
+
+    def do_GET(self):
+        if self.path != '/photo.jpg':
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(self.image)))
+        self.end_headers()
+        self.wfile.write(self.image)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def image_server():
+    server = HTTPServer(('127.0.0.1', 0), ImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+def wait_for(token, job_id):
+    for _ in range(200):
+        status = user_profile_uploadphoto_status_v1(token, job_id)
+        if status['status'] != 'pending':
+            return status
+        time.sleep(0.05)
+    return status
+
+def test_upload(auth_set_up, image_server, tmp_path, monkeypatch):
+    # Test that the photo is cropped, saved and set as the user's photo
+    monkeypatch.chdir(tmp_path)
+    token = auth_set_up[0]['token']
+    u_id = auth_set_up[0]['auth_user_id']
+    job_id = user_profile_uploadphoto_v1(token, image_server + '/photo.jpg', 10, 10, 60, 40)['job_id']
+
+    assert wait_for(token, job_id) == {'status' : 'done', 'error' : None}
+    url = data['users'][u_id - 1]['profile_img_url']
+    name = url[url.index('static/avatars/'):]
+    assert Image.open(tmp_path / name).size == (50, 30)
+
+    # Each thumbnail fits inside its size
+    for size, thumbnail_url in data['users'][u_id - 1]['profile_img_thumbnails'].items():
+        thumbnail = Image.open(tmp_path / thumbnail_url[thumbnail_url.index('static/avatars/'):])
+        assert max(thumbnail.size) <= int(size)
+
+def test_same_crop_saved_once(auth_set_up, image_server, tmp_path, monkeypatch):
+    # Test that two users uploading the same crop share the same files
+    monkeypatch.chdir(tmp_path)
+    for user in auth_set_up[0:2]:
+        job_id = user_profile_uploadphoto_v1(user['token'], image_server + '/photo.jpg', 0, 0, 20, 20)['job_id']
+        assert wait_for(user['token'], job_id)['status'] == 'done'
+
+    first = data['users'][auth_set_up[0]['auth_user_id'] - 1]
+    second = data['users'][auth_set_up[1]['auth_user_id'] - 1]
+    assert first['profile_img_url'] == second['profile_img_url']
+    assert first['profile_img_thumbnails'] == second['profile_img_thumbnails']
+    assert len(list((tmp_path / 'static' / 'avatars').iterdir())) == 4
+
+def test_bad_url(auth_set_up, image_server):
+    # Test that the job fails if the url does not return 200
+    token = auth_set_up[0]['token']
+    job_id = user_profile_uploadphoto_v1(token, image_server + '/missing.jpg', 0, 0, 10, 10)['job_id']
+    assert wait_for(token, job_id)['status'] == 'failed'
+
+def test_crop_out_of_bounds(auth_set_up, image_server):
+    # Test that the job fails if the crop is bigger than the image
+    token = auth_set_up[0]['token']
+    job_id = user_profile_uploadphoto_v1(token, image_server + '/photo.jpg', 0, 0, 200, 10)['job_id']
+    assert wait_for(token, job_id)['status'] == 'failed'
+
+def test_too_big(auth_set_up, image_server, monkeypatch):
+    # Test that images over the size cap are not downloaded
+    monkeypatch.setattr(src.photos, 'MAX_PHOTO_BYTES', 100)
+    token = auth_set_up[0]['token']
+    job_id = user_profile_uploadphoto_v1(token, image_server + '/photo.jpg', 0, 0, 10, 10)['job_id']
+    assert wait_for(token, job_id) == {'status' : 'failed', 'error' : 'This image is too big'}
+
+def test_invalid_bounds(auth_set_up, image_server):
+    with pytest.raises(InputError):
+        user_profile_uploadphoto_v1(auth_set_up[0]['token'], image_server + '/photo.jpg', 10, 10, 5, 5)
+
+def test_invalid_job(auth_set_up):
+    with pytest.raises(InputError):
+        user_profile_uploadphoto_status_v1(auth_set_up[0]['token'], 123456)
+    with pytest.raises(AccessError):
+        user_profile_uploadphoto_status_v1('invalid token', 1)
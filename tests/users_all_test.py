@@ -1,7 +1,9 @@
 from src.auth import auth_register_v2
 from src.channels import channels_create_v2
 from src.data import getData
-from src.users import users_all_v1
+from src.users import users_all_v1, users_all_encoded
+from src.user import user_profile_setname_v2
+from json import loads
 import pytest
 from src.other import clear_v1
 from src.error import InputError, AccessError
@@ -39,4 +41,32 @@ def test_multiple_users():
 
 def test_no_token():
     with pytest.raises(AccessError):
-        users_all_v1(None)
\ No newline at end of file
+        users_all_v1(None)
+
+def test_paging(auth_set_up):
+    # Test that limit and offset return part of the directory and the total
+    token = auth_set_up[0].get('token')
+    auth_register_v2('thirdemail@gmail.com', '123abc!@#', 'Third', 'User')
+
+    page = users_all_v1(token, 2, 1)
+    assert [user['name_first'] for user in page['users']] == [
+        user['name_first'] for user in users_all_v1(token)['users'][1:3]
+    ]
+    assert page['total'] == 3
+    assert users_all_v1(token, 2, 5)['users'] == []
+
+    with pytest.raises(InputError):
+        users_all_v1(token, -1, 0)
+
+def test_encoded_snapshot(auth_set_up):
+    # Test that the encoded directory is the same as users_all_v1 and is
+    # updated after a user changes their name or someone registers
+    token = auth_set_up[0].get('token')
+    assert loads(users_all_encoded(token)) == users_all_v1(token)
+
+    user_profile_setname_v2(token, 'Changed', 'Name')
+    auth_register_v2('thirdemail@gmail.com', '123abc!@#', 'Third', 'User')
+    encoded = loads(users_all_encoded(token))
+    assert encoded == users_all_v1(token)
+    assert len(encoded['users']) == 3
+    assert 'Changed' in [user['name_first'] for user in encoded['users']]
@@ -2,7 +2,7 @@ from src.auth import auth_register_v2, auth_login_v2, auth_logout_v1
 from src.data import getData
 from src.users import users_stats_v1
 from src.channels import channels_create_v2, channels_listall_v2
-from src.message import message_send_v2, message_senddm_v1
+from src.message import message_send_v2, message_senddm_v1, message_remove_v1
 from src.dm import dm_create_v1
 from src.error import AccessError
 import pytest
@@ -89,4 +89,17 @@ def test_involved_user(auth_set_up):
     assert channels_exist == 3
     assert dms_exist == 1
     assert messages_exist == 3 
-    assert updated_stats['dreams_stats'].get('utilization_rate') == 1.0
\ No newline at end of file
+    assert updated_stats['dreams_stats'].get('utilization_rate') == 1.0
+
+def test_removed_message(channel_set_up):
+    # Check that a removed message no longer counts as an existing message
+
+    message_id = message_send_v2(channel_set_up[0]['token'], channel_set_up[2]['channel_id'], 'hello')
+    message_send_v2(channel_set_up[0]['token'], channel_set_up[2]['channel_id'], 'hello again')
+    message_remove_v1(channel_set_up[0]['token'], message_id['message_id'])
+    users_stats_v1(channel_set_up[0]['token'])
+    message_send_v2(channel_set_up[0]['token'], channel_set_up[2]['channel_id'], 'third')
+
+    stats = users_stats_v1(channel_set_up[0]['token'])
+    messages_exist = stats['dreams_stats'].get('messages_exist')[-1].get('num_messages_exist')
+    assert messages_exist == 2
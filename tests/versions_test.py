@@ -0,0 +1,50 @@
+from src.message import message_send_v2, message_edit_v2, message_pin_v1
+from src.channel import channel_invite_v2
+from src.user import user_profile_setname_v2
+from src.other import clear_v1
+from src.versions import get_version, make_etag
+from tests.fixture import channel_set_up
+import pytest
+
+"""
+Version counters for channels, dms, the user directory and notification
+feeds, used to work out ETags for conditional GETs
+"""
+
+def test_message_changes(channel_set_up):
+    # Test that editing and pinning a message both change its channel's version
+    token = channel_set_up[0].get('token')
+    channel_id = channel_set_up[2].get('channel_id')
+    message_id = message_send_v2(token, channel_id, 'hello')['message_id']
+
+    sent = get_version('channel', channel_id)
+    message_edit_v2(token, message_id, 'hello again')
+    edited = get_version('channel', channel_id)
+    message_pin_v1(token, message_id)
+    pinned = get_version('channel', channel_id)
+
+    assert sent < edited < pinned
+
+def test_member_and_user_changes(channel_set_up):
+    # Test that inviting a user changes the channel's version and their
+    # notification feed's version, and setting a name changes the directory
+    token = channel_set_up[0].get('token')
+    channel_id = channel_set_up[2].get('channel_id')
+    u_id = channel_set_up[1].get('auth_user_id')
+
+    channel_version = get_version('channel', channel_id)
+    feed_version = get_version('notifications', u_id)
+    channel_invite_v2(token, channel_id, u_id)
+    assert get_version('channel', channel_id) > channel_version
+    assert get_version('notifications', u_id) > feed_version
+
+    users_version = get_version('users')
+    user_profile_setname_v2(token, 'New', 'Name')
+    assert get_version('users') > users_version
+
+def test_clear(channel_set_up):
+    # Test that an etag from before a clear never matches one from after it
+    channel_id = channel_set_up[2].get('channel_id')
+    etag = make_etag('channel', channel_id, get_version('channel', channel_id))
+    clear_v1()
+    assert make_etag('channel', channel_id, get_version('channel', channel_id)) != etag
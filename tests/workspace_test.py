@@ -0,0 +1,98 @@
+import src.workspace
+from src.workspace import workspace_export_v1, workspace_import_v1
+from src.message import message_send_v2
+from src.channel import channel_messages_v2
+from src.other import search_v2
+from src.error import AccessError, InputError
+from src.data import data
+from tests.fixture import channel_set_up
+import json
+import pytest
+
+"""
+Exports the whole workspace as ndjson, or replaces the whole workspace with
+one read from ndjson
+
+Arguments:
+    token (str) - the token of an owner of **Dreams**
+    lines (iterable of str or bytes) - the lines of an export
+
+Exceptions:
+    AccessError - The user is not an owner of **Dreams**
+    InputError - A line is not a valid workspace record
+
+Return Value:
+    generator of ndjson chunks / counts of the records imported
+"""
+
+def test_round_trip(channel_set_up):
+    # Test that importing an export gives back the same workspace
+    token = channel_set_up[0].get('token')
+    channel_id = channel_set_up[2].get('channel_id')
+    for i in range(3):
+        message_send_v2(token, channel_id, f'hello {i}')
+    before = json.loads(json.dumps(data))
+    exported = ''.join(workspace_export_v1(token))
+
+    counts = workspace_import_v1(token, exported.splitlines())['counts']
+    assert counts['messages'] == 3
+    assert json.loads(json.dumps(data)) == before
+
+    # The indexes are built from the imported records
+    messages = channel_messages_v2(token, channel_id, 0)['messages']
+    assert [msg['message'] for msg in messages] == ['hello 2', 'hello 1', 'hello 0']
+    assert len(search_v2(token, 'hello')['messages']) == 3
+
+def test_not_owner(channel_set_up):
+    # Test that only owners of Dreams can export the workspace
+    with pytest.raises(AccessError):
+        workspace_export_v1(channel_set_up[1].get('token'))
+
+def test_invalid_line(channel_set_up):
+    # Test that a line that is not a workspace record is rejected
+    with pytest.raises(InputError):
+        workspace_import_v1(channel_set_up[0].get('token'), ['not json'])
+
+def test_invalid_line_keeps_data(channel_set_up):
+    # Test that an import with a bad line part way through leaves the old workspace untouched
+    token = channel_set_up[0].get('token')
+    channel_id = channel_set_up[2].get('channel_id')
+    message_send_v2(token, channel_id, 'hello')
+    before = json.loads(json.dumps(data))
+    exported = ''.join(workspace_export_v1(token)).splitlines()
+
+    lines = exported[:len(exported) // 2] + ['not json'] + exported[len(exported) // 2:]
+    with pytest.raises(InputError):
+        workspace_import_v1(token, lines)
+    assert json.loads(json.dumps(data)) == before
+    messages = channel_messages_v2(token, channel_id, 0)['messages']
+    assert [msg['message'] for msg in messages] == ['hello']
+
+def test_export_snapshot(channel_set_up, monkeypatch):
+    # Test that messages sent while an export is being read are left out of it,
+    # along with the counters they moved on
+    monkeypatch.setattr(src.workspace, 'EXPORT_CHUNK', 1)
+    token = channel_set_up[0].get('token')
+    channel_id = channel_set_up[2].get('channel_id')
+    message_send_v2(token, channel_id, 'hello')
+    lines = workspace_export_v1(token)
+    first = next(lines)
+    message_send_v2(token, channel_id, 'later')
+    records = [json.loads(line) for line in (first + ''.join(lines)).splitlines()]
+
+    messages = [item['record']['message'] for item in records if item['key'] == 'messages' and 'record' in item]
+    assert messages == ['hello']
+    assert [item['value'] for item in records if item['key'] == 'message_id_counter'] == [1]
+
+def test_invalid_record(channel_set_up):
+    # Test that a user, channel or dm record without its id is rejected before
+    # anything is replaced
+    token = channel_set_up[0].get('token')
+    before = json.loads(json.dumps(data))
+    exported = ''.join(workspace_export_v1(token)).splitlines()
+
+    for bad in ('{"key": "users", "record": "not a user"}', '{"key": "channels", "record": {"name": "x"}}',
+                '{"key": "message_id_counter", "value": "1"}'):
+        with pytest.raises(InputError):
+            workspace_import_v1(token, exported + [bad])
+        assert json.loads(json.dumps(data)) == before